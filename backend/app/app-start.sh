@@ -18,7 +18,12 @@ else
     DEFAULT_GUNICORN_CONF=/gunicorn_conf.py
 fi
 export GUNICORN_CONF=${GUNICORN_CONF:-$DEFAULT_GUNICORN_CONF}
-export WORKER_CLASS=${WORKER_CLASS:-"uvicorn.workers.UvicornWorker"}
+if [ "$GUNICORN_PROFILE" = "performance" ]; then
+    DEFAULT_WORKER_CLASS=app.core.uvicorn_worker.PerformanceUvicornWorker
+else
+    DEFAULT_WORKER_CLASS=uvicorn.workers.UvicornWorker
+fi
+export WORKER_CLASS=${WORKER_CLASS:-$DEFAULT_WORKER_CLASS}
 
 # If there's a prestart.sh script in the /app directory or other path specified, run it before starting
 PRE_START_PATH=${PRE_START_PATH:-/app/prestart.sh}
@@ -1,12 +1,12 @@
+import asyncio
 import logging
-import os
-import tempfile
-import uuid
 from typing import Any
 from typing import List
 
 from fastapi import APIRouter, Depends
-from fastapi import HTTPException, UploadFile, Form
+from fastapi import HTTPException, UploadFile, Form, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from redis import asyncio as aioredis
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,16 +16,32 @@ import app.schemas.channel
 from app import models, schemas
 from app import services
 from app.api import deps
-from app.providers import payment_lib
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_cache_headers
+from app.api.idempotency import IdempotentAPIRoute, idempotent
+from app.api.rate_limit import RateLimiter
+from app.api.serialization import compile_serializer, fast_response
+from app.api.sse import event_stream_response
+from app.core.config import settings
+from app.core.contacts import is_phone_hash, is_vcard, normalize_phone_number
+from app.core.events import channel_topic, event_hub, publish_event
+from app.providers.file_uploders import FileUploader, FileTooLargeError, build_object_key
 from app.schemas import channel_users
 from app.schemas.payments import PaymentMethods, ContributionRequest
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentAPIRoute)
 
 logger = logging.getLogger(__name__)
 
+channel_serializer = compile_serializer(schemas.Channel)
+channel_data_serializer = compile_serializer(channel_users.ChannelData)
+participant_serializer = compile_serializer(channel_users.ChannelParticipant)
+
+discovery_rate_limit = RateLimiter("contacts-discover", limit=settings.CONTACT_DISCOVERY_RATE_LIMIT,
+                                   window_seconds=settings.CONTACT_DISCOVERY_RATE_WINDOW_SECONDS)
+
 
 @router.post("", response_model=schemas.Channel)
+@idempotent
 async def create_channel(
         *,
         db: AsyncSession = Depends(deps.get_db),
@@ -34,7 +50,8 @@ async def create_channel(
         current_user: app.models.User = Depends(deps.get_verified_user),
         video: UploadFile | None = None,
         image: UploadFile,
-        s3_uploader=Depends(deps.get_s3_uploader)
+        file_uploader: FileUploader = Depends(deps.get_file_uploader),
+        redis: aioredis.Redis = Depends(deps.get_redis)
 ) -> Any:
     try:
         service_account = await services.user.get_service_account_by_account_no(
@@ -52,31 +69,26 @@ async def create_channel(
         )
         if user_is_owner.scalars().first() is None:
             raise HTTPException(status_code=401, detail="Cannot Create Channels on this account")
-        video_url = None
-        with tempfile.TemporaryDirectory() as temp_dir:
-            file_path = tempfile.mktemp(dir=temp_dir)
-            with open(file_path, "wb") as f:
-                f.write(image.file.read())
-            with open(file_path, 'rb') as f:
-                file_ext = os.path.splitext(image.filename)[1]
-                image_fname = f"assets/images/{uuid.uuid4()}{file_ext}"
-                image_s3_url = await s3_uploader.save_file_async(f, image_fname)
-                image_s3_url = image_s3_url
-                if not image_s3_url:
-                    raise HTTPException(status_code=500, detail="Failed to upload files to S3")
+        # reject oversized media before anything is sent to storage
+        try:
+            FileUploader.check_size(image.file, settings.MAX_IMAGE_UPLOAD_BYTES)
             if video is not None:
-                video_path = tempfile.mktemp(dir=temp_dir)
-                with open(video_path, "wb") as f:
-                    f.write(video.file.read())
-                with open(video_path, 'rb') as f:
-                    # Upload the video to S3 bucket
-                    video_ext = os.path.splitext(video.filename)[1]
-                    video_filename = f"assets/videos/{uuid.uuid4()}{video_ext}"
-                    video_s3_url = await s3_uploader.save_file_async(f, video_filename)
-                    if not video_s3_url:
-                        raise HTTPException(status_code=500, detail="Failed to upload video to S3")
-            else:
-                video_s3_url = None
+                FileUploader.check_size(video.file, settings.MAX_VIDEO_UPLOAD_BYTES)
+        except FileTooLargeError as exc:
+            raise HTTPException(status_code=413, detail=str(exc))
+        # stream image and video concurrently straight from the spooled upload files
+        image_key = build_object_key("assets/images", image.filename)
+        uploads = [file_uploader.save_file_async(image.file, image_key, content_type=image.content_type)]
+        if video is not None:
+            uploads.append(file_uploader.save_file_async(video.file, build_object_key("assets/videos", video.filename),
+                                                         content_type=video.content_type))
+        uploaded_urls = await asyncio.gather(*uploads)
+        image_s3_url = uploaded_urls[0]
+        video_s3_url = uploaded_urls[1] if video is not None else None
+        if not image_s3_url:
+            raise HTTPException(status_code=500, detail="Failed to upload files to S3")
+        if video is not None and not video_s3_url:
+            raise HTTPException(status_code=500, detail="Failed to upload video to S3")
 
         channel = app.models.Channel(
             video_url=video_s3_url,
@@ -98,6 +110,9 @@ async def create_channel(
         )
         db.add(participant)
         await db.commit()
+        await services.channel.cache_channel_summary(redis, channel)
+        await services.channel.add_to_feed(redis, participant)
+        await services.channel.schedule_image_processing(channel, image_key)
         return channel
     except SQLAlchemyError as exc:
         await db.rollback()
@@ -107,38 +122,198 @@ async def create_channel(
         await db.flush()
 
 
+def _max_upload_bytes(media_type: schemas.MediaType) -> int:
+    if media_type == schemas.MediaType.VIDEO:
+        return settings.MAX_VIDEO_UPLOAD_BYTES
+    return settings.MAX_IMAGE_UPLOAD_BYTES
+
+
+@router.post("/media-uploads", response_model=schemas.PresignedUpload)
+async def create_media_upload(
+        data_in: schemas.MediaUploadRequest,
+        current_user: app.models.User = Depends(deps.get_verified_user),
+        file_uploader: FileUploader = Depends(deps.get_file_uploader)
+) -> Any:
+    """
+    Issue a presigned url for uploading channel media straight to storage.
+    Attach the uploaded file to a channel with POST /{channel_no}/media
+    """
+    key = build_object_key("%s/%s" % (data_in.media_type.prefix, current_user.user_id), data_in.file_name)
+    return await file_uploader.create_presigned_upload(
+        key,
+        content_type=data_in.content_type,
+        max_size=_max_upload_bytes(data_in.media_type),
+        expires_in=settings.PRESIGNED_UPLOAD_EXPIRE_SECONDS,
+        method=data_in.method
+    )
+
+
+@router.put("/media-uploads/local/{key:path}", include_in_schema=False)
+async def receive_local_media_upload(
+        key: str,
+        request: Request,
+        expires: int,
+        signature: str,
+        max_size: int | None = None,
+        local_uploader=Depends(deps.get_local_uploader)
+) -> Any:
+    """
+    Upload target for presigned urls issued by the LocalFileUploader
+    """
+    if not local_uploader.verify_signature(key, expires, max_size, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload signature")
+    try:
+        await local_uploader.save_stream_async(request.stream(), key, max_size=max_size)
+    except FileTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    return {"key": key}
+
+
+@router.post("/{channel_no}/media", response_model=schemas.Channel)
+async def complete_media_upload(
+        data_in: schemas.MediaUploadComplete,
+        db: AsyncSession = Depends(deps.get_db),
+        channel: models.Channel = Depends(deps.admin_get_channel),
+        current_user: models.User = Depends(deps.get_current_active_user),
+        file_uploader: FileUploader = Depends(deps.get_file_uploader),
+        redis: aioredis.Redis = Depends(deps.get_redis)
+) -> Any:
+    """
+    Verify a media file uploaded with a presigned url and attach it to the channel
+    """
+    key_prefix = "%s/%s/" % (data_in.media_type.prefix, current_user.user_id)
+    if not data_in.key.startswith(key_prefix) or ".." in data_in.key:
+        raise HTTPException(status_code=400, detail="Invalid upload key")
+    size = await file_uploader.get_stored_file_size(data_in.key)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Uploaded file not found")
+    if size > _max_upload_bytes(data_in.media_type):
+        # presigned PUT urls do not enforce the size limit, the object must not stay in the bucket
+        await file_uploader.delete_file_async(data_in.key)
+        raise HTTPException(status_code=413, detail="Uploaded file is too large")
+    file_url = file_uploader.get_file_url(data_in.key)
+    if data_in.media_type == schemas.MediaType.IMAGE:
+        channel.image_url = file_url
+        # variants are regenerated by the media pipeline for the new image
+        channel.image_hash = None
+        channel.image_variants = None
+    else:
+        channel.video_url = file_url
+    channel.last_edited_by = current_user.user_id
+    try:
+        db.add(channel)
+        await db.commit()
+    except SQLAlchemyError as exc:
+        await db.rollback()
+        logger.error("Encountered exception %s when attaching media to channel %s" % (exc, channel.channel_no))
+        raise HTTPException(status_code=500, detail="Failed to update channel media")
+    finally:
+        await db.flush()
+    await services.channel.cache_channel_summary(redis, channel)
+    if data_in.media_type == schemas.MediaType.IMAGE:
+        await services.channel.schedule_image_processing(channel, data_in.key)
+    return channel
+
+
 @router.get("", response_model=List[schemas.Channel])
 async def list_channels(
+        response: Response,
         db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
         skip: int = 0,
-        limit: int = 100,
+        limit: int = Query(default=100, le=500),
+        cursor: str | None = None,
         current_user: app.models.User = Depends(deps.get_verified_user),
 ) -> Any:
     """
-    Retrieve items.
+    Channels of the current user, most recently joined first. Request the next page with the
+    X-Next-Cursor header value as cursor. Superusers get every channel, paged with skip
     """
-    if services.user.is_superuser(current_user):
+    if await services.user.is_superuser(current_user):
         items = await services.channel.get_multi(db, skip=skip, limit=limit)
-    else:
-        items = await services.channel.get_my_channels(
-            db=db, owner_account_no=current_user.user_id, skip=skip, limit=limit
-        )
+        if settings.FAST_SERIALIZATION:
+            return fast_response(channel_serializer.many(items))
+        return items
+    summaries, next_cursor = await services.channel.get_channel_feed(
+        db=db, redis=redis, user_id=current_user.user_id, cursor=cursor, limit=limit
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if settings.FAST_SERIALIZATION:
+        # summaries are already schemas.Channel dicts
+        return fast_response(summaries, response)
+    return summaries
+
+
+@router.get("/search", response_model=List[schemas.Channel])
+async def search_channels(
+        response: Response,
+        q: str = Query(min_length=1, max_length=100),
+        limit: int = Query(default=20, le=100),
+        cursor: str | None = None,
+        db: AsyncSession = Depends(deps.get_db),
+        current_user: app.models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Search channels by name, title, code and description. Prefix matches and similar spellings are
+    returned best first, request the next page with the X-Next-Cursor header value as cursor
+    """
+    items, next_cursor = await services.channel.search_channels(
+        db=db, user=current_user, query=q, limit=limit, cursor=cursor,
+        is_superuser=await services.user.is_superuser(current_user)
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if settings.FAST_SERIALIZATION:
+        return fast_response(channel_serializer.many(items), response)
     return items
 
 
 @router.get("/{channel_no}", response_model=channel_users.ChannelData)
 async def read_channel(
         *,
+        channel_no: str,
+        request: Request,
+        response: Response,
         db: AsyncSession = Depends(deps.get_db),
-        channel: app.models.Channel = Depends(deps.participant_get_channel),
-        current_user: app.models.User = Depends(deps.get_current_active_user),
+        token: str = Depends(deps.reusable_oauth2),
 ) -> Any:
     """
-    Get item by ID.
+    Get a channel. Send the ETag back in If-None-Match, an unchanged channel is answered with 304
+    from a version lookup without loading it
     """
+    user_id = deps.decode_access_token(token).sub
+    version = await services.channel.get_channel_version(db=db, channel_no=channel_no, user_id=user_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    etag = make_etag("channel", *version)
+    if is_not_modified(request, etag) and services.channel.version_allows_read(version):
+        return not_modified_response(etag)
+    current_user = await deps.get_current_active_user(await deps.get_current_user(db=db, token=token))
+    channel = await deps.participant_get_channel(channel=await deps.get_channel(channel_no=channel_no, db=db),
+                                                 db=db, current_user=current_user)
+    set_cache_headers(response, etag)
+    if settings.FAST_SERIALIZATION:
+        return fast_response(channel_data_serializer(channel), response)
     return channel
 
 
+@router.get("/{channel_no}/events", response_class=StreamingResponse)
+async def stream_channel_events(
+        request: Request,
+        channel: app.models.Channel = Depends(deps.participant_get_channel),
+        db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
+):
+    """
+    Server-sent events for the channel: contribution status changes and participants joining.
+    Reconnect with the Last-Event-ID header to resume
+    """
+    # release the pooled connection, the stream can stay open for a long time
+    await db.close()
+    return event_stream_response(request, event_hub, redis, channel_topic(channel.id))
+
+
 @router.get("/{channel_no}/participants", response_model=List[channel_users.ChannelParticipant])
 async def list_channels_participants(
         channel: app.models.Channel = Depends(deps.participant_get_channel),
@@ -148,10 +323,13 @@ async def list_channels_participants(
         current_user: models.User = Depends(deps.get_current_active_user)
 ):
     participants = channel.participants
+    if settings.FAST_SERIALIZATION:
+        return fast_response(participant_serializer.many(participants))
     return participants
 
 
 @router.post("/{channel_no}/invite-participant", response_model=List[schemas.ChannelInviteOut])
+@idempotent
 async def invite_channel_participant(
         data: schemas.ChannelInviteCreate,
         db: AsyncSession = Depends(deps.get_db),
@@ -169,6 +347,64 @@ async def invite_channel_participant(
     return res
 
 
+@router.post("/{channel_no}/invite-participants/import", response_model=schemas.ContactImportResult)
+async def import_channel_invites(
+        file: UploadFile,
+        db: AsyncSession = Depends(deps.get_db),
+        current_user: app.models.User = Depends(deps.get_current_active_user),
+        channel: app.models.Channel = Depends(deps.admin_get_channel),
+) -> Any:
+    """
+    Invite the contacts of a CSV or vCard file. Numbers already invited, already participating or repeated
+    in the file are skipped, the invites are sent in the background
+    """
+    vcard = is_vcard(file.filename, file.content_type)
+    result = await services.channel.import_contact_invites(db=db, channel_obj=channel, user=current_user,
+                                                           file=file.file, vcard=vcard)
+    if result.invited:
+        await services.channel.schedule_invite_delivery(channel)
+    return result
+
+
+@router.post("/{channel_no}/contacts/discover", response_model=schemas.ContactDiscoveryResult)
+async def discover_channel_contacts(
+        data: schemas.ContactDiscoveryRequest,
+        db: AsyncSession = Depends(deps.get_db),
+        current_user: app.models.User = Depends(deps.get_current_active_user),
+        channel: app.models.Channel = Depends(deps.admin_get_channel),
+        _rate_limit=Depends(discovery_rate_limit),
+) -> Any:
+    """
+    Find which contacts already use ChangaChanga, with their participation and invite state in the channel.
+    Contacts are plain numbers or hex sha256 hashes of E.164 numbers, matches echo the contact as it was sent
+    """
+    if len(data.phone_numbers) + len(data.phone_hashes) > settings.CONTACT_DISCOVERY_MAX_CONTACTS:
+        raise HTTPException(status_code=413,
+                            detail="At most %s contacts per request" % settings.CONTACT_DISCOVERY_MAX_CONTACTS)
+    # username (E.164 without the +) -> number as sent
+    contacts = {}
+    for raw in data.phone_numbers:
+        number = normalize_phone_number(raw, settings.DEFAULT_PHONE_COUNTRY)
+        if number is not None:
+            contacts.setdefault(number[1:], raw)
+    phone_hashes = list({h for h in data.phone_hashes if is_phone_hash(h)})
+    if not contacts and not phone_hashes:
+        return schemas.ContactDiscoveryResult()
+    rows = await services.user.find_by_phone_numbers(db, usernames=list(contacts), phone_hashes=phone_hashes,
+                                                     limit=settings.CONTACT_DISCOVERY_MAX_MATCHES + 1)
+    truncated = len(rows) > settings.CONTACT_DISCOVERY_MAX_MATCHES
+    rows = rows[:settings.CONTACT_DISCOVERY_MAX_MATCHES]
+    participants, invites = await services.channel.get_contact_states(
+        db, channel, [row.user_id for row in rows], ["+%s" % row.username for row in rows])
+    matches = [
+        schemas.DiscoveredContact(contact=contacts.get(row.username, row.phone_hash), user_no=row.user_no,
+                                  is_participant=row.user_id in participants,
+                                  invite_status=invites.get("+%s" % row.username))
+        for row in rows
+    ]
+    return schemas.ContactDiscoveryResult(matches=matches, truncated=truncated)
+
+
 @router.get("/{channel_no}/invites", response_model=List[schemas.ChannelInviteOut])
 async def get_channel_invites(
         channel: app.models.Channel = Depends(deps.admin_get_channel),
@@ -184,6 +420,7 @@ async def get_channel_invites(
 async def join_channel(
         invite_data: app.schemas.channel.InviteCode,
         db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
         current_user: models.User = Depends(deps.get_current_active_user)
 ):
     try:
@@ -219,6 +456,9 @@ async def join_channel(
 
         db.add(new_participant)
         await db.commit()
+        await services.channel.add_to_feed(redis, new_participant)
+        await publish_event(redis, channel_topic(invite.channel_id), "channel.participant_joined",
+                            {"user_id": current_user.user_id, "channel_id": invite.channel_id})
 
         # Retrieve the updated list of channels for the user
         user_channels = await services.channel.get_my_channels(db=db, user_id=current_user.user_id)
@@ -232,36 +472,67 @@ async def join_channel(
         await db.flush()
 
 
-@router.post("/{channel_no}/contribute")
+@router.post("/{channel_no}/leave", status_code=204)
+async def leave_channel(
+        channel: models.Channel = Depends(deps.participant_get_channel),
+        db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
+        current_user: models.User = Depends(deps.get_current_active_user)
+):
+    await services.channel.remove_participant(db=db, channel_obj=channel, user=current_user)
+    await services.channel.remove_from_feed(redis, current_user.user_id, channel.id)
+    await publish_event(redis, channel_topic(channel.id), "channel.participant_left",
+                        {"user_id": current_user.user_id, "channel_id": channel.id})
+    return Response(status_code=204)
+
+
+@router.post("/{channel_no}/contribute", status_code=202, response_model=schemas.PaymentAccepted)
+@idempotent
 async def contribute_to_channel(
         data_in: ContributionRequest,
+        response: Response,
         current_user: models.User = Depends(deps.get_current_active_user),
         channel: models.Channel = Depends(deps.participant_get_channel),
-        payment_gateway: payment_lib.PaymentGatewayClient = Depends(deps.get_payment_gateway),
-        db: AsyncSession = Depends(deps.get_db)
+        db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis)
 ):
+    """
+    Record a contribution and queue it for submission to the payment gateway.
+    Poll the returned status url for the outcome
+    """
     try:
         payment_requests = app.models.PaymentRequest(
             request_status=schemas.PaymentRequestStatuses.INITIATED.value,
             payment_method=data_in.payment_method.value,
             request_payload=data_in.json(),
             channel_id=channel.id,
-            user_id=current_user.user_id
+            user_id=current_user.user_id,
+            created_by=current_user.user_id,
+            last_edited_by=current_user.user_id
         )
         db.add(payment_requests)
         await db.commit()
         await db.refresh(payment_requests)
-        result = await payment_gateway.make_payment(request_id=payment_requests.request_id, req=data_in)
-        payment_requests.payment_request_result = result.json()
-        db.add(payment_requests)
-        await db.commit()
-    except Exception as exc:
+    except SQLAlchemyError as exc:
         await db.rollback()
         raise HTTPException(status_code=500, detail="Could not complete payment %s" % exc)
     finally:
         await db.flush()
-
-    return payment_requests
+    status = services.payment.status_of(payment_requests)
+    await services.payment.cache_status(redis, status)
+    await services.payment.publish_status(redis, status)
+    try:
+        await services.payment.enqueue_submission(payment_requests)
+    except Exception as exc:
+        logger.error("Could not queue payment request %s: %s" % (payment_requests.request_id, exc))
+        raise HTTPException(status_code=503, detail="Unable to process payment at the moment")
+    status_url = "%s/payments/%s" % (settings.API_V1_STR, payment_requests.request_id)
+    response.headers["Location"] = status_url
+    return schemas.PaymentAccepted(
+        request_id=payment_requests.request_id,
+        request_status=payment_requests.request_status,
+        status_url=status_url
+    )
 
 
 # @router.put("/{id}", response_model=schemas.Item)
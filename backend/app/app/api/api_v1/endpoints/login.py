@@ -11,7 +11,6 @@ from app.api import deps
 from app.core import security
 from app.core.config import settings
 from app.core.security import get_password_hash_async
-from app.providers.messaging_provider import SmsProvider
 
 router = APIRouter()
 
@@ -79,8 +78,7 @@ async def reset_password(phone_number: str = Body(...),
 @router.post("/send-verification-code", response_model=schemas.OtpVerificationResponse)
 async def send_phone_verification_code(data_in: schemas.PhoneVerificationRequest,
                                        db: AsyncSession = Depends(deps.get_db),
-                                       apiKey: str = Depends(deps.get_api_key),
-                                       sms_app: SmsProvider = Depends(deps.get_sms_app)) -> Any:
+                                       apiKey: str = Depends(deps.get_api_key)) -> Any:
     """
     Sends the user phone verification code.
     """
@@ -91,7 +89,7 @@ async def send_phone_verification_code(data_in: schemas.PhoneVerificationRequest
             status_code=404,
             detail="The user with this username does not exist in the system.",
         )
-    await services.user.send_activation_code(db=db, user=user, sms_app=sms_app,
+    await services.user.send_activation_code(db=db, user=user,
                                              expiry_in_seconds=settings.VERICATION_CODE_EXPIRE_SECONDS)
     return schemas.OtpVerificationResponse(
         status=201,
@@ -149,8 +147,7 @@ async def verify_user_phone(data_in: schemas.PhoneVerificationCode,
 @router.post("/forget-password", response_model=schemas.OtpVerificationResponse)
 async def forget_password(req: schemas.ResetPasswordRequest,
                           db: AsyncSession = Depends(deps.get_db),
-                          apiKey: str = Depends(deps.get_api_key),
-                          sms_app: SmsProvider = Depends(deps.get_sms_app)) -> Any:
+                          apiKey: str = Depends(deps.get_api_key)) -> Any:
     """
     Sends otp to user via SMS or Email for password reset
     """
@@ -161,7 +158,7 @@ async def forget_password(req: schemas.ResetPasswordRequest,
             status_code=404,
             detail="The user with this username does not exist in the system.",
         )
-    await services.user.send_otp(db=db, user=user, sms_app=sms_app)
+    await services.user.send_otp(db=db, user=user)
     return schemas.OtpVerificationResponse(
         status=201,
         message=schemas.OtpVerificationStatus.SUCCESS,
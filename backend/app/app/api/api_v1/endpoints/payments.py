@@ -1,10 +1,17 @@
 import logging
 
 from fastapi import APIRouter, Depends
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import app.models
+from app import services, schemas
 from app.api import deps
+from app.api.sse import event_stream_response
+from app.core.events import event_hub, payment_topic
 
 router = APIRouter()
 
@@ -16,7 +23,59 @@ async def mpesa_express_checkout_callback(
         *,
         apiKey: str = Depends(deps.get_api_key),
         data: dict,
+        redis: aioredis.Redis = Depends(deps.get_redis),
+):
+    """
+    Acknowledge an M-Pesa express callback. Callbacks are deduplicated and queued,
+    the payment requests are updated in batches by a celery consumer
+    """
+    # payment_lib loads httpx, import it with the first callback rather than at worker boot
+    from app.providers.payment_lib import parse_stk_push_callback
+    try:
+        callback = parse_stk_push_callback(data)
+    except (ValueError, ValidationError) as exc:
+        raise HTTPException(400, detail="Invalid callback payload %s" % exc)
+    try:
+        await services.payment.enqueue_callback(redis, callback)
+    except services.DuplicateCallbackError:
+        return {"ResultCode": 0, "ResultDesc": "Duplicate callback ignored"}
+    except Exception as exc:
+        logger.error("Could not queue payment callback %s: %s" % (callback.transaction_id, exc))
+        raise HTTPException(503, detail="Unable to accept callback")
+    return {"ResultCode": 0, "ResultDesc": "Accepted"}
+
+
+@router.get("/{request_id}", response_model=schemas.PaymentStatus, response_model_exclude={"user_id"})
+async def get_payment_status(
+        request_id: str,
+        db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
+        current_user: app.models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Status of a contribution, served from the status cache
+    """
+    status = await services.payment.get_status(db=db, redis=redis, request_id=request_id)
+    if status is None or status.user_id != current_user.user_id:
+        raise HTTPException(404, detail="Payment request not found")
+    return status
+
+
+@router.get("/{request_id}/events", response_class=StreamingResponse)
+async def stream_payment_events(
+        request: Request,
+        request_id: str,
         db: AsyncSession = Depends(deps.get_db),
+        redis: aioredis.Redis = Depends(deps.get_redis),
+        current_user: app.models.User = Depends(deps.get_current_active_user),
 ):
-    print("received data %s" % data)
-    raise HTTPException(500, detail="Method not implemented")
+    """
+    Server-sent events with the status changes of a contribution, replaces polling the status url.
+    Reconnect with the Last-Event-ID header to resume
+    """
+    status = await services.payment.get_status(db=db, redis=redis, request_id=request_id)
+    if status is None or status.user_id != current_user.user_id:
+        raise HTTPException(404, detail="Payment request not found")
+    # release the pooled connection, the stream can stay open for a long time
+    await db.close()
+    return event_stream_response(request, event_hub, redis, payment_topic(request_id))
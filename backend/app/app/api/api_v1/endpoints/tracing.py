@@ -0,0 +1,40 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from redis import asyncio as aioredis
+
+import app.models
+from app import schemas
+from app.api import deps
+from app.core.tracing import SAMPLING_OVERRIDES_KEY, trace_sampler
+
+router = APIRouter()
+
+
+@router.get("/sampling", response_model=schemas.TraceSampling)
+async def read_trace_sampling(
+        current_user: app.models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Trace sampling in effect in this process
+    """
+    return trace_sampler.config
+
+
+@router.put("/sampling", response_model=schemas.TraceSampling)
+async def update_trace_sampling(
+        overrides: schemas.TraceSamplingOverrides,
+        redis: aioredis.Redis = Depends(deps.get_redis),
+        current_user: app.models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Override trace sampling settings for every API and celery process, other processes pick the change up
+    within SENTRY_SAMPLING_REFRESH_SECONDS. Send an empty object to go back to the configured settings
+    """
+    values = overrides.dict(exclude_none=True)
+    if values:
+        await redis.set(SAMPLING_OVERRIDES_KEY, overrides.json(exclude_none=True))
+    else:
+        await redis.delete(SAMPLING_OVERRIDES_KEY)
+    trace_sampler.apply_overrides(values)
+    return trace_sampler.config
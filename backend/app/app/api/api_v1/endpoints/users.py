@@ -1,6 +1,6 @@
 from typing import Any, List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -8,8 +8,16 @@ import app.models
 import app.models.accounts
 from app import services, schemas
 from app.api import deps
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_cache_headers
+from app.api.idempotency import IdempotentAPIRoute, idempotent
+from app.api.serialization import compile_serializer, fast_response
+from app.core.config import settings
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentAPIRoute)
+
+user_serializer = compile_serializer(schemas.User)
+# evaluate_accounts_column only materialises the association proxy, which the serializer iterates anyway
+user_account_serializer = compile_serializer(schemas.UserAccount, bypass_validators=(schemas.UserAccount,))
 
 
 @router.get("", response_model=List[schemas.User])
@@ -23,16 +31,18 @@ async def read_users(
     Retrieve users.
     """
     users = await services.user.get_multi(db, skip=skip, limit=limit)
+    if settings.FAST_SERIALIZATION:
+        return fast_response(user_serializer.many(users))
     return users
 
 
 @router.post("", response_model=schemas.User)
+@idempotent
 async def create_user(
         *,
         db: AsyncSession = Depends(deps.get_db),
         user_in: schemas.UserCreate,
         api_key: app.models.User = Depends(deps.get_api_key),
-        sms_app=Depends(deps.get_sms_app)
 ) -> Any:
     """
     Create new user.
@@ -45,7 +55,7 @@ async def create_user(
         )
     try:
         user = await services.user.create_async(db, obj_in=user_in)
-        await services.user.send_activation_code(db, user=user, sms_app=sms_app, expiry_in_seconds=60*5)
+        await services.user.send_activation_code(db, user=user, expiry_in_seconds=60*5)
     except Exception as exc:
         await db.rollback()
         raise
@@ -71,23 +81,43 @@ async def update_user_primary_info(
 
 @router.get("/me", response_model=schemas.UserAccount)
 async def read_user(
+        request: Request,
+        response: Response,
         db: AsyncSession = Depends(deps.get_db),
-        current_user: app.models.User = Depends(deps.get_current_active_user),
+        token: str = Depends(deps.reusable_oauth2),
 ) -> Any:
     """
-    Get current user.
+    Get current user. Supports If-None-Match, answered with 304 from a version lookup
     """
+    user_id = deps.decode_access_token(token).sub
+    version = await services.user.get_profile_version(db, user_id=user_id)
+    etag = make_etag("user", user_id, *version) if version is not None else None
+    if etag is not None and version[0] > 1 and is_not_modified(request, etag):
+        return not_modified_response(etag)
+    current_user = await deps.get_current_active_user(await deps.get_current_user(db=db, token=token))
+    set_cache_headers(response, etag)
+    if settings.FAST_SERIALIZATION:
+        return fast_response(user_account_serializer(current_user), response)
     return current_user
 
 
 @router.get("/me/kyc", response_model=schemas.KycProfile)
-async def get_kyc_details(db: AsyncSession = Depends(deps.get_db),
-                          current_user: app.models.User = Depends(deps.get_current_active_user)):
+async def get_kyc_details(request: Request,
+                          response: Response,
+                          db: AsyncSession = Depends(deps.get_db),
+                          token: str = Depends(deps.reusable_oauth2)):
+    user_id = deps.decode_access_token(token).sub
+    version = await services.user.get_kyc_version(db, user_id=user_id)
+    etag = make_etag("kyc", user_id, *version) if version is not None else None
+    if etag is not None and version[0] > 1 and is_not_modified(request, etag):
+        return not_modified_response(etag)
+    current_user = await deps.get_current_active_user(await deps.get_current_user(db=db, token=token))
     stmt = select(app.models.AccountKycProfile).join(app.models.ServiceAccount).where(
         app.models.ServiceAccount.account_no == current_user.account_no
     )
     res = await db.execute(stmt)
     kyc_profile = res.scalars().first()
+    set_cache_headers(response, etag)
     return kyc_profile
 
 
@@ -0,0 +1,46 @@
+import hashlib
+
+from fastapi import Request, Response
+
+__all__ = ['make_etag', 'is_not_modified', 'not_modified_response', 'set_cache_headers', 'PRIVATE_REVALIDATE']
+
+# responses are per user, let clients keep them but revalidate on every use
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """
+    Weak ETag over the version parts of a resource e.g. its id and last_edited_date_utc
+    """
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:27]
+    return 'W/"%s"' % digest
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Weak comparison of If-None-Match against etag
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == tag for candidate in if_none_match.split(","))
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str = PRIVATE_REVALIDATE):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Authorization"
+
+
+def not_modified_response(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    response = Response(status_code=304)
+    set_cache_headers(response, etag, cache_control)
+    return response
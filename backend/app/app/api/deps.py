@@ -1,46 +1,44 @@
-from typing import Generator
+from typing import TYPE_CHECKING, Generator
 
 import jwt
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.api_key import APIKeyQuery, APIKeyCookie, APIKeyHeader
 from pydantic import ValidationError
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status as http_status
 
 import app.models.accounts
 from app import services
-from app.core import security
-from app.core.config import settings, SmsProviders, KycProviders
+from app.core.cache import get_redis as get_redis_client
+from app.core.config import settings
+from app.core.keyring import api_keys, keyring
 from app.db.session import async_session
-from app.providers.file_uploders import S3FileUploader
-from app.providers.kyc_providers import KycProviderBase, IprsKycProvider, MockKycProvider
-from app.providers.messaging_provider import MockSmsProvider, SmsProvider, AfrikasTalkingSms, WhatsAppProvider, \
-    BongaSmsProvider
-from app.providers.payment_lib import KcbPaymentGatewayClient, PaymentGatewayClient
+from app.providers.file_uploders import FileUploader, LocalFileUploader
+from app.providers.registry import providers
 from app.schemas import TokenPayload
 
+if TYPE_CHECKING:
+    from app.providers.kyc_providers import KycProviderBase
+    from app.providers.messaging_provider import SmsProvider
+    from app.providers.payment_lib import PaymentGatewayClient
+
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
 
-async def get_sms_app() -> SmsProvider:
-    if settings.SMS_PROVIDER == SmsProviders.AT:
-        provider = AfrikasTalkingSms.GET_INSTANCE()
-    elif settings.SMS_PROVIDER == SmsProviders.WA:
-        provider = WhatsAppProvider.GET_INSTANCE()
-    elif settings.SMS_PROVIDER == SmsProviders.BONGA:
-        provider = BongaSmsProvider.GET_INSTANCE()
-    else:
-        provider = MockSmsProvider()
-    return provider
+async def get_sms_app() -> "SmsProvider":
+    return providers.get("sms")
+
+
+async def get_kyc_app() -> "KycProviderBase":
+    return providers.get("kyc")
 
 
-async def get_kyc_app() -> KycProviderBase:
-    if settings.KYC_PROVIDER == KycProviders.IPRS:
-        return IprsKycProvider.GET_INSTANCE()
-    return MockKycProvider()
+async def get_redis() -> aioredis.Redis:
+    return get_redis_client()
 
 
 async def get_db() -> Generator:
@@ -51,14 +49,10 @@ async def get_db() -> Generator:
         await db.close()
 
 
-async def get_current_user(
-        db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> app.models.User:
+def decode_access_token(token: str) -> TokenPayload:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
+        payload = keyring.decode(token)
+        return TokenPayload(**payload)
     except jwt.ExpiredSignatureError:
         # The token has expired
         raise jwt.InvalidTokenError('Token has expired')
@@ -68,6 +62,12 @@ async def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+
+
+async def get_current_user(
+        db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> app.models.User:
+    token_data = decode_access_token(token)
     user = await services.user.get(db, id=token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -129,14 +129,18 @@ async def admin_get_channel(channel: app.models.Channel = Depends(participant_ge
     return channel
 
 
-async def get_s3_uploader() -> S3FileUploader:
-    bucket_name: str = settings.S3_BUCKET_NAME
-    access_key_id: str = settings.S3_ACCESS_KEY_ID
-    secret_access_key: str = settings.S3_SECRET_ACCESS_KEY
-    region_name: str = settings.S3_REGION_NAME
-    if any(param is None for param in [bucket_name, access_key_id, secret_access_key, region_name]):
+async def get_file_uploader() -> FileUploader:
+    uploader = providers.get("file_uploader")
+    if uploader is None:
         raise HTTPException(status_code=500, detail="Invalid S3 uploader parameters")
-    return S3FileUploader(bucket_name, access_key_id, secret_access_key, region_name)
+    return uploader
+
+
+async def get_local_uploader() -> LocalFileUploader:
+    uploader = providers.get("file_uploader")
+    if not isinstance(uploader, LocalFileUploader):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return uploader
 
 
 API_KEY_NAME = settings.API_KEY_NAME
@@ -147,7 +151,7 @@ api_key_cookie = APIKeyCookie(name=API_KEY_NAME, auto_error=False)
 
 
 def validate_api_key(api_key: str):
-    return api_key in settings.API_KEY.split(",")
+    return api_keys.validate(api_key)
 
 
 async def get_api_key(
@@ -167,8 +171,5 @@ async def get_api_key(
         )
 
 
-async def get_payment_gateway() -> KcbPaymentGatewayClient:
-    client = KcbPaymentGatewayClient.get_instance(client_id=settings.KCB_CLIENT_ID,
-                                                  client_secret=settings.KCB_CLIENT_SECRET,
-                                                  server_host=settings.SERVER_HOST)
-    return client
+async def get_payment_gateway() -> "PaymentGatewayClient":
+    return providers.get("payment_gateway")
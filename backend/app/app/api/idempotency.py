@@ -0,0 +1,162 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import uuid
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse
+
+from app.core.cache import get_redis
+from app.core.config import settings
+
+__all__ = ['idempotent', 'IdempotentAPIRoute', 'IDEMPOTENCY_HEADER']
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+RECORD_KEY = "idempotency:%s:%s"
+LOCK_KEY = "idempotency-lock:%s:%s"
+REPLAYED_RESPONSE_HEADERS = ("content-type", "location", "etag")
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def idempotent(endpoint: Callable) -> Callable:
+    """
+    Marks an endpoint as honouring the Idempotency-Key header. The router must use IdempotentAPIRoute
+    and the decorator must sit below the router decorator
+    """
+    endpoint.__idempotent__ = True
+    return endpoint
+
+
+def _principal(request: Request) -> str:
+    credentials = request.headers.get("authorization") or request.headers.get(settings.API_KEY_NAME) or ""
+    return hashlib.sha256(credentials.encode()).hexdigest()[:32]
+
+
+async def _fingerprint(request: Request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(str(sorted(request.query_params.multi_items())).encode())
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/"):
+        # the boundary differs between retries, hash the parsed fields instead of the raw body.
+        # The parsed form is cached on the request and reused by the endpoint
+        form = await request.form()
+        for name, value in form.multi_items():
+            digest.update(name.encode())
+            if isinstance(value, UploadFile):
+                digest.update((value.filename or "").encode())
+                digest.update((value.content_type or "").encode())
+                await _hash_file(digest, value)
+            else:
+                digest.update(value.encode())
+    else:
+        digest.update(await request.body())
+    return digest.hexdigest()
+
+
+async def _hash_file(digest, file: UploadFile):
+    # uploads are spooled to disk by the form parser, they are read back in chunks off the event loop
+    while True:
+        chunk = await file.read(FINGERPRINT_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    await file.seek(0)
+
+
+def _serialize_response(fingerprint: str, response: Response) -> str:
+    headers = {k: v for k, v in response.headers.items() if k.lower() in REPLAYED_RESPONSE_HEADERS}
+    return json.dumps({
+        "fingerprint": fingerprint,
+        "status_code": response.status_code,
+        "headers": headers,
+        "body": base64.b64encode(response.body).decode(),
+    })
+
+
+def _replay_response(record: dict) -> Response:
+    headers = dict(record["headers"])
+    headers[REPLAYED_HEADER] = "true"
+    return Response(content=base64.b64decode(record["body"]), status_code=record["status_code"], headers=headers)
+
+
+class IdempotentAPIRoute(APIRoute):
+    """
+    Route class that stores the response of endpoints marked with @idempotent in redis under the
+    client's Idempotency-Key and replays it for retries of the same request.
+    Concurrent duplicates are serialised with a short lock, a key reused with a different request is rejected
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not getattr(self.endpoint, "__idempotent__", False):
+            return handler
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return await handler(request)
+            if len(key) > 255:
+                return JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)
+            redis = get_redis()
+            scope = _principal(request)
+            record_key = RECORD_KEY % (scope, key)
+            lock_key = LOCK_KEY % (scope, key)
+            fingerprint = await _fingerprint(request)
+
+            replay = await self._stored_response(redis, record_key, fingerprint)
+            if replay is not None:
+                return replay
+            token = uuid.uuid4().hex
+            waited = 0.0
+            while not await redis.set(lock_key, token, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+                # a duplicate is in flight, wait briefly for its response
+                if waited >= settings.IDEMPOTENCY_LOCK_WAIT_SECONDS:
+                    return JSONResponse({"detail": "A request with this Idempotency-Key is in progress"},
+                                        status_code=409)
+                await asyncio.sleep(0.1)
+                waited += 0.1
+                replay = await self._stored_response(redis, record_key, fingerprint)
+                if replay is not None:
+                    return replay
+            try:
+                replay = await self._stored_response(redis, record_key, fingerprint)
+                if replay is not None:
+                    return replay
+                response = await handler(request)
+                # server errors are not stored so the client can retry them
+                if response.status_code < 500 and hasattr(response, "body"):
+                    await redis.set(record_key, _serialize_response(fingerprint, response),
+                                    ex=settings.IDEMPOTENCY_TTL_SECONDS)
+                return response
+            finally:
+                await redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        return idempotent_handler
+
+    @staticmethod
+    async def _stored_response(redis, record_key: str, fingerprint: str) -> Optional[Response]:
+        raw = await redis.get(record_key)
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        if record["fingerprint"] != fingerprint:
+            return JSONResponse({"detail": "Idempotency-Key was already used for a different request"},
+                                status_code=422)
+        return _replay_response(record)
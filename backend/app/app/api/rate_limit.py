@@ -0,0 +1,47 @@
+import logging
+
+from fastapi import Depends, HTTPException
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+import app.models
+from app.api import deps
+
+__all__ = ['RateLimiter']
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = "ratelimit:%s:%s"
+
+_HIT_SCRIPT = """
+local count = redis.call('incr', KEYS[1])
+if count == 1 then
+    redis.call('expire', KEYS[1], ARGV[1])
+end
+return {count, redis.call('ttl', KEYS[1])}
+"""
+
+
+class RateLimiter(object):
+    """
+    Fixed window request limit per user, used as a route dependency:
+    Depends(RateLimiter("contacts-discover", limit=10, window_seconds=3600)).
+    Requests are let through when redis is unavailable
+    """
+
+    def __init__(self, name: str, limit: int, window_seconds: int):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    async def __call__(self, redis: aioredis.Redis = Depends(deps.get_redis),
+                       current_user: app.models.User = Depends(deps.get_current_active_user)):
+        key = RATE_LIMIT_KEY % (self.name, current_user.user_id)
+        try:
+            count, ttl = await redis.eval(_HIT_SCRIPT, 1, key, self.window_seconds)
+        except RedisError as exc:
+            logger.error("Rate limit check %s failed: %s" % (self.name, exc))
+            return
+        if count > self.limit:
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(max(ttl, 1))})
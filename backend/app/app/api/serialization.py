@@ -0,0 +1,88 @@
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional, Type
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON, SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_TUPLE_ELLIPSIS, \
+    ModelField
+
+__all__ = ['CompiledSerializer', 'compile_serializer', 'fast_response']
+
+_SEQUENCE_SHAPES = (SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_TUPLE_ELLIPSIS)
+
+
+def _has_validators(schema: Type[BaseModel]) -> bool:
+    return bool(schema.__validators__ or schema.__pre_root_validators__ or schema.__post_root_validators__)
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class CompiledSerializer(object):
+    """
+    Turns ORM objects into the dict a pydantic response model would render, without validating them.
+    Field access and nested models are resolved once per schema so serializing a row is a loop of getattr calls.
+
+    Only use it where the ORM rows already satisfy the schema. Validators are honoured by falling back to
+    from_orm for schemas that declare them, unless the schema is listed in bypass_validators
+    """
+
+    def __init__(self, schema: Type[BaseModel], bypass_validators: tuple = ()):
+        self.schema = schema
+        self._fields = []
+        if _has_validators(schema) and schema not in bypass_validators:
+            self._fallback = lambda obj: schema.from_orm(obj).dict(by_alias=True)
+            return
+        self._fallback = None
+        for name, field in schema.__fields__.items():
+            self._fields.append((field.alias, name, self._converter(field, bypass_validators)))
+
+    @staticmethod
+    def _converter(field: ModelField, bypass_validators: tuple) -> Optional[Callable[[Any], Any]]:
+        type_ = field.type_
+        if field.shape in _SEQUENCE_SHAPES and field.sub_fields:
+            # List[Optional[Model]] keeps the Optional on the field, the item field has the model
+            type_ = field.sub_fields[0].type_
+        if isinstance(type_, type) and issubclass(type_, BaseModel):
+            nested = compile_serializer(type_, bypass_validators)
+            if field.shape == SHAPE_SINGLETON:
+                return lambda v: None if v is None else nested(v)
+            if field.shape in _SEQUENCE_SHAPES:
+                return lambda v: None if v is None else [None if i is None else nested(i) for i in v]
+        if type_ is date and field.shape == SHAPE_SINGLETON:
+            # pydantic truncates datetime columns rendered as date
+            return _to_date
+        return None
+
+    def __call__(self, obj) -> dict:
+        if self._fallback is not None:
+            return self._fallback(obj)
+        out = {}
+        for alias, name, converter in self._fields:
+            value = getattr(obj, name, None)
+            out[alias] = value if converter is None else converter(value)
+        return out
+
+    def many(self, objs: Iterable) -> List[dict]:
+        return [self(obj) for obj in objs]
+
+
+@lru_cache()
+def compile_serializer(schema: Type[BaseModel], bypass_validators: tuple = ()) -> CompiledSerializer:
+    return CompiledSerializer(schema, bypass_validators)
+
+
+def fast_response(content: Any, response: Optional[Response] = None, status_code: int = 200) -> ORJSONResponse:
+    """
+    ORJSONResponse carrying over headers set on the endpoint's injected Response, which FastAPI drops
+    when an endpoint returns a response object itself
+    """
+    fast = ORJSONResponse(content, status_code=status_code)
+    if response is not None:
+        for key, value in response.headers.items():
+            if key.lower() not in ("content-length", "content-type"):
+                fast.headers[key] = value
+    return fast
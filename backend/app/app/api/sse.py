@@ -0,0 +1,62 @@
+import asyncio
+import re
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from redis import asyncio as aioredis
+from starlette.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.events import EVENT_LOG_KEY, EVENT_LOG_MAXLEN, EventHub, compare_event_ids
+
+__all__ = ['event_stream_response']
+
+EVENT_ID_PATTERN = re.compile(r"^\d+-\d+$")
+# how long a disconnected client waits before reconnecting, in milliseconds
+RECONNECT_MILLISECONDS = 3000
+
+
+def format_event(event_id: str, event: str, data: str) -> str:
+    return "id: %s\nevent: %s\ndata: %s\n\n" % (event_id, event, data)
+
+
+async def _event_stream(request: Request, hub: EventHub, redis: aioredis.Redis, topic: str,
+                        last_event_id: Optional[str]) -> AsyncIterator[str]:
+    # subscribe before reading the backlog so nothing published in between is missed
+    subscription = hub.subscribe(topic)
+    try:
+        yield "retry: %s\n\n" % RECONNECT_MILLISECONDS
+        if last_event_id:
+            missed = await redis.xrange(EVENT_LOG_KEY % topic, min="(%s" % last_event_id, count=EVENT_LOG_MAXLEN)
+            for event_id, fields in missed:
+                yield format_event(event_id, fields["event"], fields["data"])
+                last_event_id = event_id
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            if last_event_id and compare_event_ids(event["id"], last_event_id) <= 0:
+                # already sent from the backlog
+                continue
+            yield format_event(event["id"], event["event"], event["data"])
+            last_event_id = event["id"]
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def event_stream_response(request: Request, hub: EventHub, redis: aioredis.Redis, topic: str) -> StreamingResponse:
+    """
+    Server-sent events for a topic. Clients reconnecting with Last-Event-ID first receive the events
+    they missed that are still in the topic's log
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if not last_event_id or not EVENT_ID_PATTERN.match(last_event_id):
+        last_event_id = None
+    return StreamingResponse(
+        _event_stream(request, hub, redis, topic, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
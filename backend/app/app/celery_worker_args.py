@@ -0,0 +1,38 @@
+import os
+import shlex
+import sys
+
+from app.core.config import settings
+
+# messages published to the single queue used before the queues were split
+LEGACY_QUEUE = "main-queue"
+
+
+def worker_args(queue: str) -> list:
+    config = settings.CELERY_QUEUES[queue]
+    queues = [queue]
+    if queue == settings.celery.task_default_queue:
+        queues.append(LEGACY_QUEUE)
+    args = ["-Q", ",".join(queues), "-n", "%s@%%h" % queue, "-c", str(config.concurrency),
+            "--prefetch-multiplier", str(config.prefetch_multiplier)]
+    if config.max_tasks_per_child:
+        args += ["--max-tasks-per-child", str(config.max_tasks_per_child)]
+    return args
+
+
+def main() -> None:
+    """
+    Prints the celery worker arguments of each queue in CELERY_WORKER_QUEUES (all queues when unset),
+    one worker per line, for worker-start.sh
+    """
+    selected = [q.strip() for q in os.environ.get("CELERY_WORKER_QUEUES", "").split(",") if q.strip()]
+    unknown = set(selected) - set(settings.CELERY_QUEUES)
+    if unknown:
+        sys.exit("Unknown queues %s, configured are %s" % (", ".join(sorted(unknown)),
+                                                           ", ".join(settings.CELERY_QUEUES)))
+    for queue in selected or settings.CELERY_QUEUES:
+        print(shlex.join(worker_args(queue)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,28 @@
+import asyncio
 import logging
+import sys
 
-from tenacity import after_log, before_log, retry, stop_after_attempt, wait_fixed
-
-from app.db.session import SessionLocal
+from app.core.config import settings
+from app.core.health import wait_until_ready
+from app.db.session import engine_aio
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-max_tries = 60 * 5  # 5 minutes
-wait_seconds = 1
-
 
-@retry(
-    stop=stop_after_attempt(max_tries),
-    wait=wait_fixed(wait_seconds),
-    before=before_log(logger, logging.INFO),
-    after=after_log(logger, logging.WARN),
-)
-def init() -> None:
+async def init() -> bool:
     try:
-        # Try to create session to check if DB is awake
-        db = SessionLocal()
-        db.execute("SELECT 1")
-    except Exception as e:
-        logger.error(e)
-        raise e
+        return await wait_until_ready(engine_aio, ["postgres", "broker"], timeout=settings.PRESTART_TIMEOUT_SECONDS)
+    finally:
+        await engine_aio.dispose()
 
 
 def main() -> None:
     logger.info("Initializing service")
-    init()
+    if not asyncio.run(init()):
+        sys.exit(1)
     logger.info("Service finished initializing")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+
+
+@lru_cache()
+def get_redis() -> aioredis.Redis:
+    """
+    Shared asyncio redis client for the API, connections are pooled per process
+    """
+    return aioredis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_CACHE_DB,
+                          password=settings.REDIS_PASSWORD or None, decode_responses=True)
+
+
+@lru_cache()
+def get_sync_redis() -> Redis:
+    """
+    Blocking redis client for celery tasks and scripts
+    """
+    return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_CACHE_DB,
+                 password=settings.REDIS_PASSWORD or None, decode_responses=True)
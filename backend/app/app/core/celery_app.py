@@ -1,12 +1,17 @@
+import time
+
 import sentry_sdk
 from celery import Celery, signals
 from celery.utils.log import get_logger
-from redis import Redis
 from sentry_sdk.integrations.celery import CeleryIntegration
 
+from app.core.cache import get_sync_redis
 from app.core.config import settings
+from app.core.logs import configure_logging, request_id_var
+from app.core.metrics import mark_process_dead, observe_task, start_metrics_server
+from app.core.tracing import trace_sampler
 
-redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=3)
+redis = get_sync_redis()
 logger = get_logger(__name__)
 
 celery_app = Celery(__name__)
@@ -15,6 +20,43 @@ celery_config = settings.celery.dict()
 celery_app.conf.update(**celery_config)
 
 
+@signals.setup_logging.connect
+def setup_logging(**_kwargs):
+    # connecting this signal stops celery from installing its own root handlers
+    configure_logging("worker", level=settings.LOG_LEVEL, json_output=settings.LOG_JSON,
+                      sampling=settings.LOG_SAMPLING, queue_size=settings.LOG_QUEUE_SIZE)
+
+
+# start times of the tasks running in this process, by task id
+_task_started = {}
+
+
+@signals.task_prerun.connect
+def bind_task_id(task_id=None, **_kwargs):
+    # task logs carry the task id where API logs carry the request id
+    request_id_var.set(task_id)
+    _task_started[task_id] = time.monotonic()
+
+
+@signals.task_postrun.connect
+def unbind_task_id(task_id=None, task=None, state=None, **_kwargs):
+    request_id_var.set(None)
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        observe_task(task.name, state or "UNKNOWN", time.monotonic() - started)
+
+
+@signals.worker_ready.connect
+def serve_metrics(**_kwargs):
+    if settings.METRICS_ENABLED:
+        start_metrics_server(settings.CELERY_METRICS_PORT)
+
+
+@signals.worker_process_shutdown.connect
+def remove_process_metrics(pid=None, **_kwargs):
+    mark_process_dead(pid)
+
+
 @signals.celeryd_init.connect
 def init_sentry(**_kwargs):
     sentry_sdk.init(
@@ -22,9 +64,11 @@ def init_sentry(**_kwargs):
         integrations=[
             CeleryIntegration(),
         ],
+        traces_sampler=trace_sampler,
+        before_send_transaction=trace_sampler.before_send_transaction,
+        environment=settings.environment
+    )
+
 
-        # Set traces_sample_rate to 1.0 to capture 100%
-        # of transactions for performance monitoring.
-        # We recommend adjusting this value in production,
-        traces_sample_rate=1.0,
-    )
\ No newline at end of file
+def get_celery_app() -> Celery:
+    return celery_app
@@ -1,5 +1,6 @@
 import os
 import typing
+from datetime import datetime
 from enum import Enum
 from functools import lru_cache
 from typing import Any
@@ -23,12 +24,23 @@ class KycProviders(Enum):
     MOCK = "MOCK"
 
 
+class FileUploaders(Enum):
+    S3 = "S3"
+    LOCAL = "LOCAL"
+
+
 class CeleryBeatConfig:
     name: str
     task: str
     schedule: float
     args: tuple
 
+    def __init__(self, name: str, task: str, schedule: float, args: tuple = ()):
+        self.name = name
+        self.task = task
+        self.schedule = schedule
+        self.args = args
+
     def to_config(self):
         return {
             'task': self.task,
@@ -37,7 +49,14 @@ class CeleryBeatConfig:
         }
 
 
-beats: List[CeleryBeatConfig] = []
+beats: List[CeleryBeatConfig] = [
+    # safety net for callbacks queued while no drain task was scheduled
+    CeleryBeatConfig(name="drain-payment-callbacks", task="app.tasks.payments.drain_payment_callbacks",
+                     schedule=10.0),
+    # settles requests whose callback was lost
+    CeleryBeatConfig(name="reconcile-payment-requests", task="app.tasks.payments.reconcile_payment_requests",
+                     schedule=300.0),
+]
 
 
 class CeleryConfig(BaseModel):
@@ -47,9 +66,38 @@ class CeleryConfig(BaseModel):
     beat_schedule: dict = {
         beat.name: beat.to_config() for beat in beats
     }
+    # each queue has its own workers, see CELERY_QUEUES, so OTPs never wait behind invite blasts or sweeps
     task_routes: dict = {
-        "app.tasks.*": "main-queue"
+        "app.tasks.messaging.*": "critical",
+        "app.tasks.payments.submit_payment_request": "payments",
+        "app.tasks.payments.drain_payment_callbacks": "payments",
+        "app.tasks.payments.reconcile_payment_requests": "maintenance",
+        "app.tasks.channels.*": "bulk",
+        "app.tasks.media.*": "bulk",
     }
+    task_default_queue: str = "maintenance"
+    # msgpack payloads are smaller and faster to encode than json, json is still accepted for messages
+    # published before the switch
+    task_serializer: str = "msgpack"
+    result_serializer: str = "msgpack"
+    accept_content: List[str] = ["msgpack", "json"]
+    # tasks report through the database, a task that needs its result opts in with ignore_result=False
+    task_ignore_result: bool = True
+    result_expires: int = 60 * 5
+
+
+class CeleryQueueConfig(BaseModel):
+    concurrency: int = 1
+    # tasks a worker process reserves ahead, 1 keeps long tasks from holding back queued ones
+    prefetch_multiplier: int = 1
+    max_tasks_per_child: typing.Optional[int] = None
+
+
+class SigningKeyConfig(BaseModel):
+    secret: str
+    # signing moves to the newest key whose activate_at has passed, tokens of a key stop verifying at retire_at
+    activate_at: typing.Optional[datetime] = None
+    retire_at: typing.Optional[datetime] = None
 
 
 class AppSettings(BaseSettings):
@@ -65,6 +113,8 @@ class AppSettings(BaseSettings):
 
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
+    # JWT keys by kid, the same on every node. SECRET_KEY is used under the kid "default" while this is empty
+    SIGNING_KEYS: Dict[str, SigningKeyConfig] = {}
     VERICATION_CODE_EXPIRE_SECONDS: int = (60 * 10)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = (60 * 24 * 7)
     REFRESH_TOKEN_EXPIRE_MINUTES: int = (60 * 24 * 7 * 2)
@@ -72,9 +122,25 @@ class AppSettings(BaseSettings):
     SERVER_NAME: str
 
     SENTRY_DSN: typing.Optional[str] = None
+    # share of ordinary transactions kept, per route path prefix or celery task name overrides in the rules
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.05
+    SENTRY_TRACES_RULES: Dict[str, float] = {
+        "/health": 0.001,
+        "/livez": 0.001,
+        "/readyz": 0.001,
+        "GET /api/v1/channels": 0.01,
+        "GET /api/v1/users/me": 0.01,
+    }
+    # share traced up front so failed and slow transactions can be kept, the rest are thinned to the rule rate
+    SENTRY_TRACES_CANDIDATE_RATE: float = 0.2
+    SENTRY_SLOW_TRANSACTION_SECONDS: float = 2.0
+    # per process ceiling on traced transactions, bounds tracing overhead whatever the traffic
+    SENTRY_MAX_TRACES_PER_SECOND: float = 5.0
+    SENTRY_SAMPLING_REFRESH_SECONDS: int = 30
     REDIS_HOST: str
     REDIS_PORT: str
     REDIS_PASSWORD: str = ""
+    REDIS_CACHE_DB: int = 3
     environment: str = "production"
     SERVER_HOST: AnyHttpUrl
 
@@ -87,6 +153,15 @@ class AppSettings(BaseSettings):
     SQLALCHEMY_DATABASE_URI: typing.Optional[PostgresDsn] = None
     ASYNC_SQLALCHEMY_DATABASE_URI: typing.Optional[PostgresDsn] = None
     celery: CeleryConfig = CeleryConfig()
+    # worker-start.sh starts one worker per queue, CELERY_WORKER_QUEUES limits a container to some of them
+    CELERY_QUEUES: Dict[str, CeleryQueueConfig] = {
+        "critical": CeleryQueueConfig(concurrency=4, prefetch_multiplier=1),
+        "payments": CeleryQueueConfig(concurrency=4, prefetch_multiplier=1),
+        "bulk": CeleryQueueConfig(concurrency=2, prefetch_multiplier=1, max_tasks_per_child=100),
+        "maintenance": CeleryQueueConfig(concurrency=1, prefetch_multiplier=4),
+    }
+    # an OTP delivered later than this is dropped, the user has asked for a new one by then
+    TRANSACTIONAL_SMS_EXPIRE_SECONDS: int = 120
     # sms config
     AT_APIKEY: str | None = None
     AT_SHORTCODE: str | None = None
@@ -109,10 +184,81 @@ class AppSettings(BaseSettings):
     S3_ACCESS_KEY_ID: str | None
     S3_SECRET_ACCESS_KEY: str | None
     S3_REGION_NAME: str | None
+    FILE_UPLOADER: FileUploaders = FileUploaders.S3
+    LOCAL_UPLOAD_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                         "uploads")
+    LOCAL_UPLOAD_URL_PATH: str = "/media"
+    MAX_IMAGE_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    MAX_VIDEO_UPLOAD_BYTES: int = 200 * 1024 * 1024
+    PRESIGNED_UPLOAD_EXPIRE_SECONDS: int = 60 * 15
+    IDEMPOTENCY_TTL_SECONDS: int = 60 * 60 * 24
+    IDEMPOTENCY_LOCK_SECONDS: int = 60
+    IDEMPOTENCY_LOCK_WAIT_SECONDS: float = 5.0
     API_KEY_NAME: str = "apiKey"
     API_KEY: str = secrets.token_urlsafe(32)
+    # sha256 hex digests of accepted API keys, scripts/keys.py api-key prints a new key and its digest
+    API_KEY_HASHES: typing.List[str] = []
     KCB_CLIENT_ID: str
     KCB_CLIENT_SECRET: str
+    CYBERSOURCE_API_KEY: str | None = None
+    CYBERSOURCE_MERCHANT_ID: str | None = None
+    PAYMENT_STATUS_CACHE_SECONDS: int = 60 * 60 * 24
+    PAYMENT_RECONCILE_AFTER_SECONDS: int = 60 * 5
+    # longest a reconcile run may take, a crashed run blocks the next ones for at most this long
+    PAYMENT_RECONCILE_LOCK_SECONDS: int = 60 * 30
+    PAYMENT_EXPIRE_AFTER_SECONDS: int = 60 * 60 * 24
+    PAYMENT_RECONCILE_BATCH_SIZE: int = 200
+    PAYMENT_RECONCILE_CONCURRENCY: int = 10
+    CHANNEL_FEED_TTL_SECONDS: int = 60 * 60 * 24 * 7
+    CHANNEL_SUMMARY_TTL_SECONDS: int = 60 * 60 * 24
+    # numbers without an international prefix in imported contact files are read as numbers of this country
+    DEFAULT_PHONE_COUNTRY: str = "KE"
+    CONTACT_IMPORT_MAX_ROWS: int = 100_000
+    # ten columns per invite, keeps a multi row insert below the 32767 bind parameter limit
+    CONTACT_IMPORT_BATCH_SIZE: int = 2000
+    CONTACT_IMPORT_MAX_REPORTED_INVALID: int = 100
+    CHANNEL_INVITE_SMS_CONCURRENCY: int = 10
+    CONTACT_DISCOVERY_MAX_CONTACTS: int = 20_000
+    CONTACT_DISCOVERY_MAX_MATCHES: int = 2000
+    # discovery requests per user per window
+    CONTACT_DISCOVERY_RATE_LIMIT: int = 10
+    CONTACT_DISCOVERY_RATE_WINDOW_SECONDS: int = 60 * 60
+    SSE_QUEUE_SIZE: int = 100
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    # higher levels trade API CPU for smaller payloads
+    COMPRESSION_GZIP_LEVEL: int = 5
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    # media is already compressed and text/event-stream must not be buffered, neither is listed
+    COMPRESSION_CONTENT_TYPES: typing.List[str] = ["application/json", "text/plain", "text/csv", "text/html",
+                                                   "application/javascript", "text/css", "image/svg+xml"]
+    # orjson responses and precompiled serializers for the hot read endpoints, skips response model validation
+    FAST_SERIALIZATION: bool = False
+    SSE_HEARTBEAT_SECONDS: int = 15
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_QUEUE_SIZE: int = 10000
+    # share of records below WARNING kept per logger, the logger's children included
+    LOG_SAMPLING: Dict[str, float] = {"sqlalchemy.engine": 0.1}
+    SQLALCHEMY_ECHO: bool = True
+    SQLALCHEMY_POOL_SIZE: int = 5
+    SQLALCHEMY_MAX_OVERFLOW: int = 10
+    # pooled connections opened and providers resolved when a worker boots, /readyz fails until it is done
+    WARMUP_ENABLED: bool = True
+    WARMUP_DB_CONNECTIONS: int = 5
+    WARMUP_PROVIDERS: typing.List[str] = ["payment_gateway"]
+    WARMUP_TIMEOUT_SECONDS: float = 15.0
+    # dependencies /readyz checks, results are shared by the probes for HEALTH_CHECK_CACHE_SECONDS
+    READINESS_CHECKS: typing.List[str] = ["postgres", "redis", "broker", "migrations"]
+    HEALTH_CHECK_CACHE_SECONDS: float = 2.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+    # how long prestart scripts wait for the database and redis
+    PRESTART_TIMEOUT_SECONDS: int = 60 * 5
+    METRICS_ENABLED: bool = True
+    # celery workers serve their metrics on this port, the API serves /metrics to requests with the API key
+    CELERY_METRICS_PORT: int = 9808
+    # bcrypt runs in its own threads so hashing never blocks the event loop
+    PASSWORD_HASH_WORKERS: int = 4
 
 
     class Config:
@@ -157,6 +303,16 @@ class AppSettings(BaseSettings):
         raise ValueError(v)
 
 
+    @validator("FILE_UPLOADER")
+    def local_uploads_need_secret_key(
+            cls, v: FileUploaders, values: typing.Dict[str, typing.Any]
+    ) -> FileUploaders:
+        # presigned local uploads are signed with SECRET_KEY, with the per process default another worker
+        # would reject the URLs this one issues
+        if v == FileUploaders.LOCAL and values.get("SECRET_KEY") == cls.__fields__["SECRET_KEY"].default:
+            raise ValueError("FILE_UPLOADER=local needs SECRET_KEY set to the same value on every worker")
+        return v
+
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(
             cls, v: typing.Optional[str], values: typing.Dict[str, typing.Any]
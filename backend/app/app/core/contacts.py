@@ -0,0 +1,131 @@
+import csv
+import hashlib
+import io
+import re
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+__all__ = ['CountryRule', 'COUNTRY_RULES', 'normalize_phone_number', 'hash_phone_number', 'is_phone_hash',
+           'iter_contact_numbers', 'is_vcard']
+
+
+class CountryRule(NamedTuple):
+    country: str
+    dial_code: str
+    # national significant number, without the trunk prefix
+    national_number: re.Pattern
+
+
+COUNTRY_RULES = {
+    "KE": CountryRule("KE", "254", re.compile(r"^(?:7\d{8}|1[01]\d{7})$")),
+    "UG": CountryRule("UG", "256", re.compile(r"^7\d{8}$")),
+    "TZ": CountryRule("TZ", "255", re.compile(r"^[67]\d{8}$")),
+    "RW": CountryRule("RW", "250", re.compile(r"^7[2389]\d{7}$")),
+    "NG": CountryRule("NG", "234", re.compile(r"^[789][01]\d{8}$")),
+}
+_RULES_BY_DIAL_CODE = {rule.dial_code: rule for rule in COUNTRY_RULES.values()}
+_MAX_DIAL_CODE_LENGTH = 3
+
+_SEPARATORS = re.compile(r"[\s\-.()/]")
+_EXTENSION = re.compile(r"(?:ext\.?|x|#)\d+$", re.IGNORECASE)
+_DIGITS = re.compile(r"^\d+$")
+# E.164 allows at most 15 digits, numbers of countries without a rule are only length checked
+_E164_DIGITS = re.compile(r"^[1-9]\d{7,14}$")
+
+_PHONE_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+_PHONE_LIKE = re.compile(r"^\s*(?:\+|00)?[\d\s\-.()/]{7,}\s*$")
+_PHONE_HEADER = re.compile(r"phone|mobile|msisdn|tel|number|cell", re.IGNORECASE)
+_VCARD_TEL = re.compile(r"^(?:item\d+\.)?TEL[;:]", re.IGNORECASE)
+
+
+def normalize_phone_number(raw: str, default_country: str = "KE") -> Optional[str]:
+    """
+    Normalises a phone number to E.164 (+254712345678). Numbers without an international prefix are read
+    as numbers of default_country. Returns None for invalid numbers
+    """
+    value = _EXTENSION.sub("", _SEPARATORS.sub("", raw or ""))
+    if value.startswith("+"):
+        digits = value[1:]
+    elif value.startswith("00"):
+        digits = value[2:]
+    else:
+        rule = COUNTRY_RULES[default_country]
+        if not _DIGITS.match(value):
+            return None
+        if value.startswith("0"):
+            national = value[1:]
+        elif value.startswith(rule.dial_code) and rule.national_number.match(value[len(rule.dial_code):]):
+            national = value[len(rule.dial_code):]
+        else:
+            national = value
+        return "+%s%s" % (rule.dial_code, national) if rule.national_number.match(national) else None
+    if not _DIGITS.match(digits):
+        return None
+    for length in range(1, _MAX_DIAL_CODE_LENGTH + 1):
+        rule = _RULES_BY_DIAL_CODE.get(digits[:length])
+        if rule is not None:
+            national = digits[length:]
+            if national.startswith("0"):
+                # +254 0712... is a common mistake
+                national = national[1:]
+            return "+%s%s" % (rule.dial_code, national) if rule.national_number.match(national) else None
+    return "+%s" % digits if _E164_DIGITS.match(digits) else None
+
+
+def hash_phone_number(number: str) -> str:
+    """
+    Hex sha256 of an E.164 number, the form clients send when they do not want to upload plain numbers
+    """
+    return hashlib.sha256(number.encode()).hexdigest()
+
+
+def is_phone_hash(value: str) -> bool:
+    return _PHONE_HASH.match(value) is not None
+
+
+def is_vcard(file_name: Optional[str], content_type: Optional[str]) -> bool:
+    return (content_type or "").lower() in ("text/vcard", "text/x-vcard", "text/directory") or \
+        (file_name or "").lower().endswith((".vcf", ".vcard"))
+
+
+def _iter_csv_numbers(text: io.TextIOBase) -> Iterator[Tuple[int, str]]:
+    reader = csv.reader(text)
+    phone_columns = None
+    for row_no, row in enumerate(reader, start=1):
+        if not any(cell.strip() for cell in row):
+            continue
+        if row_no == 1 and not any(_PHONE_LIKE.match(cell) for cell in row):
+            # header row, read the phone columns only
+            phone_columns = [i for i, name in enumerate(row) if _PHONE_HEADER.search(name)] or None
+            continue
+        if phone_columns is None:
+            yield row_no, next((cell for cell in row if _PHONE_LIKE.match(cell)), row[0])
+            continue
+        for i in phone_columns:
+            if i < len(row) and row[i].strip():
+                yield row_no, row[i]
+
+
+def _iter_vcard_numbers(text: io.TextIOBase) -> Iterator[Tuple[int, str]]:
+    for line_no, line in enumerate(text, start=1):
+        if _VCARD_TEL.match(line):
+            value = line.split(":", 1)[1].strip()
+            if value.lower().startswith("tel:"):
+                value = value[4:]
+            yield line_no, value
+
+
+def iter_contact_numbers(file: BinaryIO, vcard: bool = False) -> Iterator[Tuple[int, str]]:
+    """
+    Streams (row or line number, raw phone number) from a CSV or vCard file object without reading it
+    into memory
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        if vcard:
+            yield from _iter_vcard_numbers(text)
+        else:
+            yield from _iter_csv_numbers(text)
+    finally:
+        # leave the underlying upload file open for its owner
+        text.detach()
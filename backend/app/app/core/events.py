@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Set, Tuple
+
+from redis import Redis
+from redis import asyncio as aioredis
+
+from app.core.cache import get_redis
+from app.core.config import settings
+
+__all__ = ['publish_event', 'publish_event_sync', 'channel_topic', 'payment_topic', 'event_hub', 'EventHub',
+           'Subscription', 'EVENT_LOG_KEY', 'EVENT_LOG_MAXLEN', 'compare_event_ids']
+
+logger = logging.getLogger(__name__)
+
+EVENT_CHANNEL_PREFIX = "events:"
+EVENT_LOG_KEY = "events-log:%s"
+# events kept per topic for Last-Event-ID resume
+EVENT_LOG_MAXLEN = 200
+EVENT_LOG_TTL_SECONDS = 60 * 60 * 24
+
+
+def channel_topic(channel_id: str) -> str:
+    return "channel:%s" % channel_id
+
+
+def payment_topic(request_id: str) -> str:
+    return "payment:%s" % request_id
+
+
+def compare_event_ids(a: str, b: str) -> int:
+    """
+    Compares redis stream ids of the form <ms>-<seq>
+    """
+    a_id: Tuple[int, ...] = tuple(int(i) for i in a.split("-"))
+    b_id: Tuple[int, ...] = tuple(int(i) for i in b.split("-"))
+    return (a_id > b_id) - (a_id < b_id)
+
+
+def _event_fields(event: str, data: Dict[str, Any]) -> Dict[str, str]:
+    return {"event": event, "data": json.dumps(data, default=str)}
+
+
+async def publish_event(redis: aioredis.Redis, topic: str, event: str, data: Dict[str, Any]) -> str:
+    """
+    Appends the event to the topic's capped log (used for resume) and fans it out over pub/sub
+    """
+    fields = _event_fields(event, data)
+    log_key = EVENT_LOG_KEY % topic
+    event_id = await redis.xadd(log_key, fields, maxlen=EVENT_LOG_MAXLEN, approximate=True)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.expire(log_key, EVENT_LOG_TTL_SECONDS)
+        pipe.publish(EVENT_CHANNEL_PREFIX + topic, json.dumps(dict(fields, id=event_id)))
+        await pipe.execute()
+    return event_id
+
+
+def publish_event_sync(redis: Redis, topic: str, event: str, data: Dict[str, Any]) -> str:
+    fields = _event_fields(event, data)
+    log_key = EVENT_LOG_KEY % topic
+    event_id = redis.xadd(log_key, fields, maxlen=EVENT_LOG_MAXLEN, approximate=True)
+    with redis.pipeline(transaction=False) as pipe:
+        pipe.expire(log_key, EVENT_LOG_TTL_SECONDS)
+        pipe.publish(EVENT_CHANNEL_PREFIX + topic, json.dumps(dict(fields, id=event_id)))
+        pipe.execute()
+    return event_id
+
+
+class Subscription(object):
+    """
+    A single listener's bounded buffer. When a slow client falls behind the oldest events are dropped,
+    the client can recover them by reconnecting with Last-Event-ID
+    """
+
+    def __init__(self, topic: str, maxsize: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event: Dict[str, str]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class EventHub(object):
+    """
+    Multiplexes every SSE listener of a worker process onto one redis pub/sub connection,
+    so idle listeners only cost their (bounded) queue
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, topic: str) -> Subscription:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        subscription = Subscription(topic, self.queue_size)
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        listeners = self._subscribers.get(subscription.topic)
+        if listeners is None:
+            return
+        listeners.discard(subscription)
+        if not listeners:
+            del self._subscribers[subscription.topic]
+
+    def _dispatch(self, message: dict):
+        topic = message["channel"][len(EVENT_CHANNEL_PREFIX):]
+        listeners = self._subscribers.get(topic)
+        if not listeners:
+            return
+        event = json.loads(message["data"])
+        for subscription in listeners:
+            subscription.put(event)
+
+    async def _run(self):
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(EVENT_CHANNEL_PREFIX + "*")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error("Event hub lost its redis subscription, reconnecting: %s" % exc)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+event_hub = EventHub(queue_size=settings.SSE_QUEUE_SIZE)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from redis import asyncio as aioredis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.cache import get_redis
+from app.core.config import settings
+
+__all__ = ['HealthChecker', 'CheckResult', 'health_checker', 'wait_until_ready']
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                              "migrations")
+
+
+class CheckResult(dict):
+    @property
+    def ok(self) -> bool:
+        return self["ok"]
+
+
+@lru_cache()
+def _broker_redis() -> aioredis.Redis:
+    return aioredis.Redis.from_url(str(settings.celery.broker_url), socket_connect_timeout=2)
+
+
+@lru_cache()
+def _migration_revisions() -> tuple:
+    """
+    (head revisions, every revision) of the migration scripts shipped with this build, read once per process
+    """
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory(MIGRATIONS_DIR)
+    return frozenset(script.get_heads()), frozenset(rev.revision for rev in script.walk_revisions())
+
+
+async def check_postgres(engine: AsyncEngine) -> Optional[str]:
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    return None
+
+
+async def check_redis(engine: AsyncEngine) -> Optional[str]:
+    await get_redis().ping()
+    return None
+
+
+async def check_broker(engine: AsyncEngine) -> Optional[str]:
+    if str(settings.celery.broker_url).startswith(("redis://", "rediss://")):
+        await _broker_redis().ping()
+        return None
+    # other transports go through kombu, which only has a blocking client
+    from kombu import Connection
+
+    def connect():
+        with Connection(str(settings.celery.broker_url), connect_timeout=2) as connection:
+            connection.ensure_connection(max_retries=1)
+
+    await asyncio.get_running_loop().run_in_executor(None, connect)
+    return None
+
+
+async def check_migrations(engine: AsyncEngine) -> Optional[str]:
+    """
+    Fails while the database is behind this build's migration head. A revision this build does not know is
+    accepted, during a rolling deploy a newer release may already have migrated
+    """
+    async with engine.connect() as connection:
+        current = set((await connection.execute(text("SELECT version_num FROM alembic_version"))).scalars())
+    heads, known = _migration_revisions()
+    if current == heads:
+        return None
+    if current - known:
+        return "database ahead at %s" % ", ".join(sorted(current))
+    raise RuntimeError("database at %s, expected %s" % (", ".join(sorted(current)) or "no revision",
+                                                         ", ".join(sorted(heads))))
+
+
+CHECKS: Dict[str, Callable[[AsyncEngine], Awaitable[Optional[str]]]] = {
+    "postgres": check_postgres,
+    "redis": check_redis,
+    "broker": check_broker,
+    "migrations": check_migrations,
+}
+
+
+class HealthChecker(object):
+    """
+    Runs the dependency checks behind /readyz. Results are cached for cache_seconds and concurrent callers
+    share one run, so probes from every load balancer node cost at most one round of checks per interval
+    """
+
+    def __init__(self, checks: List[str], cache_seconds: float, timeout: float):
+        unknown = set(checks) - set(CHECKS)
+        if unknown:
+            raise ValueError("Unknown health checks %s" % ", ".join(sorted(unknown)))
+        self.checks = checks
+        self.cache_seconds = cache_seconds
+        self.timeout = timeout
+        self._results: Dict[str, CheckResult] = {}
+        self._checked_at = 0.0
+        self._running: Optional[asyncio.Future] = None
+
+    async def _check(self, name: str, engine: AsyncEngine) -> CheckResult:
+        started = time.monotonic()
+        try:
+            detail = await asyncio.wait_for(CHECKS[name](engine), self.timeout)
+            result = CheckResult(ok=True)
+            if detail:
+                result["detail"] = detail
+        except asyncio.TimeoutError:
+            result = CheckResult(ok=False, error="timed out after %ss" % self.timeout)
+        except Exception as exc:
+            result = CheckResult(ok=False, error=str(exc) or repr(exc))
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+    async def _run(self, engine: AsyncEngine) -> Dict[str, CheckResult]:
+        results = await asyncio.gather(*(self._check(name, engine) for name in self.checks))
+        self._results = dict(zip(self.checks, results))
+        self._checked_at = time.monotonic()
+        for name, result in self._results.items():
+            if not result.ok:
+                logger.warning("Health check %s failed %s" % (name, result["error"]))
+        return self._results
+
+    async def run(self, engine: AsyncEngine) -> Dict[str, CheckResult]:
+        if self._results and time.monotonic() - self._checked_at < self.cache_seconds:
+            return self._results
+        if self._running is None or self._running.done():
+            self._running = asyncio.ensure_future(self._run(engine))
+        # shielded, a probe that disconnects must not cancel the run other probes wait for
+        return await asyncio.shield(self._running)
+
+
+async def wait_until_ready(engine: AsyncEngine, checks: List[str], timeout: float, interval: float = 0.5) -> bool:
+    """
+    Polls checks until they all pass or timeout runs out, for the prestart scripts
+    """
+    checker = HealthChecker(checks, cache_seconds=0, timeout=min(interval * 4, 5))
+    deadline = time.monotonic() + timeout
+    while True:
+        results = await checker.run(engine)
+        failed = {name: result["error"] for name, result in results.items() if not result.ok}
+        if not failed:
+            return True
+        if time.monotonic() >= deadline:
+            logger.error("Dependencies not ready after %ss %s" % (timeout, failed))
+            return False
+        logger.info("Waiting for %s" % ", ".join(sorted(failed)))
+        await asyncio.sleep(interval)
+
+
+health_checker = HealthChecker(settings.READINESS_CHECKS, cache_seconds=settings.HEALTH_CHECK_CACHE_SECONDS,
+                               timeout=settings.HEALTH_CHECK_TIMEOUT_SECONDS)
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import jwt
+
+from app.core.config import AppSettings, SigningKeyConfig, settings
+
+__all__ = ['Keyring', 'ApiKeySet', 'keyring', 'api_keys', 'hash_api_key', 'DEFAULT_KID']
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+DEFAULT_KID = "default"
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class Keyring(object):
+    """
+    JWT signing keys by kid. Tokens are signed with the newest active key and carry its kid in the header,
+    they verify against any key that is not retired, so every node configured with the same SIGNING_KEYS
+    accepts tokens issued by any other.
+
+    Rotating: add the new key with activate_at far enough ahead that every node has it, then set retire_at
+    on the old key to after the longest token lifetime. Tokens without a kid verify against DEFAULT_KID
+    """
+
+    def __init__(self, keys: Dict[str, SigningKeyConfig]):
+        if not keys:
+            raise ValueError("The keyring needs at least one key")
+        self._keys = {kid: SigningKeyConfig(secret=key.secret, activate_at=_utc(key.activate_at),
+                                            retire_at=_utc(key.retire_at))
+                      for kid, key in keys.items()}
+
+    @classmethod
+    def from_settings(cls, app_settings: AppSettings) -> "Keyring":
+        if app_settings.SIGNING_KEYS:
+            return cls(app_settings.SIGNING_KEYS)
+        if "SECRET_KEY" not in app_settings.__fields_set__:
+            logger.warning("Neither SIGNING_KEYS nor SECRET_KEY is set, tokens are signed with a key of this "
+                           "process and other processes reject them")
+        return cls({DEFAULT_KID: SigningKeyConfig(secret=app_settings.SECRET_KEY)})
+
+    def _verification_key(self, kid: str, now: datetime) -> Optional[str]:
+        key = self._keys.get(kid)
+        if key is None or (key.retire_at is not None and key.retire_at <= now):
+            return None
+        # keys published ahead of their activation already verify, a node that switched early is accepted
+        return key.secret
+
+    def active_kid(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now(timezone.utc)
+        candidates = [(key.activate_at or datetime.min.replace(tzinfo=timezone.utc), kid)
+                      for kid, key in self._keys.items()
+                      if (key.activate_at is None or key.activate_at <= now)
+                      and (key.retire_at is None or key.retire_at > now)]
+        if not candidates:
+            raise RuntimeError("No active signing key, every key is retired or not yet active")
+        return max(candidates)[1]
+
+    @property
+    def kids(self) -> List[str]:
+        return list(self._keys)
+
+    def encode(self, payload: dict) -> str:
+        kid = self.active_kid()
+        return jwt.encode(payload, self._keys[kid].secret, algorithm=ALGORITHM, headers={"kid": kid})
+
+    def decode(self, token: str) -> dict:
+        """
+        Verified claims of token. Raises jwt.InvalidTokenError, or its subclass jwt.ExpiredSignatureError,
+        like jwt.decode
+        """
+        kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+        secret = self._verification_key(kid, datetime.now(timezone.utc))
+        if secret is None:
+            raise jwt.InvalidTokenError("Unknown or retired signing key %s" % kid)
+        return jwt.decode(token, secret, algorithms=[ALGORITHM])
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ApiKeySet(object):
+    """
+    Accepted API keys, held as sha256 digests only. Lookup hashes the presented key and tests set
+    membership, the comparison never runs over the key itself so its timing tells nothing about it
+    """
+
+    def __init__(self, digests: Iterable[str]):
+        self._digests: FrozenSet[str] = frozenset(digest.strip().lower() for digest in digests if digest.strip())
+
+    @classmethod
+    def from_settings(cls, app_settings: AppSettings) -> "ApiKeySet":
+        # plain keys in API_KEY are still accepted, they are hashed here and not kept
+        plain = [key.strip() for key in app_settings.API_KEY.split(",") if key.strip()]
+        return cls(list(app_settings.API_KEY_HASHES) + [hash_api_key(key) for key in plain])
+
+    def validate(self, api_key: Optional[str]) -> bool:
+        if not api_key:
+            return False
+        return hash_api_key(api_key) in self._digests
+
+
+keyring = Keyring.from_settings(settings)
+api_keys = ApiKeySet.from_settings(settings)
@@ -0,0 +1,201 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = ['configure_logging', 'request_id_var', 'RequestIdMiddleware', 'JsonFormatter', 'SamplingFilter',
+           'REQUEST_ID_HEADER']
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# loggers that install their own handlers, their records are routed through the root queue instead
+_HANDLER_OWNING_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access", "celery", "celery.task", "celery.worker",
+                           "sqlalchemy.engine", "sqlalchemy.engine.Engine")
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id",
+                                                                                    "service"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Attributes passed with extra= are added as fields
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "service": getattr(record, "service", None),
+            "request_id": getattr(record, "request_id", None),
+            "process": record.process,
+            "location": "%s:%s" % (record.module, record.lineno),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.service = self.service
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps rates[logger] of the records below WARNING from a noisy logger and its children,
+    warnings and errors always pass
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # longest name first so child loggers can have their own rate
+        self.rates = sorted(rates.items(), key=lambda rate: len(rate[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Formats in the caller only what cannot cross threads, drops records when the writer falls behind
+    rather than blocking the event loop
+    """
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_state = {"handler": None, "listener": None, "pid": None, "stream_handler": None}
+
+
+def _start_listener():
+    handler = _state["handler"]
+    handler.queue = queue.Queue(handler.queue.maxsize)
+    listener = QueueListener(handler.queue, _state["stream_handler"], respect_handler_level=True)
+    listener.start()
+    _state["listener"] = listener
+    _state["pid"] = os.getpid()
+
+
+def _stop_listener():
+    listener = _state["listener"]
+    if listener is not None and _state["pid"] == os.getpid():
+        listener.stop()
+        _state["listener"] = None
+
+
+def _restart_after_fork():
+    # the writer thread is not copied into forked gunicorn and celery workers
+    if _state["handler"] is not None and _state["pid"] != os.getpid():
+        _start_listener()
+
+
+def configure_logging(service: str, level: str = "INFO", json_output: bool = True,
+                      sampling: Optional[Dict[str, float]] = None, queue_size: int = 10000) -> logging.Logger:
+    """
+    Routes every logger through one QueueHandler on the root logger, a background thread writes the records
+    to stdout. Safe to call more than once, later calls only update the level and sampling
+    """
+    root = logging.getLogger()
+    with _lock:
+        handler = _state["handler"]
+        if handler is None:
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(
+                "%(asctime)s loglevel=%(levelname)-6s logger=%(name)s request_id=%(request_id)s %(message)s"))
+            handler = _NonBlockingQueueHandler(queue.Queue(queue_size))
+            handler.addFilter(_ContextFilter(service))
+            _state["handler"] = handler
+            _state["stream_handler"] = stream_handler
+            _start_listener()
+            atexit.register(_stop_listener)
+            os.register_at_fork(after_in_child=_restart_after_fork)
+        for existing in list(root.handlers):
+            if existing is not handler:
+                root.removeHandler(existing)
+        if handler not in root.handlers:
+            root.addHandler(handler)
+        for name in _HANDLER_OWNING_LOGGERS:
+            named = logging.getLogger(name)
+            named.handlers.clear()
+            named.propagate = True
+        for existing in list(handler.filters):
+            if isinstance(existing, SamplingFilter):
+                handler.removeFilter(existing)
+        if sampling:
+            handler.addFilter(SamplingFilter(sampling))
+        root.setLevel(level.upper())
+    return root
+
+
+class RequestIdMiddleware(object):
+    """
+    Binds the X-Request-ID header, or a new id, to the request's logs and echoes it on the response
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token = request_id_var.set(request_id[:128])
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id_var.get()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
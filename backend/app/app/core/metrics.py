@@ -0,0 +1,144 @@
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, \
+    generate_latest, start_http_server
+from prometheus_client import multiprocess
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = ['MetricsMiddleware', 'render_metrics', 'CONTENT_TYPE_LATEST', 'observe_provider_call',
+           'count_provider_error', 'password_hash_queue', 'observe_task', 'mark_process_dead',
+           'multiprocess_enabled', 'start_metrics_server']
+
+# gunicorn_conf.py and worker-start.sh point PROMETHEUS_MULTIPROC_DIR at a directory shared by the worker
+# processes, every process writes its samples there and /metrics sums them up
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+http_request_duration = Histogram("http_request_duration_seconds", "Request latency by route",
+                                  ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+http_requests_in_progress = Gauge("http_requests_in_progress", "Requests being served",
+                                  ["method"], multiprocess_mode="livesum")
+db_pool_connections = Gauge("db_pool_connections", "Async engine pool connections by state",
+                            ["state"], multiprocess_mode="livesum")
+password_hash_queue = Gauge("password_hash_queue_depth", "Password hashes submitted and not yet finished",
+                            multiprocess_mode="livesum")
+provider_request_duration = Histogram("provider_request_duration_seconds",
+                                      "Outbound provider call latency, retries included",
+                                      ["provider", "outcome"], buckets=LATENCY_BUCKETS)
+provider_errors = Counter("provider_errors_total", "Failed outbound provider attempts", ["provider", "error"])
+celery_task_duration = Histogram("celery_task_duration_seconds", "Celery task run time",
+                                 ["task", "state"], buckets=TASK_BUCKETS)
+
+# pool stats are sampled at most this often per process rather than on every request
+POOL_SAMPLE_SECONDS = 1.0
+
+
+def observe_provider_call(provider: str, outcome: str, seconds: float):
+    provider_request_duration.labels(provider, outcome).observe(seconds)
+
+
+def count_provider_error(provider: str, exc: BaseException):
+    provider_errors.labels(provider, type(exc).__name__).inc()
+
+
+def observe_task(task: str, state: str, seconds: float):
+    celery_task_duration.labels(task, state).observe(seconds)
+
+
+def mark_process_dead(pid: int):
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def _registry() -> CollectorRegistry:
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics() -> bytes:
+    return generate_latest(_registry())
+
+
+def start_metrics_server(port: int):
+    """
+    Serves metrics from a thread of the current process, for celery workers which have no HTTP server.
+    When several workers share a container and a multiprocess directory the first one serves all of them
+    """
+    try:
+        start_http_server(port, registry=_registry())
+    except OSError as exc:
+        logging.getLogger(__name__).info("Metrics port %s not available, served by another worker %s" % (port, exc))
+
+
+class MetricsMiddleware(object):
+    """
+    Records latency by route template and in flight requests. Route templates are looked up once per
+    endpoint, and database pool gauges are refreshed at most every POOL_SAMPLE_SECONDS
+    """
+
+    def __init__(self, app: ASGIApp, pool=None):
+        self.app = app
+        self.pool = pool
+        self._routes: Dict[object, str] = {}
+        self._pool_sampled = 0.0
+
+    def _route(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        route = self._routes.get(endpoint)
+        if route is None:
+            app = scope.get("app")
+            for candidate in getattr(app, "routes", ()):
+                if getattr(candidate, "endpoint", None) is endpoint or getattr(candidate, "app", None) is endpoint:
+                    route = candidate.path
+                    break
+            route = route or UNMATCHED_ROUTE
+            self._routes[endpoint] = route
+        return route
+
+    def _sample_pool(self, now: float):
+        if self.pool is None or now - self._pool_sampled < POOL_SAMPLE_SECONDS:
+            return
+        self._pool_sampled = now
+        db_pool_connections.labels("checked_out").set(self.pool.checkedout())
+        db_pool_connections.labels("idle").set(self.pool.checkedin())
+        db_pool_connections.labels("overflow").set(max(self.pool.overflow(), 0))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status: Optional[int] = None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = http_requests_in_progress.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            finished = time.perf_counter()
+            in_progress.dec()
+            http_request_duration.labels(method, self._route(scope), "%sxx" % ((status or 500) // 100)).observe(
+                finished - started)
+            self._sample_pool(finished)
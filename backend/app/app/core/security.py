@@ -1,16 +1,18 @@
+import asyncio
 import math
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Any, Union
 
-import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.keyring import ALGORITHM, keyring  # noqa: F401, ALGORITHM is re-exported
+from app.core.metrics import password_hash_queue
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-ALGORITHM = "HS256"
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 
 async def create_random_code(length=4):
@@ -36,16 +38,24 @@ async def create_access_token(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     to_encode = {"exp": expire, "sub": str(subject)}
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = keyring.encode(to_encode)
     return encoded_jwt
 
 
+async def _run_hashing(fn, *args):
+    password_hash_queue.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        password_hash_queue.dec()
+
+
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
 
 
 async def get_password_hash_async(password: str) -> str:
-    return pwd_context.hash(password)
+    return await _run_hashing(pwd_context.hash, password)
 
 
 def get_password_hash(password: str) -> str:
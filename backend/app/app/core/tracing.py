@@ -0,0 +1,173 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.schemas.tracing import TraceSamplingOverrides
+
+__all__ = ['TraceSampler', 'trace_sampler', 'SAMPLING_OVERRIDES_KEY']
+
+logger = logging.getLogger(__name__)
+
+# JSON object with any of default_rate, rules, candidate_rate, slow_transaction_seconds, max_traces_per_second
+SAMPLING_OVERRIDES_KEY = "tracing:sampling"
+
+
+def _transaction_key(sampling_context: Dict[str, Any]) -> str:
+    celery_job = sampling_context.get("celery_job")
+    if celery_job:
+        return celery_job.get("task") or ""
+    scope = sampling_context.get("asgi_scope")
+    if scope and scope.get("type") == "http":
+        return "%s %s" % (scope.get("method", ""), scope.get("path", ""))
+    return (sampling_context.get("transaction_context") or {}).get("name") or ""
+
+
+class _TokenBucket(object):
+    """
+    Holds at least one token so rates below 1 still let a transaction through every 1 / rate seconds,
+    a rate of 0 lets none through
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity if rate > 0 else 0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class TraceSampler(object):
+    """
+    traces_sampler and before_send_transaction for the API and celery workers.
+
+    A transaction is traced with the candidate rate, or the rule rate when that is higher, and at most
+    max_traces_per_second per process. Traced transactions that failed or ran longer than
+    slow_transaction_seconds are always sent, the others are thinned down to the rule rate. Rules are
+    matched by longest prefix against "METHOD /path", the path alone or the celery task name.
+    Distributed traces follow the parent's decision.
+
+    Settings can be overridden at runtime through the tracing:sampling redis key, which every process
+    reads every SENTRY_SAMPLING_REFRESH_SECONDS from a background thread
+    """
+
+    def __init__(self, default_rate: float, rules: Dict[str, float], candidate_rate: float,
+                 slow_transaction_seconds: float, max_traces_per_second: float, refresh_seconds: int = 30):
+        self.refresh_seconds = refresh_seconds
+        self._base = dict(default_rate=default_rate, rules=rules, candidate_rate=candidate_rate,
+                          slow_transaction_seconds=slow_transaction_seconds,
+                          max_traces_per_second=max_traces_per_second)
+        self._refresher_pid = None
+        self.configure(**self._base)
+
+    def configure(self, default_rate: float, rules: Dict[str, float], candidate_rate: float,
+                  slow_transaction_seconds: float, max_traces_per_second: float):
+        self.default_rate = default_rate
+        # longest prefix first
+        self.rules = sorted(rules.items(), key=lambda rule: len(rule[0]), reverse=True)
+        self.candidate_rate = candidate_rate
+        self.slow_transaction_seconds = slow_transaction_seconds
+        if getattr(self, "_bucket", None) is None or self._bucket.rate != max_traces_per_second:
+            self._bucket = _TokenBucket(max_traces_per_second)
+
+    @property
+    def config(self) -> dict:
+        return dict(default_rate=self.default_rate, rules=dict(self.rules), candidate_rate=self.candidate_rate,
+                    slow_transaction_seconds=self.slow_transaction_seconds,
+                    max_traces_per_second=self._bucket.rate)
+
+    def apply_overrides(self, overrides: Optional[dict]):
+        config = dict(self._base)
+        if overrides:
+            config.update({k: v for k, v in overrides.items() if k in config})
+            if "rules" in overrides:
+                config["rules"] = dict(self._base["rules"], **overrides["rules"])
+        self.configure(**config)
+
+    def rate_for(self, key: str) -> float:
+        path = key.split(" ", 1)[-1]
+        for prefix, rate in self.rules:
+            if key.startswith(prefix) or path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def __call__(self, sampling_context: Dict[str, Any]) -> float:
+        self._ensure_refresher()
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        rate = self.rate_for(_transaction_key(sampling_context))
+        if rate <= 0:
+            return 0.0
+        # decided here rather than by the SDK so the budget is only spent on traced transactions
+        if random.random() >= max(rate, self.candidate_rate):
+            return 0.0
+        return 1.0 if self._bucket.take() else 0.0
+
+    def before_send_transaction(self, event: dict, hint: dict) -> Optional[dict]:
+        trace = event.get("contexts", {}).get("trace", {})
+        if trace.get("status") not in (None, "ok"):
+            return event
+        try:
+            duration = _timestamp(event["timestamp"]) - _timestamp(event["start_timestamp"])
+        except (KeyError, TypeError, ValueError):
+            duration = 0
+        if duration >= self.slow_transaction_seconds:
+            return event
+        method = (event.get("request") or {}).get("method")
+        name = event.get("transaction") or ""
+        rate = self.rate_for("%s %s" % (method, name) if method else name)
+        traced_rate = max(rate, self.candidate_rate)
+        if traced_rate <= 0 or random.random() < rate / traced_rate:
+            return event
+        return None
+
+    def _ensure_refresher(self):
+        # started lazily and per process, threads do not survive gunicorn or celery forks
+        if self._refresher_pid == os.getpid() or not self.refresh_seconds:
+            return
+        self._refresher_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, name="trace-sampling-refresh", daemon=True).start()
+
+    def _refresh_loop(self):
+        from app.core.cache import get_sync_redis
+        while True:
+            try:
+                raw = get_sync_redis().get(SAMPLING_OVERRIDES_KEY)
+                # the key may have been written by hand, it gets the validation of the API
+                self.apply_overrides(TraceSamplingOverrides.parse_raw(raw).dict(exclude_none=True) if raw else None)
+            except Exception as exc:
+                logger.warning("Could not refresh trace sampling overrides: %s" % exc)
+            time.sleep(self.refresh_seconds)
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+trace_sampler = TraceSampler(
+    default_rate=settings.SENTRY_TRACES_SAMPLE_RATE,
+    rules=settings.SENTRY_TRACES_RULES,
+    candidate_rate=settings.SENTRY_TRACES_CANDIDATE_RATE,
+    slow_transaction_seconds=settings.SENTRY_SLOW_TRANSACTION_SECONDS,
+    max_traces_per_second=settings.SENTRY_MAX_TRACES_PER_SECOND,
+    refresh_seconds=settings.SENTRY_SAMPLING_REFRESH_SECONDS,
+)
@@ -0,0 +1,11 @@
+from uvicorn.workers import UvicornWorker
+
+__all__ = ['PerformanceUvicornWorker']
+
+
+class PerformanceUvicornWorker(UvicornWorker):
+    """
+    UvicornWorker pinned to uvloop and httptools. The default worker picks them when they are installed and
+    silently falls back to asyncio and h11 when not, this one fails at boot instead
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
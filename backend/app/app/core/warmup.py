@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import configure_mappers
+
+from app.core.cache import get_redis
+from app.core.health import _migration_revisions
+from app.providers.registry import providers
+
+__all__ = ['Warmup', 'warmup']
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup(object):
+    """
+    Pays the first request costs of a worker before it is reported ready: ORM mapper configuration, pooled
+    database connections, the redis connection pool and the outbound providers listed in WARMUP_PROVIDERS.
+    A provider with a warm_up coroutine has it awaited, e.g. the payment gateway fetches its token.
+    The Lua scripts of the request path are loaded into redis' script cache and the migration revisions
+    /readyz compares against are read from disk.
+
+    Runs in the background so the worker answers liveness probes meanwhile. A failed step is logged and
+    recorded and warm-up carries on, a provider outage must not keep workers unready
+    """
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.steps: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set()
+
+    def start(self, engine: AsyncEngine, db_connections: int, provider_names: List[str], timeout: float):
+        self.done = asyncio.Event()
+        self._task = asyncio.create_task(self._run(engine, db_connections, provider_names, timeout))
+
+    def skip(self):
+        self.done.set()
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def _step(self, name: str, coro):
+        started = time.monotonic()
+        try:
+            await coro
+        except Exception as exc:
+            self.errors[name] = repr(exc)
+            logger.warning("Warm-up step %s failed %s" % (name, exc))
+        finally:
+            self.steps[name] = round(time.monotonic() - started, 3)
+
+    async def _run(self, engine: AsyncEngine, db_connections: int, provider_names: List[str], timeout: float):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._warm_up(engine, db_connections, provider_names), timeout)
+        except asyncio.TimeoutError:
+            self.errors["timeout"] = "warm-up took longer than %ss" % timeout
+            logger.warning("Warm-up timed out after %ss, steps done %s" % (timeout, self.steps))
+        finally:
+            self.done.set()
+        logger.info("Warm-up finished in %.3fs steps %s errors %s" % (time.monotonic() - started, self.steps,
+                                                                     self.errors))
+
+    async def _warm_up(self, engine: AsyncEngine, db_connections: int, provider_names: List[str]):
+        # mapper configuration is pure CPU and runs on the first query otherwise
+        await self._step("mappers", _configure_mappers())
+        await asyncio.gather(
+            self._step("database", _open_connections(engine, db_connections)),
+            self._step("redis", get_redis().ping()),
+            self._step("redis_scripts", _load_scripts()),
+            self._step("migrations", _read_migration_revisions()),
+            *(self._step("provider:%s" % name, _warm_provider(name)) for name in provider_names),
+        )
+
+
+async def _configure_mappers():
+    configure_mappers()
+
+
+async def _open_connections(engine: AsyncEngine, count: int):
+    """
+    Checks out count connections at once so the pool opens them all, they go back to the pool when closed.
+    Counts above the pool size would only open overflow connections that are discarded right away
+    """
+    connections = [engine.connect() for _ in range(min(count, engine.pool.size()))]
+    try:
+        await asyncio.gather(*(connection.start() for connection in connections))
+        # the first statement on a connection also loads asyncpg's type introspection
+        await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+    finally:
+        await asyncio.gather(*(connection.close() for connection in connections if connection.sync_connection),
+                             return_exceptions=True)
+
+
+async def _load_scripts():
+    # EVAL compiles a script the first time a redis server sees it, SCRIPT LOAD does it ahead of the requests
+    from app.api.idempotency import _RELEASE_LOCK_SCRIPT
+    from app.api.rate_limit import _HIT_SCRIPT
+    from app.services.channel_management import _ADD_TO_FEED_SCRIPT
+
+    redis = get_redis()
+    await asyncio.gather(*(redis.script_load(script)
+                           for script in (_ADD_TO_FEED_SCRIPT, _HIT_SCRIPT, _RELEASE_LOCK_SCRIPT)))
+
+
+async def _read_migration_revisions():
+    # cached per process, the first /readyz would otherwise walk the migration scripts
+    await asyncio.get_running_loop().run_in_executor(None, _migration_revisions)
+
+
+async def _warm_provider(name: str):
+    # the import and construction of a provider can be slow, it runs off the event loop
+    provider = await asyncio.get_running_loop().run_in_executor(None, providers.get, name)
+    warm_up = getattr(provider, "warm_up", None)
+    if warm_up is not None:
+        await warm_up()
+
+
+warmup = Warmup()
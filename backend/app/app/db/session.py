@@ -1,4 +1,7 @@
+from functools import lru_cache
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
 from sqlalchemy.ext.asyncio import async_sessionmaker
@@ -6,8 +9,26 @@ from sqlalchemy.ext.asyncio import create_async_engine
 
 from app.core.config import settings
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-engine_aio = create_async_engine(settings.ASYNC_SQLALCHEMY_DATABASE_URI, echo=True)
+engine_aio = create_async_engine(settings.ASYNC_SQLALCHEMY_DATABASE_URI, echo=settings.SQLALCHEMY_ECHO,
+                                 pool_size=settings.SQLALCHEMY_POOL_SIZE, max_overflow=settings.SQLALCHEMY_MAX_OVERFLOW)
 async_session = async_sessionmaker(autoflush=False, bind=engine_aio, expire_on_commit=False)
+
+
+@lru_cache()
+def get_engine() -> Engine:
+    return create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+
+
+@lru_cache()
+def get_session_local() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def __getattr__(name):
+    # the sync engine and its driver are only needed by celery tasks and scripts, the API uses engine_aio.
+    # `from app.db.session import engine, SessionLocal` creates them on first import
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_local()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
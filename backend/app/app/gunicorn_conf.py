@@ -1,3 +1,4 @@
+import gc
 import json
 import multiprocessing
 import os
@@ -34,7 +35,19 @@ errorlog_var = os.getenv("ERROR_LOG", "-")
 use_errorlog = errorlog_var or None
 graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
 timeout_str = os.getenv("TIMEOUT", "120")
-keepalive_str = os.getenv("KEEP_ALIVE", "5")
+# "performance" preloads the app, recycles workers and keeps connections open longer, see below
+profile = os.getenv("GUNICORN_PROFILE", "default")
+performance = profile == "performance"
+keepalive_str = os.getenv("KEEP_ALIVE", "75" if performance else "5")
+backlog_str = os.getenv("BACKLOG", "2048")
+max_requests_str = os.getenv("MAX_REQUESTS", "10000" if performance else "0")
+max_requests_jitter_str = os.getenv("MAX_REQUESTS_JITTER", "1000" if performance else "0")
+preload_str = os.getenv("PRELOAD_APP", "true" if performance else "false")
+
+# every worker writes its prometheus samples here, /metrics on any worker reports the sum
+prometheus_multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+# created here rather than in on_starting, a preloaded app writes its first samples while it is imported
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -45,7 +58,17 @@ worker_tmp_dir = "/dev/shm"
 accesslog = use_accesslog
 graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
+# mobile clients reconnect slowly over TLS, keep idle connections past the usual 60s load balancer timeout
 keepalive = int(keepalive_str)
+backlog = int(backlog_str)
+# jitter keeps the workers from restarting together, max_requests 0 disables recycling
+max_requests = int(max_requests_str)
+max_requests_jitter = int(max_requests_jitter_str)
+preload_app = preload_str.lower() in ("1", "true", "yes")
+
+if preload_app:
+    # no collections while the app is imported in the master, objects allocated now are frozen in when_ready
+    gc.disable()
 
 
 # For debugging and testing
@@ -56,6 +79,10 @@ log_data = {
     "graceful_timeout": graceful_timeout,
     "timeout": timeout,
     "keepalive": keepalive,
+    "backlog": backlog,
+    "max_requests": max_requests,
+    "max_requests_jitter": max_requests_jitter,
+    "preload_app": preload_app,
     "errorlog": errorlog,
     "accesslog": accesslog,
     # Additional, non-gunicorn variables
@@ -63,5 +90,28 @@ log_data = {
     "use_max_workers": use_max_workers,
     "host": host,
     "port": port,
+    "profile": profile,
 }
-print(json.dumps(log_data))
\ No newline at end of file
+print(json.dumps(log_data))
+
+
+def when_ready(server):
+    if preload_app:
+        # moves the preloaded objects out of the collector's reach, gc passes in the workers then no longer
+        # write to their pages and the workers keep sharing them with the master
+        gc.freeze()
+        gc.enable()
+
+
+def on_starting(server):
+    # samples left over from a previous run would be summed into the new one
+    own_suffix = "_%s.db" % os.getpid()
+    for name in os.listdir(prometheus_multiproc_dir):
+        if not name.endswith(own_suffix):
+            os.remove(os.path.join(prometheus_multiproc_dir, name))
+
+
+def child_exit(server, worker):
+    from app.core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
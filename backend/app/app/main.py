@@ -1,50 +1,44 @@
 import logging
 import os
-import sys
-from functools import lru_cache
-from logging import config as logging_config
 from pathlib import Path
 
-import sentry_sdk
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
+from starlette.staticfiles import StaticFiles
 
 from app.api.api_v1.api import api_router
-from app.core.config import settings
+from app.api.deps import get_api_key
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings, FileUploaders
+from app.core.events import event_hub
+from app.core.health import health_checker
+from app.core.logs import RequestIdMiddleware, configure_logging
+from app.core.warmup import warmup
 from app.db.session import engine_aio
-
-
-@lru_cache()
-def get_logger() -> logging.Logger:
-    logging_file_path = os.path.join(
-        os.path.realpath(os.path.dirname(__file__)), "logging.conf"
-    )
-    logging_config.fileConfig(logging_file_path, disable_existing_loggers=False)
-    logger = logging.getLogger(__name__)
-    azure_logger = logging.getLogger("azure")
-    azure_logger.setLevel(logging.ERROR)
-
-    # Configure a console output
-    handler = logging.StreamHandler(stream=sys.stdout)
-    azure_logger.addHandler(handler)
-    logger.addHandler(handler)
-
-    return logger
+from app.providers.registry import providers
 
 
 # Setup logging
-logger = get_logger()
+configure_logging("api", level=settings.LOG_LEVEL, json_output=settings.LOG_JSON, sampling=settings.LOG_SAMPLING,
+                  queue_size=settings.LOG_QUEUE_SIZE)
+logging.getLogger("azure").setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
 
 if settings.SENTRY_DSN is not None:
+    import sentry_sdk
+    from app.core.tracing import trace_sampler
     sentry_sdk.init(
         dsn=settings.SENTRY_DSN,
-        traces_sample_rate=1.0,
+        traces_sampler=trace_sampler,
+        before_send_transaction=trace_sampler.before_send_transaction,
         environment=settings.environment
     )
 
-app = FastAPI(**settings.fastapi_kwargs)
+app = FastAPI(**settings.fastapi_kwargs,
+              default_response_class=ORJSONResponse if settings.FAST_SERIALIZATION else JSONResponse)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -57,12 +51,68 @@ if settings.BACKEND_CORS_ORIGIN:
         allow_headers=["*"],
     )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        content_types=settings.COMPRESSION_CONTENT_TYPES,
+    )
+
+if settings.METRICS_ENABLED:
+    from app.core.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render_metrics
+
+    app.add_middleware(MetricsMiddleware, pool=engine_aio.pool)
+
+    # route templates, pool state and provider errors are not public, scrapers send the API key
+    @app.get("/metrics", include_in_schema=False, dependencies=[Depends(get_api_key)])
+    def metrics():
+        # sync, reading the multiprocess files runs in the threadpool
+        return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+# outermost, so every log line of a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
+if settings.FILE_UPLOADER == FileUploaders.LOCAL:
+    # serve media saved by the LocalFileUploader, storage is S3 in production
+    os.makedirs(settings.LOCAL_UPLOAD_DIR, exist_ok=True)
+    app.mount(settings.LOCAL_UPLOAD_URL_PATH, StaticFiles(directory=settings.LOCAL_UPLOAD_DIR), name="media")
+
 
 @app.get("/health", tags=["health"])
 async def health():
     return "OK"
 
 
+@app.get("/livez", tags=["health"])
+async def livez():
+    # the event loop answers, dependencies are left to /readyz so an outage does not restart every worker
+    return {"status": "ok"}
+
+
+@app.get("/readyz", tags=["health"])
+async def readyz():
+    if not warmup.ready:
+        return JSONResponse({"status": "warming_up", "steps": warmup.steps}, status_code=503)
+    checks = await health_checker.run(engine_aio)
+    ready = all(result.ok for result in checks.values())
+    return JSONResponse({"status": "ready" if ready else "unavailable", "checks": checks},
+                        status_code=200 if ready else 503)
+
+
+@app.on_event("startup")
+async def startup():
+    if settings.WARMUP_ENABLED:
+        warmup.start(engine_aio, settings.WARMUP_DB_CONNECTIONS, settings.WARMUP_PROVIDERS,
+                     settings.WARMUP_TIMEOUT_SECONDS)
+    else:
+        warmup.skip()
+
+
 @app.on_event("shutdown")
 async def shutdown():
+    await warmup.stop()
+    await event_hub.close()
+    await providers.aclose()
     await engine_aio.dispose()
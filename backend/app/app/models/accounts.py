@@ -2,8 +2,9 @@ from datetime import datetime
 from typing import List
 from typing import Optional
 
-from sqlalchemy import ForeignKey, event
+from sqlalchemy import ForeignKey, Index, LargeBinary, event, func, literal_column
 from sqlalchemy import String
+from sqlalchemy.sql.elements import ColumnElement
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.engine.base import Connection
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
@@ -17,7 +18,7 @@ from app.db.base_class import Base, AuditColumns, generate_unique_str, AutoIdCol
 __all__ = ['ServiceAccount', "AccountKycVerificationStatus", "PaymentAccount", "User",
            "kyc_verification_status_before_insert", "user_before_insert", "service_account_before_insert",
            "UserActivationStatus", "user_activation_status_before_insert", 'UserAccountMembership', 'Address',
-           "Country", "AccountKycProfile", "UserLoginInfo"]
+           "Country", "AccountKycProfile", "UserLoginInfo", "phone_hash_expression"]
 
 
 class Country(Base, AutoIdColumns, AuditColumns):
@@ -86,6 +87,19 @@ class User(Base, AuditColumns):
         return 'IND%s' % self.user_no
 
 
+def phone_hash_expression(username) -> ColumnElement:
+    """
+    Hex sha256 of the E.164 number (+254712345678) a username (254712345678) stands for.
+    Constants are inlined so queries match the ix_users_phone_hash expression index
+    """
+    e164 = literal_column("'+'", String).concat(username)
+    return func.encode(func.sha256(e164.cast(LargeBinary)), literal_column("'hex'"))
+
+
+# the literal '+' hides the table from Index, attach it explicitly
+User.__table__.append_constraint(Index("ix_users_phone_hash", phone_hash_expression(User.__table__.c.username)))
+
+
 class UserAccountMembership(Base, AutoIdColumns):
     __table_name__ = "user_account_memberships"
     account_id: Mapped[str] = mapped_column(ForeignKey("service_accounts.account_id"), primary_key=True)
@@ -1,6 +1,6 @@
 from typing import List
 
-from sqlalchemy import Column, ForeignKey, String, Boolean
+from sqlalchemy import Column, ForeignKey, String, Boolean, Index, UniqueConstraint
 from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
@@ -30,6 +30,10 @@ class ChannelInvite(Base, AuditColumns, AutoIdColumns):
     - 3 accepted Invite accepted by user
     - 4 rejected User Rejected invite
     """
+    __table_args__ = (
+        # a number is invited once per channel, invites are inserted with ON CONFLICT DO NOTHING on it
+        UniqueConstraint("channel_id", "phone_number", name="uq_channel_invites_channel_phone"),
+    )
     channel_id: Mapped['str'] = mapped_column(ForeignKey('channels.id'))
     channel: Mapped['Channel'] = relationship(back_populates='channel_invites', lazy='joined')
     phone_number: Mapped['str'] = mapped_column(nullable=False)
@@ -38,12 +42,20 @@ class ChannelInvite(Base, AuditColumns, AutoIdColumns):
 
 
 class Channel(Base, AutoIdColumns, AuditColumns):
+    __table_args__ = tuple(
+        # trigram indexes for prefix and fuzzy channel search
+        Index("ix_channels_%s_trgm" % column, column, postgresql_using="gin",
+              postgresql_ops={column: "gin_trgm_ops"})
+        for column in ("name", "title", "code", "description")
+    )
     channel_no: Mapped[str] = mapped_column(nullable=False, index=True, unique=True)
     running_balance: Mapped[float] = mapped_column(nullable=False, default=0.0)
     link: Mapped[str | None] = mapped_column(nullable=True)
     code: Mapped[str] = mapped_column(nullable=False, unique=True)
     video_url: Mapped[str | None] = mapped_column(nullable=True)
     image_url: Mapped[str | None] = mapped_column(nullable=True)
+    image_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    image_variants = mapped_column(JSONB, nullable=True)
     description: Mapped[str] = mapped_column(nullable=False)
     title: Mapped[str] = mapped_column(nullable=False)
     name: Mapped[str] = mapped_column(nullable=False)
@@ -64,20 +76,29 @@ class Channel(Base, AutoIdColumns, AuditColumns):
 
 class ChannelParticipants(Base, AuditColumns):
     __tablename__ = 'channel_participants'
+    __table_args__ = (
+        # a user's channels, most recently joined first
+        Index("ix_channel_participants_user_joined", "user_id", "created_date_utc"),
+    )
     user_id: Mapped[str] = mapped_column(String(100), ForeignKey('users.user_id'), primary_key=True)
-    channel_id: Mapped[str] = mapped_column(String(100), ForeignKey('channels.id'), primary_key=True)
+    channel_id: Mapped[str] = mapped_column(String(100), ForeignKey('channels.id'), primary_key=True, index=True)
     is_admin = Column(Boolean, nullable=False, default=False)
     user: Mapped['User'] = relationship(lazy='selectin')
     # payment_requests: Mapped[List['PaymentRequest']] = relationship(lazy='joined')
 
 
 class PaymentRequest(Base, AuditColumns, AutoIdColumns):
+    __table_args__ = (
+        # reconciliation scans open requests oldest first
+        Index("ix_payment_requests_status_created", "request_status", "created_date_utc"),
+    )
     request_id: Mapped[str] = mapped_column(String(100), index=True, nullable=False, unique=True)
     payment_method: Mapped[str] = mapped_column(String(100))
     request_payload = mapped_column(JSONB, nullable=True)
     payment_request_result = mapped_column(JSONB, nullable=True)
     payment_callback_result = mapped_column(JSONB, nullable=True)
     request_status: Mapped[str] = mapped_column(String(100), index=True, nullable=False)
+    provider_reference: Mapped[str | None] = mapped_column(String(100), index=True, nullable=True)
     channel_id: Mapped[String] = mapped_column(ForeignKey("channels.id"))
     user_id: Mapped['String'] = mapped_column(ForeignKey("users.user_id"))
 
@@ -1,8 +1,37 @@
 import abc
 import asyncio
+import hashlib
+import hmac
+import os
+import shutil
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import AsyncIterator, BinaryIO, Optional
+from urllib.parse import urlencode
 
-import boto3
-from botocore.exceptions import NoCredentialsError
+from app.schemas.media import PresignedUpload, UploadMethod
+
+MB = 1024 * 1024
+
+
+class FileTooLargeError(Exception): pass
+
+
+def build_object_key(prefix: str, file_name: Optional[str]) -> str:
+    file_ext = os.path.splitext(file_name or "")[1]
+    return f"{prefix}/{uuid.uuid4()}{file_ext}"
+
+
+def get_file_size(file: BinaryIO) -> int:
+    """
+    Size of a seekable file object e.g. the spooled file behind an UploadFile. Leaves the cursor at the start
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
 
 
 class FileUploader(abc.ABC):
@@ -14,32 +43,258 @@ class FileUploader(abc.ABC):
         return cls._instances[cls]
 
     @abc.abstractmethod
-    async def save_file_async(self, file, file_name):
+    def save_file(self, file: BinaryIO, file_name: str, content_type: Optional[str] = None) -> Optional[str]:
+        """
+        Blocking upload of a file object to storage under file_name, returns its public url
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_file(self, file_name: str) -> bytes:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stored_file_size(self, file_name: str) -> Optional[int]:
+        """
+        Size in bytes of a stored file, None when it does not exist
+        """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def delete_file(self, file_name: str):
+        """
+        Removes a stored file, a file that does not exist is ignored
+        """
+        raise NotImplementedError
+
+    async def save_file_async(self, file: BinaryIO, file_name: str, content_type: Optional[str] = None,
+                              max_size: Optional[int] = None) -> Optional[str]:
+        """
+        Streams a file object to storage under file_name and returns its public url.
+        Raises FileTooLargeError when max_size is given and the file is larger
+        """
+        self.check_size(file, max_size)
+        return await asyncio.get_running_loop().run_in_executor(None, self.save_file, file, file_name, content_type)
+
+    async def get_stored_file_size(self, file_name: str) -> Optional[int]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.stored_file_size, file_name)
+
+    async def delete_file_async(self, file_name: str):
+        await asyncio.get_running_loop().run_in_executor(None, self.delete_file, file_name)
+
+    @abc.abstractmethod
+    async def create_presigned_upload(self, file_name: str, content_type: Optional[str] = None,
+                                      max_size: Optional[int] = None, expires_in: int = 900,
+                                      method: UploadMethod = UploadMethod.POST) -> PresignedUpload:
+        """
+        Issues a short-lived url the client can upload file_name to without going through the API
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_file_url(self, file_name: str) -> str:
+        raise NotImplementedError
+
+    @staticmethod
+    def check_size(file: BinaryIO, max_size: Optional[int]):
+        if max_size is None:
+            return
+        size = get_file_size(file)
+        if size > max_size:
+            raise FileTooLargeError("File is %s bytes, the limit is %s bytes" % (size, max_size))
+
 
 class S3FileUploader(FileUploader):
-    def __init__(self, bucket_name, access_key_id, secret_access_key, region_name):
+    """
+    Uploads straight from the (spooled) file object using boto3 managed transfers, files larger than the
+    multipart threshold are uploaded in parallel parts without being read fully into memory.
+    The boto3 client is created once per uploader and shared, boto3 clients are thread safe.
+    boto3 is imported when the first uploader is created, API workers that never touch S3 do not load it
+    """
+
+    def __init__(self, bucket_name, access_key_id, secret_access_key, region_name,
+                 multipart_threshold: int = 8 * MB, multipart_chunksize: int = 8 * MB, max_concurrency: int = 4):
+        from boto3.s3.transfer import TransferConfig
         self.bucket_name = bucket_name
         self.access_key_id = access_key_id
         self.secret_access_key = secret_access_key
         self.region_name = region_name
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client('s3',
+                                                aws_access_key_id=self.access_key_id,
+                                                aws_secret_access_key=self.secret_access_key,
+                                                region_name=self.region_name)
+        return self._client
 
-    async def save_file_async(self, file, file_name):
-        s3 = boto3.client('s3',
-                          aws_access_key_id=self.access_key_id,
-                          aws_secret_access_key=self.secret_access_key,
-                          region_name=self.region_name)
+    def get_file_url(self, file_name: str) -> str:
+        return f"https://{self.bucket_name}.s3.{self.region_name}.amazonaws.com/{file_name}"
+
+    def save_file(self, file, file_name, content_type=None):
+        from botocore.exceptions import NoCredentialsError
+        extra_args = {"ContentType": content_type} if content_type else None
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None,
-                s3.upload_fileobj,
-                file,
-                self.bucket_name,
-                file_name
-            )
-            return f"https://{self.bucket_name}.s3.{self.region_name}.amazonaws.com/{file_name}"
+            self.client.upload_fileobj(file, self.bucket_name, file_name, ExtraArgs=extra_args,
+                                       Config=self.transfer_config)
+            return self.get_file_url(file_name)
         except NoCredentialsError:
             return None
 
+    def read_file(self, file_name):
+        res = self.client.get_object(Bucket=self.bucket_name, Key=file_name)
+        return res["Body"].read()
+
+    def stored_file_size(self, file_name):
+        from botocore.exceptions import ClientError
+        try:
+            res = self.client.head_object(Bucket=self.bucket_name, Key=file_name)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return res["ContentLength"]
+
+    def delete_file(self, file_name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=file_name)
+
+    async def create_presigned_upload(self, file_name, content_type=None, max_size=None, expires_in=900,
+                                      method=UploadMethod.POST):
+        # signing is a local computation, no request is made to S3.
+        # A presigned PUT cannot limit the body size, oversized PUT uploads are deleted when they are completed
+        if method == UploadMethod.PUT:
+            params = {"Bucket": self.bucket_name, "Key": file_name}
+            headers = {}
+            if content_type:
+                params["ContentType"] = content_type
+                headers["Content-Type"] = content_type
+            url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+            return PresignedUpload(key=file_name, method=method, url=url, headers=headers,
+                                   file_url=self.get_file_url(file_name), expires_in=expires_in)
+        fields = {}
+        conditions = []
+        if content_type:
+            fields["Content-Type"] = content_type
+            conditions.append({"Content-Type": content_type})
+        if max_size:
+            conditions.append(["content-length-range", 1, max_size])
+        presigned = self.client.generate_presigned_post(self.bucket_name, file_name, Fields=fields,
+                                                        Conditions=conditions, ExpiresIn=expires_in)
+        return PresignedUpload(key=file_name, method=method, url=presigned["url"], fields=presigned["fields"],
+                               file_url=self.get_file_url(file_name), expires_in=expires_in)
+
+
+class LocalFileUploader(FileUploader):
+    """
+    Filesystem stand-in for S3FileUploader used in development and tests.
+    Files are written under base_dir and served from base_url. Presigned uploads are PUT to upload_url,
+    an API route that checks the HMAC signature before streaming the body to disk
+    """
+
+    def __init__(self, base_dir: str, base_url: str, upload_url: Optional[str] = None, secret_key: str = ""):
+        self.base_dir = os.path.abspath(base_dir)
+        self.base_url = base_url.rstrip("/")
+        self.upload_url = (upload_url or "").rstrip("/")
+        self._secret_key = secret_key.encode()
+
+    def get_file_path(self, file_name: str) -> str:
+        path = os.path.abspath(os.path.join(self.base_dir, file_name))
+        if os.path.commonpath([path, self.base_dir]) != self.base_dir:
+            raise ValueError("Invalid file name %s" % file_name)
+        return path
+
+    def get_file_url(self, file_name: str) -> str:
+        return f"{self.base_url}/{file_name}"
+
+    def save_file(self, file, file_name, content_type=None):
+        path = self.get_file_path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file, f, length=1 * MB)
+        return self.get_file_url(file_name)
+
+    def read_file(self, file_name):
+        with open(self.get_file_path(file_name), "rb") as f:
+            return f.read()
+
+    def stored_file_size(self, file_name):
+        try:
+            return os.path.getsize(self.get_file_path(file_name))
+        except FileNotFoundError:
+            return None
+
+    def delete_file(self, file_name):
+        try:
+            os.remove(self.get_file_path(file_name))
+        except FileNotFoundError:
+            pass
+
+    def sign(self, file_name: str, expires: int, max_size: Optional[int]) -> str:
+        msg = "%s:%s:%s" % (file_name, expires, max_size or "")
+        return hmac.new(self._secret_key, msg.encode(), hashlib.sha256).hexdigest()
+
+    def verify_signature(self, file_name: str, expires: int, max_size: Optional[int], signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(file_name, expires, max_size), signature)
+
+    async def create_presigned_upload(self, file_name, content_type=None, max_size=None, expires_in=900,
+                                      method=UploadMethod.POST):
+        # the local stand-in only accepts raw PUT bodies
+        expires = int(time.time()) + expires_in
+        query = {"expires": expires, "signature": self.sign(file_name, expires, max_size)}
+        if max_size:
+            query["max_size"] = max_size
+        headers = {"Content-Type": content_type} if content_type else {}
+        return PresignedUpload(key=file_name, method=UploadMethod.PUT,
+                               url="%s/%s?%s" % (self.upload_url, file_name, urlencode(query)),
+                               headers=headers, file_url=self.get_file_url(file_name), expires_in=expires_in)
+
+    async def save_stream_async(self, chunks: AsyncIterator[bytes], file_name: str,
+                                max_size: Optional[int] = None) -> str:
+        path = self.get_file_path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, open, path, "wb")
+        try:
+            async for chunk in chunks:
+                written += len(chunk)
+                if max_size is not None and written > max_size:
+                    raise FileTooLargeError("File exceeds the limit of %s bytes" % max_size)
+                await loop.run_in_executor(None, f.write, chunk)
+        except Exception:
+            f.close()
+            os.remove(path)
+            raise
+        f.close()
+        return self.get_file_url(file_name)
+
 
+@lru_cache()
+def get_configured_uploader() -> Optional[FileUploader]:
+    """
+    Uploader selected by settings.FILE_UPLOADER, shared by the API and celery workers.
+    Returns None when S3 is selected but not fully configured
+    """
+    from app.core.config import settings, FileUploaders
+    server_host = str(settings.SERVER_HOST).rstrip("/")
+    if settings.FILE_UPLOADER == FileUploaders.LOCAL:
+        return LocalFileUploader(base_dir=settings.LOCAL_UPLOAD_DIR,
+                                 base_url="%s%s" % (server_host, settings.LOCAL_UPLOAD_URL_PATH),
+                                 upload_url="%s%s/channels/media-uploads/local" % (server_host, settings.API_V1_STR),
+                                 secret_key=settings.SECRET_KEY)
+    params = [settings.S3_BUCKET_NAME, settings.S3_ACCESS_KEY_ID, settings.S3_SECRET_ACCESS_KEY,
+              settings.S3_REGION_NAME]
+    if any(param is None for param in params):
+        return None
+    return S3FileUploader(*params)
@@ -1,9 +1,9 @@
 import random
 
 import httpx
-from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
 
-from app.core.config import settings
+from app.core.config import settings, KycProviders
+from app.providers.retry_policy import RetryPolicy, RetryBudget
 from app.schemas.kyc_verification import UserKycData, UserKycVerificationProviderResult
 
 
@@ -20,6 +20,10 @@ class MockKycProvider(KycProviderBase):
         )
 
 
+iprs_retry_policy = RetryPolicy(name="iprs", max_attempts=3, base_delay=3, max_delay=10, deadline=30,
+                                retry_on=(httpx.TimeoutException,), budget=RetryBudget(ratio=0.2))
+
+
 class IprsKycProvider(KycProviderBase):
     _username = None
     _password = None
@@ -40,8 +44,7 @@ class IprsKycProvider(KycProviderBase):
         self._password = password
         self._username = username
 
-    @retry(stop=stop_after_attempt(3), wait=wait_random_exponential(multiplier=1, min=3, max=10), reraise=True,
-           retry=retry_if_exception_type(httpx.TimeoutException))
+    @iprs_retry_policy
     async def verify_user_kyc(self, id_number: str, first_name: str,
                               last_name: str) -> UserKycVerificationProviderResult:
         username = self._username
@@ -62,3 +65,9 @@ class IprsKycProvider(KycProviderBase):
                 return UserKycVerificationProviderResult(success=True, payload=res)
             else:
                 return UserKycVerificationProviderResult(success=False, errors=response.text)
+
+
+def get_kyc_provider() -> KycProviderBase:
+    if settings.KYC_PROVIDER == KycProviders.IPRS:
+        return IprsKycProvider.GET_INSTANCE()
+    return MockKycProvider()
@@ -4,7 +4,8 @@ from typing import List
 import httpx
 from pydantic import BaseModel
 
-from app.core.config import settings
+from app.core.config import settings, SmsProviders
+from app.providers.retry_policy import RetryPolicy, RetryBudget
 
 
 class SmsProvider(object):
@@ -32,6 +33,12 @@ class MockSmsProvider(SmsProvider):
 class SendSmsException(Exception): pass
 
 
+# only errors raised before the request reached the provider are retried, a retry after the provider may
+# have accepted the message would deliver the OTP twice
+sms_retry_policy = RetryPolicy(name="sms", max_attempts=4, base_delay=0.5, max_delay=5, deadline=20,
+                               retry_on=(httpx.ConnectError, httpx.ConnectTimeout), budget=RetryBudget(ratio=0.2))
+
+
 class AfrikasTalkingSms(SmsProvider):
     _api_key = None
     _shortcode = None
@@ -47,7 +54,7 @@ class AfrikasTalkingSms(SmsProvider):
 
     @classmethod
     def GET_INSTANCE(cls):
-        from app.core.config import settings
+        from app.core.config import settings, SmsProviders
         if cls.INSTANCE is None:
             cls.INSTANCE = cls(api_key=
                                settings.AT_APIKEY,
@@ -69,6 +76,7 @@ class AfrikasTalkingSms(SmsProvider):
     class Payload(BaseModel):
         SMSMessageData: 'SMSMessageData'
 
+    @sms_retry_policy
     async def send_sms_async(self, msg: str, phone_number: str):
         url = "https://api.africastalking.com/version1/messaging"
         headers = {
@@ -86,10 +94,13 @@ class AfrikasTalkingSms(SmsProvider):
             response = await client.post(url, headers=headers, data=data)
 
             # Process the response
-            if response.status_code == 200:
-                resp = self.Payload.parse_obj(response.json())
-            else:
+            if not response.is_success:
                 raise SendSmsException(response.text)
+            resp = self.Payload.parse_obj(response.json())
+
+
+AfrikasTalkingSms.SMSMessageData.update_forward_refs(Recipient=AfrikasTalkingSms.Recipient)
+AfrikasTalkingSms.Payload.update_forward_refs(SMSMessageData=AfrikasTalkingSms.SMSMessageData)
 
 
 class WhatsAppProvider(SmsProvider):
@@ -114,6 +125,7 @@ class WhatsAppProvider(SmsProvider):
                                phone_id=settings.WA_PHONE_ID)
         return cls.INSTANCE
 
+    @sms_retry_policy
     async def send_sms_async(self, msg: str, phone_number: str):
         req_body = dict(
             type="text",
@@ -132,7 +144,7 @@ class WhatsAppProvider(SmsProvider):
                 self._phone_id,
             )
             response = await client.post(url, json=req_body, headers=req_headers)
-            if response.status_code > 299:
+            if not response.is_success:
                 raise SendSmsException(response.text)
 
 
@@ -158,6 +170,7 @@ class BongaSmsProvider(SmsProvider):
                                service_id=settings.BONGA_SERVICE_ID)
         return cls.INSTANCE
 
+    @sms_retry_policy
     async def send_sms_async(self, msg: str, phone_number: str):
 
         payload = {
@@ -168,18 +181,18 @@ class BongaSmsProvider(SmsProvider):
             'MSISDN': phone_number,
             'serviceID': self._service_id
         }
-        files = []
         headers = {}
-        retry_count = 0
-        max_retries = 12
-        while True:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(self._url, headers=headers, data=payload)
-                response_text = response.text
-                if response.status_code < 299:
-                    break
-                elif retry_count < max_retries:
-                    retry_count += 1
-                    continue
-                else:
-                    raise SendSmsException(response_text)
+        async with httpx.AsyncClient() as client:
+            response = await client.post(self._url, headers=headers, data=payload)
+            if not response.is_success:
+                raise SendSmsException(response.text)
+
+
+def get_sms_provider() -> SmsProvider:
+    if settings.SMS_PROVIDER == SmsProviders.AT:
+        return AfrikasTalkingSms.GET_INSTANCE()
+    if settings.SMS_PROVIDER == SmsProviders.WA:
+        return WhatsAppProvider.GET_INSTANCE()
+    if settings.SMS_PROVIDER == SmsProviders.BONGA:
+        return BongaSmsProvider.GET_INSTANCE()
+    return MockSmsProvider()
@@ -1,12 +1,15 @@
+import asyncio
 import base64
 import enum
-from typing import Optional
+import time
+import weakref
+from typing import Optional, Union
 
 import httpx
 from pydantic import AnyHttpUrl
 from pydantic import BaseModel
-from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
 
+from app.providers.retry_policy import RetryPolicy, RetryBudget
 from app.schemas import payments
 
 
@@ -14,6 +17,23 @@ from app.schemas import payments
 class KcbPaymentGatewayClientException(Exception): pass
 
 
+class CyberSourceClientException(Exception):
+    pass
+
+
+# endregion
+
+# region retry policies
+kcb_retry_policy = RetryPolicy(name="kcb", max_attempts=3, base_delay=1, max_delay=10, deadline=30,
+                               retry_on=(KcbPaymentGatewayClientException,), budget=RetryBudget(ratio=0.1))
+cybersource_retry_policy = RetryPolicy(name="cybersource", max_attempts=3, base_delay=1, max_delay=10, deadline=30,
+                                       retry_on=(CyberSourceClientException,), budget=RetryBudget(ratio=0.1))
+
+
+CYBERSOURCE_SUCCESS_STATUSES = ("AUTHORIZED", "PENDING_SETTLEMENT", "SETTLED", "TRANSMITTED")
+CYBERSOURCE_FAILED_STATUSES = ("DECLINED", "FAILED", "INVALID_REQUEST", "REVERSED", "VOIDED")
+
+
 # endregion
 
 # region models
@@ -37,7 +57,7 @@ class StkPushResultResponse(BaseModel):
     MerchantRequestID: Optional[str]
     ResponseCode: Optional[str]
     CustomerMessage: Optional[str]
-    CheckoutRequestID: Optional[bool]
+    CheckoutRequestID: Optional[str]
     ResponseDescription: Optional[str]
 
 
@@ -60,6 +80,7 @@ class MakePaymentStatus(enum.Enum):
 class MakePaymentResult(BaseModel):
     provider_data: dict
     status: MakePaymentStatus
+    provider_reference: Optional[str] = None
 
 
 class CardPaymentRequest(BaseModel):
@@ -80,25 +101,64 @@ class CardPaymentResponse(BaseModel):
 class KcbPaymentGatewayClient:
     _base_url = "https://wso2-api-gateway-direct-kcb-wso2-gateway.apps.test.aro.kcbgroup.com"
     _token_endpoint = '/token'
+    # tokens are refreshed this long before KCB expires them
+    _token_expiry_margin = 60
+    _default_token_lifetime = 3600
 
     def __init__(self, client_id: str, client_secret: str, server_host: AnyHttpUrl):
         self.client_id = client_id
         self.client_secret = client_secret
         self.server_host = server_host
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        # connections are bound to their event loop, celery tasks run each task in a new one
+        self._clients = weakref.WeakKeyDictionary()
         KcbPaymentGatewayClient._instance = self
 
+    def _http_client(self) -> httpx.AsyncClient:
+        """
+        Client of the running event loop, keeps TLS connections to KCB open between calls
+        """
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = httpx.AsyncClient(timeout=5.0)
+        return client
+
+    async def aclose(self):
+        """
+        Closes the client of the running event loop, await it before the loop ends
+        """
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
     def _get_authorization_header(self) -> str:
         credentials = f"{self.client_id}:{self.client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
         return f"Basic {encoded_credentials}"
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_random_exponential(multiplier=1, max=10),
-        reraise=True,
-        retry=retry_if_exception_type(KcbPaymentGatewayClientException)
-    )
     async def generate_access_token(self) -> str:
+        """
+        Cached access token, a new one is requested when the cached one is about to expire
+        """
+        if self._access_token is None or time.monotonic() >= self._token_expires_at:
+            token, expires_in = await self._request_access_token()
+            self._access_token = token
+            self._token_expires_at = time.monotonic() + max(expires_in - self._token_expiry_margin, 0)
+        return self._access_token
+
+    def invalidate_access_token(self):
+        self._access_token = None
+
+    async def warm_up(self):
+        """
+        Fetches the access token, which also resolves KCB's host and opens a pooled connection to it
+        """
+        await self.generate_access_token()
+
+    @kcb_retry_policy
+    async def _request_access_token(self) -> tuple:
         auth_header = self._get_authorization_header()
 
         data = {
@@ -106,27 +166,21 @@ class KcbPaymentGatewayClient:
         }
         url = "%s%s" % (self._base_url, self._token_endpoint)
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post(
-                    url,
-                    params=data,
-                    headers={'Authorization': auth_header}
-                )
-
-                response.raise_for_status()
-                token_data = response.json()
-                if response.status_code > 299:
-                    raise KcbPaymentGatewayClientException("Could not obtain token %s" % response.text)
-                return token_data['access_token']
+            response = await self._http_client().post(
+                url,
+                params=data,
+                headers={'Authorization': auth_header}
+            )
+
+            response.raise_for_status()
+            token_data = response.json()
+            if response.status_code > 299:
+                raise KcbPaymentGatewayClientException("Could not obtain token %s" % response.text)
+            return token_data['access_token'], int(token_data.get('expires_in') or self._default_token_lifetime)
         except httpx.TimeoutException as exc:
             raise KcbPaymentGatewayClientException('Timeout when calling KCB %s' % exc)
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_random_exponential(multiplier=1, max=10),
-        reraise=True,
-        retry=retry_if_exception_type(KcbPaymentGatewayClientException)
-    )
+    @kcb_retry_policy
     async def stk_push_request(self, stk_push_request: STKPushRequest):
         access_token = await self.generate_access_token()
         headers = {
@@ -150,21 +204,47 @@ class KcbPaymentGatewayClient:
 
         # Make the API call to initiate the payment
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post('https://uat.buni.kcbgroup.com/mm/api/request/1.0.0/stkpush',
-                                             headers=headers,
-                                             json=payload)
-
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    raise KcbPaymentGatewayClientException('Payment failed.')
+            response = await self._http_client().post('https://uat.buni.kcbgroup.com/mm/api/request/1.0.0/stkpush',
+                                                      headers=headers,
+                                                      json=payload)
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 401:
+                # token revoked before its expiry, the retry fetches a new one
+                self.invalidate_access_token()
+            raise KcbPaymentGatewayClientException('Payment failed.')
         except httpx.TimeoutException as exc:
             raise KcbPaymentGatewayClientException('Timeout when calling KCB %s' % exc)
 
-
-class CyberSourceClientException(Exception):
-    pass
+    @kcb_retry_policy
+    async def stk_push_query(self, checkout_request_id: str) -> dict:
+        """
+        Status of an earlier STK push, used when its callback never arrived
+        """
+        access_token = await self.generate_access_token()
+        headers = {
+            'accept': 'application/json',
+            'routeCode': '207',
+            'operation': 'STKPushQuery',
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer %s' % access_token
+        }
+        try:
+            response = await self._http_client().post(
+                'https://uat.buni.kcbgroup.com/mm/api/request/1.0.0/stkpush/query',
+                headers=headers,
+                json={"checkoutRequestID": checkout_request_id})
+            if response.status_code == 401:
+                self.invalidate_access_token()
+                raise KcbPaymentGatewayClientException('STK push query unauthorized %s' % response.text)
+            if response.status_code > 499:
+                raise KcbPaymentGatewayClientException('STK push query failed %s' % response.text)
+            if response.status_code > 399:
+                raise Exception('Unable to query STK push %s' % response.text)
+            return response.json()
+        except httpx.TimeoutException as exc:
+            raise KcbPaymentGatewayClientException('Timeout when calling KCB %s' % exc)
 
 
 class CyberSourceClient:
@@ -172,12 +252,7 @@ class CyberSourceClient:
         self.api_key = api_key
         self.merchant_id = merchant_id
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_random_exponential(multiplier=1, max=10),
-        reraise=True,
-        retry=retry_if_exception_type(CyberSourceClientException)
-    )
+    @cybersource_retry_policy
     async def process_card_payment(self, payment_request: CardPaymentRequest) -> CardPaymentResponse:
         url = "https://api.cybersource.com/v2/payments"
 
@@ -210,6 +285,41 @@ class CyberSourceClient:
         except httpx.TimeoutException as exc:  # retry timeout exceptions
             raise CyberSourceClientException("Timeout error while processing card payment")
 
+    @cybersource_retry_policy
+    async def get_transaction_status(self, transaction_id: str) -> dict:
+        url = "https://api.cybersource.com/tss/v2/transactions/%s" % transaction_id
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(url, headers=headers)
+                if response.status_code > 499:
+                    raise CyberSourceClientException("Could not query transaction %s" % response.text)
+                if response.status_code > 399:
+                    raise Exception("Unable to query transaction %s" % response.text)
+                return response.json()
+        except httpx.TimeoutException:
+            raise CyberSourceClientException("Timeout error while querying transaction")
+
+
+def parse_stk_push_callback(data: dict) -> payments.PaymentCallback:
+    """
+    Parses an M-Pesa express (STK push) callback body
+    {"Body": {"stkCallback": {"CheckoutRequestID": ..., "ResultCode": 0, "CallbackMetadata": {"Item": [...]}}}}
+    """
+    callback = (data.get("Body") or {}).get("stkCallback")
+    if not callback or not callback.get("CheckoutRequestID"):
+        raise ValueError("Payload is not an STK push callback")
+    items = (callback.get("CallbackMetadata") or {}).get("Item") or []
+    metadata = {item.get("Name"): item.get("Value") for item in items}
+    succeeded = str(callback.get("ResultCode")) == StkPushResultStatus.success.value
+    return payments.PaymentCallback(
+        transaction_id=callback["CheckoutRequestID"],
+        request_id=metadata.get("AccountReference") or callback.get("AccountReference"),
+        status=payments.PaymentRequestStatuses.SUCCESS if succeeded else payments.PaymentRequestStatuses.FAILED,
+        receipt_number=metadata.get("MpesaReceiptNumber"),
+        payload=data
+    )
+
 
 class PaymentGatewayClient:
     _instance = None
@@ -254,8 +364,14 @@ class PaymentGatewayClient:
             )
         return cls._instance
 
+    async def warm_up(self):
+        await self._kcb_client.warm_up()
+
+    async def aclose(self):
+        await self._kcb_client.aclose()
+
     async def make_payment(self, request_id: str, req: payments.ContributionRequest) -> MakePaymentResult:
-        if req.payment_method == "CARD":
+        if req.payment_method == payments.PaymentMethods.CARD:
             # Make a card payment using CyberSource client
             card_payment_request = CardPaymentRequest(
                 card_number=req.card_details.card_number,
@@ -268,10 +384,11 @@ class PaymentGatewayClient:
             # Create and return the MakePaymentResult
             result = MakePaymentResult(
                 provider_data=card_payment_response.dict(),
-                status=MakePaymentStatus.SUCCESS
+                status=MakePaymentStatus.SUCCESS,
+                provider_reference=card_payment_response.transaction_id
             )
             return result
-        elif req.payment_method == "MPESA":
+        elif req.payment_method == payments.PaymentMethods.MPESA:
             # Make an stkpush request using KCB client
             stk_push_request = STKPushRequest(
                 phoneNumber=req.mpesa_details.account_number,
@@ -285,12 +402,52 @@ class PaymentGatewayClient:
             )
             stk_push_response = await self._kcb_client.stk_push_request(stk_push_request)
 
-            # Create and return the MakePaymentResult
-
+            # Create and return the MakePaymentResult, the outcome arrives later on the callback
+            checkout_request_id = (stk_push_response.get("response") or {}).get("CheckoutRequestID")
             result = MakePaymentResult(
-                provider_data=stk_push_response.dict(),
-                status=MakePaymentStatus.SUCCESS
+                provider_data=stk_push_response,
+                status=MakePaymentStatus.PENDING,
+                provider_reference=checkout_request_id
             )
             return result
         else:
             raise ValueError("Invalid payment method")
+
+    async def query_payment_status(self, payment_method: Union[str, payments.PaymentMethods],
+                                   provider_reference: str) -> MakePaymentResult:
+        """
+        Asks the provider for the outcome of a payment submitted earlier under provider_reference.
+        payment_method is the PaymentMethods value stored on the PaymentRequest or the enum itself
+        """
+        payment_method = payments.PaymentMethods(payment_method)
+        if payment_method == payments.PaymentMethods.CARD:
+            data = await self._cybersource_client.get_transaction_status(provider_reference)
+            status = str(data.get("status") or "").upper()
+            if status in CYBERSOURCE_SUCCESS_STATUSES:
+                result_status = MakePaymentStatus.SUCCESS
+            elif status in CYBERSOURCE_FAILED_STATUSES:
+                result_status = MakePaymentStatus.FAILED
+            else:
+                result_status = MakePaymentStatus.PENDING
+        elif payment_method == payments.PaymentMethods.MPESA:
+            data = await self._kcb_client.stk_push_query(provider_reference)
+            result_code = (data.get("response") or data).get("ResultCode")
+            if result_code is None:
+                # the customer has not answered the prompt yet
+                result_status = MakePaymentStatus.PENDING
+            elif str(result_code) == StkPushResultStatus.success.value:
+                result_status = MakePaymentStatus.SUCCESS
+            else:
+                result_status = MakePaymentStatus.FAILED
+        else:
+            raise ValueError("Invalid payment method")
+        return MakePaymentResult(provider_data=data, status=result_status, provider_reference=provider_reference)
+
+
+def get_payment_gateway_client() -> PaymentGatewayClient:
+    from app.core.config import settings
+    return PaymentGatewayClient.get_instance(kcb_client_id=settings.KCB_CLIENT_ID,
+                                             kcb_client_secret=settings.KCB_CLIENT_SECRET,
+                                             cybersource_api_key=settings.CYBERSOURCE_API_KEY,
+                                             cybersource_merchant_id=settings.CYBERSOURCE_MERCHANT_ID,
+                                             server_host=settings.SERVER_HOST)
@@ -0,0 +1,69 @@
+import asyncio
+import importlib
+import threading
+from typing import Any, Dict, List, Optional
+
+__all__ = ['ProviderRegistry', 'providers']
+
+
+class ProviderRegistry(object):
+    """
+    Providers looked up by name and created on first use. Provider modules pull in httpx, boto3, celery and
+    the vendor SDKs, registering them by "module:factory" path keeps those imports out of app.main so API
+    workers boot without them. The factory's result is shared for the life of the process
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, str] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: str):
+        if ":" not in factory:
+            raise ValueError("Provider factory must be a module:function path, got %s" % factory)
+        self._factories[name] = factory
+        self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                try:
+                    module_name, attribute = self._factories[name].split(":", 1)
+                except KeyError:
+                    raise LookupError("No provider registered as %s" % name)
+                self._instances[name] = getattr(importlib.import_module(module_name), attribute)()
+        return self._instances[name]
+
+    def reset(self, name: Optional[str] = None):
+        """
+        Drops created providers so the next get builds them again e.g. after settings change in tests
+        """
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    async def aclose(self):
+        """
+        Awaits the aclose coroutine of the created providers that have one e.g. to close pooled connections
+        at shutdown
+        """
+        closers = [provider.aclose() for provider in list(self._instances.values()) if hasattr(provider, "aclose")]
+        await asyncio.gather(*closers, return_exceptions=True)
+
+    @property
+    def loaded(self) -> List[str]:
+        return list(self._instances)
+
+
+providers = ProviderRegistry()
+providers.register("sms", "app.providers.messaging_provider:get_sms_provider")
+providers.register("kyc", "app.providers.kyc_providers:get_kyc_provider")
+providers.register("payment_gateway", "app.providers.payment_lib:get_payment_gateway_client")
+providers.register("file_uploader", "app.providers.file_uploders:get_configured_uploader")
+providers.register("celery", "app.core.celery_app:get_celery_app")
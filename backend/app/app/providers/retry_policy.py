@@ -0,0 +1,220 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type
+
+from app.core.metrics import count_provider_error, observe_provider_call
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['RetryPolicy', 'RetryBudget', 'RetryMetrics', 'RetryBudgetExhausted', 'DeadlineExceeded',
+           'deadline_scope', 'remaining_time', 'get_policy_metrics']
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("retry_deadline", default=None)
+
+
+class DeadlineExceeded(Exception): pass
+
+
+class RetryBudgetExhausted(Exception): pass
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float):
+    """
+    Bounds the total time spent (including retries) by every policy call made inside the block.
+    Nested scopes can only shorten the deadline, never extend it.
+    """
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(current, new_deadline)
+    token = _deadline.set(new_deadline)
+    try:
+        yield new_deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+class RetryBudget(object):
+    """
+    Caps retries to a ratio of the calls made within a sliding window so a failing provider
+    does not get hammered by every caller retrying at once.
+
+    Attributes:
+        ratio(float): maximum retries allowed as a fraction of first attempts in the window
+        min_retries(int): retries always permitted in a window, so low traffic can still retry
+        window_seconds(float): length of the sliding window
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window_seconds: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+        self._calls: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        for q in (self._calls, self._retries):
+            while q and q[0] < cutoff:
+                q.popleft()
+
+    def record_call(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._calls.append(now)
+
+    def try_acquire_retry(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = max(self.min_retries, int(len(self._calls) * self.ratio))
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryMetrics(object):
+    FIELDS = ("calls", "attempts", "retries", "successes", "failures", "budget_exhausted", "deadline_exceeded")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {f: 0 for f in self.FIELDS}
+        self.total_latency_seconds = 0.0
+
+    def incr(self, field: str, value: int = 1):
+        with self._lock:
+            self._counters[field] += value
+
+    def observe_latency(self, seconds: float):
+        with self._lock:
+            self.total_latency_seconds += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            res: Dict[str, Any] = dict(self._counters)
+            res["total_latency_seconds"] = self.total_latency_seconds
+        return res
+
+
+_policies: Dict[str, 'RetryPolicy'] = {}
+
+
+def get_policy_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: policy.metrics.snapshot() for name, policy in _policies.items()}
+
+
+class RetryPolicy(object):
+    """
+    Shared async retry policy for outbound provider calls.
+    - Exponential backoff with full jitter, slept with asyncio.sleep so the event loop is never blocked
+    - Per-provider retry budget, retries beyond the budget fail fast with the original error
+    - Deadline awareness, no retry is scheduled if its backoff would overrun the active deadline_scope
+    Policies are registered by name so metrics can be collected per provider.
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_attempts: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 10.0,
+                 retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+                 budget: Optional[RetryBudget] = None,
+                 deadline: Optional[float] = None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+        self.budget = budget if budget is not None else RetryBudget()
+        self.deadline = deadline
+        self.metrics = RetryMetrics()
+        _policies[name] = self
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Full jitter backoff for the given (1 based) attempt that just failed
+        """
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        if self.deadline is not None:
+            with deadline_scope(self.deadline):
+                return await self._call(fn, *args, **kwargs)
+        return await self._call(fn, *args, **kwargs)
+
+    async def _call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self.metrics.incr("calls")
+        self.budget.record_call()
+        started = time.monotonic()
+        attempt = 0
+        outcome = "failure"
+        try:
+            while True:
+                attempt += 1
+                self.metrics.incr("attempts")
+                left = remaining_time()
+                if left is not None and left <= 0:
+                    self.metrics.incr("deadline_exceeded")
+                    raise DeadlineExceeded("Deadline exceeded before calling %s" % self.name)
+                try:
+                    result = await fn(*args, **kwargs)
+                except self.retry_on as exc:
+                    count_provider_error(self.name, exc)
+                    if attempt >= self.max_attempts:
+                        self.metrics.incr("failures")
+                        raise
+                    delay = self.backoff(attempt)
+                    left = remaining_time()
+                    if left is not None and delay >= left:
+                        self.metrics.incr("deadline_exceeded")
+                        self.metrics.incr("failures")
+                        raise
+                    if not self.budget.try_acquire_retry():
+                        self.metrics.incr("budget_exhausted")
+                        self.metrics.incr("failures")
+                        logger.warning("Retry budget exhausted for %s, failing fast: %s" % (self.name, exc))
+                        raise
+                    self.metrics.incr("retries")
+                    logger.info("Retrying %s in %.2fs after attempt %s failed: %s" % (self.name, delay, attempt, exc))
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception as exc:
+                    count_provider_error(self.name, exc)
+                    self.metrics.incr("failures")
+                    raise
+                self.metrics.incr("successes")
+                outcome = "success"
+                return result
+        finally:
+            self.metrics.observe_latency(time.monotonic() - started)
+            observe_provider_call(self.name, outcome, time.monotonic() - started)
+
+    def __call__(self, fn: Callable[..., Awaitable[Any]]):
+        """
+        Use the policy as a decorator for coroutine functions and methods
+        """
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.call(fn, *args, **kwargs)
+
+        return wrapper
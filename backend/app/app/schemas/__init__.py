@@ -1,6 +1,7 @@
 from .activation_status import ActivationStatuses, UserActivationResult, PhoneVerificationCode, PhoneVerificationRequest
 from .channel import Channel, ChannelCreate, ChannelUpdate, UserChannelCreate, \
-    ChannelInviteIn, ChannelInviteCreate, ChannelInviteOut, InviteStatus
+    ChannelInviteIn, ChannelInviteCreate, ChannelInviteOut, InviteStatus, InvalidContact, ContactImportResult, \
+    ContactDiscoveryRequest, DiscoveredContact, ContactDiscoveryResult
 from .kyc_verification import KycVerificationStatus, KycVerificationState, KycVerificationResponse, \
     UserKycVerificationUpload, AccountKycVerificationStatusModel
 from .login import ResetPasswordRequest
@@ -9,4 +10,7 @@ from .otp import Otp, OtpVerificationStatus, OtpVerificationResponse
 from .token import Token, TokenPayload
 from .user import User, UserCreate, UserInDB, UserUpdate, UserAccountCreate, AddressCreate, UserLoginInfoCreate, \
     ServiceAccountInDBBase, KycProfile, UserAccount
-from .payments import PaymentMethods, Currencies, CardPaymentDetails, MpesaPaymentDetails, ContributionRequest, PaymentRequestStatuses
+from .payments import PaymentMethods, Currencies, CardPaymentDetails, MpesaPaymentDetails, ContributionRequest, PaymentRequestStatuses, \
+    PaymentCallback, PaymentStatus, PaymentAccepted
+from .media import MediaType, UploadMethod, MediaUploadRequest, PresignedUpload, MediaUploadComplete
+from .tracing import TraceSampling, TraceSamplingOverrides
@@ -1,11 +1,14 @@
-import re
 from enum import Enum
+from typing import Dict
 from typing import List
 from typing import Optional
 
 from pydantic import BaseModel
 from pydantic import validator
 
+from app.core.config import settings
+from app.core.contacts import normalize_phone_number
+
 
 class InviteStatus(str, Enum):
     PENDING = "pending"
@@ -19,20 +22,59 @@ class ChannelInviteCreate(BaseModel):
 
     @validator("phone_numbers", pre=True)
     def validate_phone_numbers(cls, v: List[str] | None = None):
+        """
+        Normalises the numbers to E.164 like contact imports so one number is invited once, repeats are dropped
+        """
         if v is None: return v
-        pattern = re.compile(r'^\s*(?:\+?(\d{1,3}))?[-. (]*(\d{3})[-. )]*(\d{3})[-. ]*(\d{4})(?: *x(\d+))?\s*$')
-        res = []
-        while True:
-            try:
-                i = v.pop()
-            except IndexError:
-                break
-            i = i.strip()
-            pattern_match = pattern.match(i)
-            if pattern_match is None:
+        res = {}
+        for i in v:
+            number = normalize_phone_number(i, settings.DEFAULT_PHONE_COUNTRY)
+            if number is None:
                 raise ValueError("Value must be a valid phone number")
-            res.append(i)
-        return res
+            res.setdefault(number, None)
+        return list(res)
+
+
+class InvalidContact(BaseModel):
+    row: int
+    value: str
+    reason: str
+
+
+class ContactImportResult(BaseModel):
+    invited: int = 0
+    duplicates: int = 0
+    already_participants: int = 0
+    already_invited: int = 0
+    invalid: int = 0
+    # the first invalid rows only, see invalid for the total
+    invalid_rows: List[InvalidContact] = []
+    # rows past CONTACT_IMPORT_MAX_ROWS were not read
+    truncated: bool = False
+
+
+class ContactDiscoveryRequest(BaseModel):
+    phone_numbers: List[str] = []
+    # hex sha256 of E.164 numbers (+254712345678)
+    phone_hashes: List[str] = []
+
+    @validator("phone_hashes", each_item=True)
+    def validate_phone_hash(cls, v: str):
+        return v.strip().lower()
+
+
+class DiscoveredContact(BaseModel):
+    # the number or hash as it was sent
+    contact: str
+    user_no: str
+    is_participant: bool
+    invite_status: Optional[InviteStatus] = None
+
+
+class ContactDiscoveryResult(BaseModel):
+    matches: List[DiscoveredContact] = []
+    # more contacts matched than CONTACT_DISCOVERY_MAX_MATCHES
+    truncated: bool = False
 
 
 class ChannelInviteIn(BaseModel):
@@ -92,6 +134,7 @@ class Channel(BaseModel):
     code: str
     video_url: str = None
     image_url: str = None
+    image_variants: Optional[Dict[str, str]] = None
     description: str
     title: str
     account_no: str
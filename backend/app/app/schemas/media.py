@@ -0,0 +1,48 @@
+from enum import Enum
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class MediaType(str, Enum):
+    IMAGE = "image"
+    VIDEO = "video"
+
+    @property
+    def prefix(self) -> str:
+        return "assets/%ss" % self.value
+
+
+class UploadMethod(str, Enum):
+    POST = "POST"
+    PUT = "PUT"
+
+
+class MediaUploadRequest(BaseModel):
+    media_type: MediaType
+    file_name: str
+    content_type: Optional[str] = None
+    method: UploadMethod = UploadMethod.POST
+
+
+class PresignedUpload(BaseModel):
+    """
+    Instructions for uploading a file straight to storage.
+    - POST: send a multipart form with `fields` followed by the file as the `file` field
+    - PUT: send the file as the raw request body with `headers`
+    """
+    key: str
+    method: UploadMethod
+    url: str
+    fields: Dict[str, str] = {}
+    headers: Dict[str, str] = {}
+    file_url: str
+    expires_in: int
+
+    class Config:
+        use_enum_values = True
+
+
+class MediaUploadComplete(BaseModel):
+    media_type: MediaType
+    key: str
@@ -1,5 +1,6 @@
 import enum
-from typing import Union
+from datetime import datetime
+from typing import Optional, Union
 
 import pydantic
 from pydantic import BaseModel, validator
@@ -48,3 +49,40 @@ class PaymentRequestStatuses(enum.Enum):
     PENDING = "PENDING"
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
+
+
+class PaymentCallback(BaseModel):
+    """
+    Provider neutral payment callback.
+    transaction_id is the provider reference used to deduplicate callbacks and match PaymentRequest.provider_reference
+    """
+    transaction_id: str
+    request_id: Optional[str] = None
+    status: PaymentRequestStatuses
+    receipt_number: Optional[str] = None
+    payload: dict
+
+    class Config:
+        use_enum_values = True
+
+
+class PaymentStatus(BaseModel):
+    request_id: str
+    request_status: PaymentRequestStatuses
+    payment_method: str
+    channel_id: str
+    user_id: str
+    last_edited_date_utc: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
+
+
+class PaymentAccepted(BaseModel):
+    request_id: str
+    request_status: PaymentRequestStatuses
+    status_url: str
+
+    class Config:
+        use_enum_values = True
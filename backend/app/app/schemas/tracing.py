@@ -0,0 +1,23 @@
+from typing import Dict, Optional
+
+from pydantic import BaseModel, confloat
+
+Rate = confloat(ge=0, le=1)
+
+
+class TraceSampling(BaseModel):
+    default_rate: float
+    rules: Dict[str, float]
+    candidate_rate: float
+    slow_transaction_seconds: float
+    max_traces_per_second: float
+
+
+class TraceSamplingOverrides(BaseModel):
+    default_rate: Optional[Rate] = None
+    # merged over SENTRY_TRACES_RULES
+    rules: Optional[Dict[str, Rate]] = None
+    candidate_rate: Optional[Rate] = None
+    slow_transaction_seconds: Optional[confloat(gt=0, allow_inf_nan=False)] = None
+    # per process, fractions trace one transaction every 1 / rate seconds and 0 stops tracing
+    max_traces_per_second: Optional[confloat(ge=0, allow_inf_nan=False)] = None
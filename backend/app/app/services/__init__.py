@@ -1,5 +1,6 @@
 from .channel_management import channel
 from .user_management import user, InvalidOtpError
+from .payment_management import payment, DuplicateCallbackError
 
 # For a new basic set of CRUD operations you could just do
 
@@ -26,7 +26,7 @@ class BaseService(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
-        _logger = logger or logging.getLogger(__name__)
+        self._logger = logger or logging.getLogger(__name__)
 
     async def get_by_kwargs(self, db: AsyncSession, opts: dict) -> Optional[ModelType]:
         query = select(self.model).filter_by(**opts)
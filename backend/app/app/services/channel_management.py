@@ -1,17 +1,88 @@
-from typing import List
+import asyncio
+import base64
+import functools
+import itertools
+import json
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, BinaryIO, List, Optional, Tuple
 
+import orjson
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import select
+from sqlalchemy import and_, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
+from redis import Redis
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
+from app.core.config import settings
+from app.core.contacts import iter_contact_numbers, normalize_phone_number
+from app.db.base_class import general_id_generator, generate_unique_str
 from app.models.accounts import User
 from app.models.channels import Channel, ChannelInvite, ChannelParticipants
-from app.providers.messaging_provider import SmsProvider
-from app.schemas.channel import ChannelCreate, ChannelUpdate, ChannelInviteCreate, ChannelInviteIn, InviteStatus
+from app.providers.registry import providers
+from app.schemas.channel import Channel as ChannelSchema
+from app.schemas.channel import ChannelCreate, ChannelUpdate, ChannelInviteCreate, ChannelInviteIn, InviteStatus, \
+    ContactImportResult, InvalidContact
 from app.services.base import BaseService
 
+if TYPE_CHECKING:
+    from app.providers.messaging_provider import SmsProvider
+
+
+CHANNEL_FEED_KEY = "channels:feed:%s"
+CHANNEL_SUMMARY_KEY = "channels:summary:%s"
+# marks a built feed so users without channels are not rebuilt on every read, scored below every join time
+FEED_BUILT_MARKER = "__built__"
+# fields that change without the summary being rewritten, e.g. the balance on every contribution.
+# They are left out of the cached summary and read from the channels table
+SUMMARY_LIVE_FIELDS = {"running_balance"}
+
+_ADD_TO_FEED_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('zadd', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+
+# trigram matching needs at least one full trigram, shorter queries only match prefixes
+MIN_FUZZY_QUERY_LENGTH = 3
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def encode_cursor(score: float, channel_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, channel_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        score, channel_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), str(channel_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# invite codes are drawn again for rows that hit an existing code
+INVITE_CODE_ATTEMPTS = 3
+
+
+def _take(rows, size: int) -> list:
+    return list(itertools.islice(rows, size))
+
+
+def _feed_score(joined_at: datetime) -> float:
+    return joined_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _cached_summary(summary: dict) -> bytes:
+    return orjson.dumps({k: v for k, v in summary.items() if k not in SUMMARY_LIVE_FIELDS})
+
 
 class ChannelService(BaseService[Channel, ChannelCreate, ChannelUpdate]):
     async def create_with_owner(
@@ -32,12 +103,160 @@ class ChannelService(BaseService[Channel, ChannelCreate, ChannelUpdate]):
         return results.scalars().unique().all()
 
     async def get_my_channels(
-            self, db: AsyncSession, *, user_id: int, skip: int = 0, limit: int = 100
+            self, db: AsyncSession, *, user_id: str, before: Optional[datetime] = None, limit: int = 100
     ) -> List[Channel]:
+        """
+        Channels user_id participates in, most recently joined first. Page with the join time of the last
+        channel as before
+        """
         stmt = select(self.model).join(ChannelParticipants).where(ChannelParticipants.user_id == user_id)
+        if before is not None:
+            stmt = stmt.where(ChannelParticipants.created_date_utc < before)
+        stmt = stmt.order_by(ChannelParticipants.created_date_utc.desc()).limit(limit)
         results = await db.execute(stmt)
         return results.scalars().unique().all()
 
+    async def search_channels(self, db: AsyncSession, user: User, query: str, limit: int = 20,
+                              cursor: Optional[str] = None, is_superuser: bool = False
+                              ) -> Tuple[List[Channel], Optional[str]]:
+        """
+        Channels whose name, title or code start with query or whose name, title, code or description are
+        similar to it, best matches first. Candidates come from the trigram GIN indexes and non superusers
+        only see channels they participate in. Returns the page and the cursor of the next one
+        """
+        query = query.strip()
+        prefix = _escape_like(query) + "%"
+        conditions = [Channel.name.ilike(prefix), Channel.title.ilike(prefix), Channel.code.ilike(prefix)]
+        if len(query) >= MIN_FUZZY_QUERY_LENGTH:
+            conditions += [Channel.name.op("%")(query), Channel.title.op("%")(query), Channel.code.op("%")(query),
+                           Channel.description.op("%>")(query)]
+            score = func.greatest(func.similarity(Channel.name, query), func.similarity(Channel.title, query),
+                                  func.similarity(Channel.code, query),
+                                  func.word_similarity(query, Channel.description))
+        else:
+            score = literal(1.0)
+        score = score.label("score")
+        stmt = select(Channel, score).where(or_(*conditions))
+        if not is_superuser:
+            stmt = stmt.where(exists().where(ChannelParticipants.channel_id == Channel.id,
+                                             ChannelParticipants.user_id == user.user_id))
+        if cursor is not None:
+            last_score, last_id = decode_cursor(cursor)
+            stmt = stmt.where(or_(score < last_score, and_(score == last_score, Channel.id > last_id)))
+        stmt = stmt.order_by(score.desc(), Channel.id).limit(limit)
+        rows = (await db.execute(stmt)).unique().all()
+        channels = [row[0] for row in rows]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id) if len(rows) == limit else None
+        return channels, next_cursor
+
+    # region channel feed
+    async def get_channel_feed(self, db: AsyncSession, redis: aioredis.Redis, user_id: str,
+                               cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+        """
+        Channel summaries (schemas.Channel dicts) of the channels user_id joined, most recent first, and the
+        cursor of the next page. Reads the materialised feed, built from the
+        (user_id, created_date_utc) index the first time.
+        Channels joined at the same time are ordered by id descending, the cursor holds both
+        """
+        key = CHANNEL_FEED_KEY % user_id
+        if not await redis.exists(key):
+            await self._build_feed(db, redis, user_id)
+        if cursor is None:
+            entries = await redis.zrevrangebyscore(key, "+inf", 0, start=0, num=limit, withscores=True)
+        else:
+            last_score, last_id = decode_cursor(cursor)
+            # zrevrangebyscore orders ties by member descending, finish the tie of the last page first
+            tied = await redis.zrevrangebyscore(key, last_score, last_score, withscores=True)
+            entries = [entry for entry in tied if entry[0] < last_id][:limit]
+            if len(entries) < limit:
+                entries += await redis.zrevrangebyscore(key, "(%r" % last_score, 0, start=0,
+                                                        num=limit - len(entries), withscores=True)
+        channel_ids = [channel_id for channel_id, _ in entries]
+        summaries = await self.get_channel_summaries(db, redis, channel_ids)
+        next_cursor = encode_cursor(entries[-1][1], entries[-1][0]) if len(entries) == limit else None
+        return [summaries[c] for c in channel_ids if c in summaries], next_cursor
+
+    async def _build_feed(self, db: AsyncSession, redis: aioredis.Redis, user_id: str):
+        rows = await db.execute(
+            select(ChannelParticipants.channel_id, ChannelParticipants.created_date_utc)
+            .where(ChannelParticipants.user_id == user_id)
+        )
+        mapping = {channel_id: _feed_score(joined_at) for channel_id, joined_at in rows}
+        mapping[FEED_BUILT_MARKER] = -1
+        key = CHANNEL_FEED_KEY % user_id
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.zadd(key, mapping)
+            pipe.expire(key, settings.CHANNEL_FEED_TTL_SECONDS)
+            await pipe.execute()
+
+    async def get_channel_summaries(self, db: AsyncSession, redis: aioredis.Redis,
+                                    channel_ids: List[str]) -> dict:
+        """
+        schemas.Channel dicts by channel id. The cached part is combined with SUMMARY_LIVE_FIELDS read by
+        primary key, channels that no longer exist are left out
+        """
+        if not channel_ids:
+            return {}
+        cached = await redis.mget([CHANNEL_SUMMARY_KEY % c for c in channel_ids])
+        summaries = {c: orjson.loads(raw) for c, raw in zip(channel_ids, cached) if raw is not None}
+        missing = [c for c in channel_ids if c not in summaries]
+        live = {}
+        if summaries:
+            res = await db.execute(select(Channel.id, *(getattr(Channel, f) for f in SUMMARY_LIVE_FIELDS))
+                                   .where(Channel.id.in_(list(summaries))))
+            live = {row.id: row._asdict() for row in res}
+        if missing:
+            res = await db.execute(select(Channel).where(Channel.id.in_(missing)))
+            loaded = {c.id: ChannelSchema.from_orm(c).dict() for c in res.scalars().unique()}
+            if loaded:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for channel_id, summary in loaded.items():
+                        pipe.set(CHANNEL_SUMMARY_KEY % channel_id, _cached_summary(summary),
+                                 ex=settings.CHANNEL_SUMMARY_TTL_SECONDS)
+                    await pipe.execute()
+            summaries.update(loaded)
+            live.update(loaded)
+        return {c: dict(summary, **{f: live[c][f] for f in SUMMARY_LIVE_FIELDS})
+                for c, summary in summaries.items() if c in live}
+
+    async def add_to_feed(self, redis: aioredis.Redis, participant: ChannelParticipants):
+        # feeds that are not built yet pick the channel up when they are
+        await redis.eval(_ADD_TO_FEED_SCRIPT, 1, CHANNEL_FEED_KEY % participant.user_id,
+                         _feed_score(participant.created_date_utc), participant.channel_id)
+
+    async def remove_from_feed(self, redis: aioredis.Redis, user_id: str, channel_id: str):
+        await redis.zrem(CHANNEL_FEED_KEY % user_id, channel_id)
+
+    async def cache_channel_summary(self, redis: aioredis.Redis, channel_obj: Channel):
+        await redis.set(CHANNEL_SUMMARY_KEY % channel_obj.id,
+                        _cached_summary(ChannelSchema.from_orm(channel_obj).dict()),
+                        ex=settings.CHANNEL_SUMMARY_TTL_SECONDS)
+
+    def invalidate_channel_summary_sync(self, redis: Redis, channel_id: str):
+        redis.delete(CHANNEL_SUMMARY_KEY % channel_id)
+
+    # endregion
+
+    async def remove_participant(self, db: AsyncSession, channel_obj: Channel, user: User):
+        """
+        Removes user from the channel, the last admin of a channel cannot leave it
+        """
+        participant = await db.get(ChannelParticipants, (user.user_id, channel_obj.id))
+        if participant is None:
+            raise HTTPException(status_code=404, detail="User is not a participant of the channel")
+        if participant.is_admin:
+            admins = await db.execute(
+                select(func.count()).select_from(ChannelParticipants).where(
+                    ChannelParticipants.channel_id == channel_obj.id,
+                    ChannelParticipants.is_admin == True
+                )
+            )
+            if admins.scalar() <= 1:
+                raise HTTPException(status_code=400, detail="The last admin cannot leave the channel")
+        await db.delete(participant)
+        await db.commit()
+
     async def user_is_channel_admin(self, db: AsyncSession, channel_obj: Channel, user: User):
         query = select(Channel).join(ChannelParticipants).where(
             Channel.channel_no == channel_obj.channel_no,
@@ -47,6 +266,39 @@ class ChannelService(BaseService[Channel, ChannelCreate, ChannelUpdate]):
         result = await db.execute(query)
         return result.scalar() is not None
 
+    async def get_channel_version(self, db: AsyncSession, channel_no: str, user_id: str) -> Optional[tuple]:
+        """
+        Cheap version of the channel payload: the channel row, its participants and their users aggregated in
+        one query, followed by whether user_id participates, their role and account status.
+        None when the channel does not exist
+        """
+        participant_user = aliased(User)
+        viewer_role = select(User.user_role).where(User.user_id == user_id).scalar_subquery()
+        viewer_status = select(User.user_account_status).where(User.user_id == user_id).scalar_subquery()
+        stmt = select(
+            Channel.id,
+            func.coalesce(Channel.last_edited_date_utc, Channel.created_date_utc),
+            func.count(ChannelParticipants.user_id),
+            func.max(func.coalesce(ChannelParticipants.last_edited_date_utc, ChannelParticipants.created_date_utc)),
+            func.max(func.coalesce(participant_user.last_edited_date_utc, participant_user.created_date_utc)),
+            func.coalesce(func.bool_or(ChannelParticipants.user_id == user_id), False),
+            viewer_role,
+            viewer_status,
+        ).select_from(Channel).outerjoin(
+            ChannelParticipants, ChannelParticipants.channel_id == Channel.id
+        ).outerjoin(
+            participant_user, participant_user.user_id == ChannelParticipants.user_id
+        ).where(Channel.channel_no == channel_no).group_by(Channel.id)
+        row = (await db.execute(stmt)).first()
+        return tuple(row) if row is not None else None
+
+    def version_allows_read(self, version: tuple) -> bool:
+        """
+        Whether the viewer of a get_channel_version result may read the channel
+        """
+        is_participant, user_role, user_account_status = version[-3:]
+        return (user_account_status or 0) > 1 and (is_participant or user_role == 10)
+
     async def get_channel_by_no(self, db: AsyncSession, channel_no: str) -> Channel:
         channel_query = await db.execute(
             select(self.model).where(
@@ -55,42 +307,185 @@ class ChannelService(BaseService[Channel, ChannelCreate, ChannelUpdate]):
         )
         return channel_query.scalar()
 
-    async def create_channel_invites(self, db: AsyncSession, db_obj: Channel, data_in: ChannelInviteCreate, user: User):
-        invites = [
-            ChannelInvite(
-                **ChannelInviteIn(channel_id=db_obj.id,
-                                  phone_number=phone_number,
-                                  invite_status=InviteStatus.PENDING,
-                                  created_by=user.user_id,
-                                  last_edited_by=user.user_id).dict()
-            ) for phone_number in data_in.phone_numbers
-        ]
-        res = []
-        try:
-            while True:
-                try:
-                    invite = invites.pop()
-                except IndexError as exc:
-                    break
-                invite.channel = db_obj
-                db.add(invite)
-                # await db.refresh(invite)
-                res.append(invite)
-            await db.commit()
-        except IntegrityError as exc:
+    async def create_channel_invites(self, db: AsyncSession, db_obj: Channel, data_in: ChannelInviteCreate,
+                                     user: User) -> List[ChannelInvite]:
+        """
+        Creates pending invites for the numbers of data_in, numbers already invited to the channel are skipped.
+        Returns the invites created
+        """
+        created = await self._insert_invites(db, db_obj, user, data_in.phone_numbers)
+        if created is None:
             await db.rollback()
             raise HTTPException(status_code=400, detail="Duplicate invite code detected.")
-        finally:
-            await db.flush()
-        return res
+        await db.commit()
+        if not created:
+            return []
+        res = await db.execute(select(ChannelInvite).where(ChannelInvite.id.in_([i for i, _ in created])))
+        return list(res.scalars().unique())
 
-    async def send_invites_to_users(self, db: AsyncSession, sms_app: SmsProvider, channel_obj: Channel,
+    async def import_contact_invites(self, db: AsyncSession, channel_obj: Channel, user: User, file: BinaryIO,
+                                     vcard: bool = False) -> ContactImportResult:
+        """
+        Creates pending invites for every new number in a CSV or vCard contact file.
+        The file is parsed in a worker thread one batch at a time and each batch is checked against existing
+        invites and participants with two set based queries, then inserted with a single statement
+        """
+        result = ContactImportResult()
+        seen = set()
+        rows = iter_contact_numbers(file, vcard=vcard)
+        loop = asyncio.get_running_loop()
+        read = 0
+        while True:
+            size = min(settings.CONTACT_IMPORT_BATCH_SIZE, settings.CONTACT_IMPORT_MAX_ROWS - read)
+            chunk = await loop.run_in_executor(None, _take, rows, size) if size > 0 else []
+            if not chunk:
+                break
+            read += len(chunk)
+            numbers = []
+            for row_no, raw in chunk:
+                number = normalize_phone_number(raw, settings.DEFAULT_PHONE_COUNTRY)
+                if number is None:
+                    result.invalid += 1
+                    if len(result.invalid_rows) < settings.CONTACT_IMPORT_MAX_REPORTED_INVALID:
+                        result.invalid_rows.append(InvalidContact(row=row_no, value=raw[:64],
+                                                                  reason="Invalid phone number"))
+                elif number in seen:
+                    result.duplicates += 1
+                else:
+                    seen.add(number)
+                    numbers.append(number)
+            if numbers:
+                await self._insert_new_invites(db, channel_obj, user, numbers, result)
+        # a row left over means the file was cut at CONTACT_IMPORT_MAX_ROWS
+        result.truncated = read >= settings.CONTACT_IMPORT_MAX_ROWS and bool(
+            await loop.run_in_executor(None, _take, rows, 1))
+        return result
+
+    async def _insert_new_invites(self, db: AsyncSession, channel_obj: Channel, user: User, numbers: List[str],
+                                  result: ContactImportResult):
+        invited_query = await db.execute(
+            select(ChannelInvite.phone_number).where(
+                ChannelInvite.channel_id == channel_obj.id,
+                ChannelInvite.phone_number.in_(numbers)
+            )
+        )
+        invited = set(invited_query.scalars())
+        # usernames are stored without the leading +
+        participants_query = await db.execute(
+            select(User.username).join(ChannelParticipants, ChannelParticipants.user_id == User.user_id).where(
+                ChannelParticipants.channel_id == channel_obj.id,
+                User.username.in_([number[1:] for number in numbers])
+            )
+        )
+        participants = {"+%s" % username for username in participants_query.scalars()}
+        result.already_invited += len(invited)
+        result.already_participants += len(participants - invited)
+        pending = [number for number in numbers if number not in invited and number not in participants]
+
+        created = await self._insert_invites(db, channel_obj, user, pending)
+        if created is None:
+            await db.rollback()
+            self._logger.error("Could not draw unique invite codes for %s contacts of channel %s"
+                               % (len(pending), channel_obj.channel_no))
+            return
+        await db.commit()
+        result.invited += len(created)
+        # invited by a concurrent request since the lookup above
+        result.already_invited += len(pending) - len(created)
+
+    async def _insert_invites(self, db: AsyncSession, channel_obj: Channel, user: User,
+                              numbers: List[str]) -> Optional[List[Tuple[str, str]]]:
+        """
+        Inserts pending invites for numbers with a single statement, numbers already invited to the channel
+        are skipped by the (channel_id, phone_number) unique constraint. Returns (id, phone_number) of the
+        invites created, None when no unique invite codes could be drawn
+        """
+        if not numbers:
+            return []
+        # Core inserts skip the ORM before_insert events, ids and invite codes are set here
+        now = datetime.utcnow()
+        table = ChannelInvite.__table__
+        for _ in range(INVITE_CODE_ATTEMPTS):
+            values = [dict(id=generate_unique_str(), channel_id=channel_obj.id, phone_number=number,
+                           invite_code=general_id_generator(size=6), invite_status=InviteStatus.PENDING.value,
+                           created_by=user.user_id, last_edited_by=user.user_id, created_date_utc=now,
+                           last_edited_date_utc=now, is_deleted=False)
+                      for number in numbers]
+            try:
+                # an invite code collision fails the statement, the savepoint keeps the transaction usable
+                async with db.begin_nested():
+                    res = await db.execute(
+                        insert(table).values(values)
+                        .on_conflict_do_nothing(index_elements=["channel_id", "phone_number"])
+                        .returning(table.c.id, table.c.phone_number)
+                    )
+                    return [tuple(row) for row in res]
+            except IntegrityError as exc:
+                self._logger.warning("Invite code collision for channel %s, drawing new codes: %s"
+                                     % (channel_obj.channel_no, exc))
+        return None
+
+    async def schedule_invite_delivery(self, channel_obj: Channel):
+        """
+        Queue the SMS delivery of a channel's pending invites
+        """
+        try:
+            # publishing to the broker is blocking, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(providers.get("celery").send_task,
+                                  "app.tasks.channels.send_pending_channel_invites", args=[channel_obj.id])
+            )
+        except Exception as exc:
+            self._logger.error("Could not queue invite delivery for channel %s: %s" % (channel_obj.channel_no, exc))
+
+    async def get_contact_states(self, db: AsyncSession, channel_obj: Channel, user_ids: List[str],
+                                 phone_numbers: List[str]) -> Tuple[set, dict]:
+        """
+        Participants among user_ids and the latest invite status of each of phone_numbers in the channel
+        """
+        participants_query = await db.execute(
+            select(ChannelParticipants.user_id).where(
+                ChannelParticipants.channel_id == channel_obj.id,
+                ChannelParticipants.user_id.in_(user_ids)
+            )
+        )
+        invites_query = await db.execute(
+            select(ChannelInvite.phone_number, ChannelInvite.invite_status).where(
+                ChannelInvite.channel_id == channel_obj.id,
+                ChannelInvite.phone_number.in_(phone_numbers)
+            ).order_by(ChannelInvite.created_date_utc)
+        )
+        return set(participants_query.scalars()), {number: status for number, status in invites_query.all()}
+
+    def invite_message(self, channel_obj: Channel, invite_code: str) -> str:
+        return f"You are invited to join the {channel_obj.name}." \
+               f" On ChangaChanga. Invitation code: {invite_code}"
+
+    async def deliver_invites(self, sms_app: "SmsProvider", channel_obj: Channel,
+                              invites: List[Tuple[str, str, str]], concurrency: int) -> List[str]:
+        """
+        Sends (id, phone number, invite code) invites concurrently, returns the ids of the delivered invites
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def deliver(invite_id: str, phone_number: str, invite_code: str) -> Optional[str]:
+            async with semaphore:
+                try:
+                    await sms_app.send_sms_async(self.invite_message(channel_obj, invite_code), phone_number)
+                    return invite_id
+                except Exception as exc:
+                    self._logger.error("Failed to send invite to %s: %s" % (phone_number, exc))
+                    return None
+
+        delivered = await asyncio.gather(*(deliver(*invite) for invite in invites))
+        return [invite_id for invite_id in delivered if invite_id is not None]
+
+    async def send_invites_to_users(self, db: AsyncSession, sms_app: "SmsProvider", channel_obj: Channel,
                                     invites: List[ChannelInvite]):
         for invite in invites:
             try:
-                sms_message = f"You are invited to join the {channel_obj.name}." \
-                              f" On ChangaChanga. Invitation code: {invite.invite_code}"
-                await sms_app.send_sms_async(sms_message, invite.phone_number)
+                await sms_app.send_sms_async(self.invite_message(channel_obj, invite.invite_code), invite.phone_number)
 
                 invite.invite_status = InviteStatus.SENT.value  # Set invite_status to "sent"
                 db.add(invite)
@@ -107,5 +502,19 @@ class ChannelService(BaseService[Channel, ChannelCreate, ChannelUpdate]):
         res = user in [p.user for p in channel.participants]
         return res
 
+    async def schedule_image_processing(self, channel_obj: Channel, image_key: str):
+        """
+        Queue thumbnail and web variant generation for a newly uploaded channel image
+        """
+        try:
+            # publishing to the broker is blocking, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(providers.get("celery").send_task, "app.tasks.media.process_channel_image",
+                                  args=[channel_obj.id, image_key])
+            )
+        except Exception as exc:
+            self._logger.error("Could not queue image processing for channel %s: %s" % (channel_obj.channel_no, exc))
+
 
 channel = ChannelService(Channel)
@@ -0,0 +1,378 @@
+import asyncio
+import functools
+import time
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis import asyncio as aioredis
+from sqlalchemy import bindparam, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.events import channel_topic, payment_topic, publish_event, publish_event_sync
+from app.models.channels import PaymentRequest
+from app.providers.registry import providers
+from app.schemas.payments import ContributionRequest, PaymentCallback, PaymentRequestStatuses, PaymentStatus
+from app.services.base import BaseService
+
+if TYPE_CHECKING:
+    from app.providers.payment_lib import PaymentGatewayClient
+
+CALLBACK_QUEUE_KEY = "payments:callbacks:queue"
+CALLBACK_DEDUP_KEY = "payments:callbacks:seen:%s"
+CALLBACK_DRAIN_SCHEDULED_KEY = "payments:callbacks:drain-scheduled"
+CALLBACK_DEDUP_TTL_SECONDS = 60 * 60 * 24 * 3
+CALLBACK_PROCESSING_KEY = "payments:callbacks:processing:%s"
+CALLBACK_PROCESSING_INDEX_KEY = "payments:callbacks:processing"
+# a claimed batch not acknowledged within this time belongs to a dead worker and goes back to the queue
+CALLBACK_PROCESSING_TIMEOUT_SECONDS = 300
+PAYMENT_STATUS_KEY = "payments:status:%s"
+PAYMENT_STATUS_EVENT = "payment.status"
+OPEN_PAYMENT_STATUSES = [PaymentRequestStatuses.INITIATED.value, PaymentRequestStatuses.PENDING.value]
+RECONCILE_STATS_KEY = "payments:reconcile:stats"
+
+# moves up to ARGV[1] callbacks from the head of the queue to a processing list registered in the index
+_CLAIM_CALLBACKS_SCRIPT = """
+local items = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items == 0 then
+    return items
+end
+redis.call('ltrim', KEYS[1], #items, -1)
+redis.call('rpush', KEYS[2], unpack(items))
+redis.call('zadd', KEYS[3], ARGV[2], ARGV[3])
+return items
+"""
+
+# puts a processing list back at the head of the queue in its original order
+_REQUEUE_CALLBACKS_SCRIPT = """
+local items = redis.call('lrange', KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('lpush', KEYS[1], items[i])
+end
+redis.call('del', KEYS[2])
+redis.call('zrem', KEYS[3], ARGV[1])
+return #items
+"""
+
+
+class DuplicateCallbackError(Exception): pass
+
+
+class PaymentService(BaseService[PaymentRequest, ContributionRequest, ContributionRequest]):
+    # region status cache
+    def status_of(self, payment_request: PaymentRequest) -> PaymentStatus:
+        return PaymentStatus.from_orm(payment_request)
+
+    async def cache_status(self, redis: aioredis.Redis, status: PaymentStatus):
+        await redis.set(PAYMENT_STATUS_KEY % status.request_id, status.json(),
+                        ex=settings.PAYMENT_STATUS_CACHE_SECONDS)
+
+    def cache_status_sync(self, redis: Redis, statuses: List[PaymentStatus]):
+        with redis.pipeline(transaction=False) as pipe:
+            for status in statuses:
+                pipe.set(PAYMENT_STATUS_KEY % status.request_id, status.json(),
+                         ex=settings.PAYMENT_STATUS_CACHE_SECONDS)
+            pipe.execute()
+
+    async def publish_status(self, redis: aioredis.Redis, status: PaymentStatus):
+        """
+        Notifies the payment request's and the channel's event streams of a status change
+        """
+        data = status.dict(exclude={"user_id"})
+        await publish_event(redis, payment_topic(status.request_id), PAYMENT_STATUS_EVENT, data)
+        await publish_event(redis, channel_topic(status.channel_id), PAYMENT_STATUS_EVENT, data)
+
+    def publish_statuses_sync(self, redis: Redis, statuses: List[PaymentStatus]):
+        for status in statuses:
+            data = status.dict(exclude={"user_id"})
+            publish_event_sync(redis, payment_topic(status.request_id), PAYMENT_STATUS_EVENT, data)
+            publish_event_sync(redis, channel_topic(status.channel_id), PAYMENT_STATUS_EVENT, data)
+
+    async def get_status(self, db: AsyncSession, redis: aioredis.Redis, request_id: str) -> Optional[PaymentStatus]:
+        """
+        Payment status from the cache the worker and callback consumer keep up to date, falls back to
+        an indexed lookup on request_id
+        """
+        raw = await redis.get(PAYMENT_STATUS_KEY % request_id)
+        if raw is not None:
+            return PaymentStatus.parse_raw(raw)
+        res = await db.execute(select(PaymentRequest).where(PaymentRequest.request_id == request_id))
+        payment_request = res.scalars().first()
+        if payment_request is None:
+            return None
+        status = self.status_of(payment_request)
+        await self.cache_status(redis, status)
+        return status
+
+    # endregion
+
+    # region payment submission
+    async def enqueue_submission(self, payment_request: PaymentRequest):
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(providers.get("celery").send_task, "app.tasks.payments.submit_payment_request",
+                              args=[payment_request.id])
+        )
+
+    def claim_for_submission(self, db: Session, payment_request_id: str) -> Optional[PaymentRequest]:
+        """
+        Moves an INITIATED request to PENDING, returns None when another worker already claimed it
+        """
+        table = PaymentRequest.__table__
+        res = db.execute(
+            update(table).where(
+                table.c.id == payment_request_id,
+                table.c.request_status == PaymentRequestStatuses.INITIATED.value
+            ).values(request_status=PaymentRequestStatuses.PENDING.value, last_edited_date_utc=datetime.utcnow())
+        )
+        db.commit()
+        if res.rowcount != 1:
+            return None
+        return db.get(PaymentRequest, payment_request_id)
+
+    async def submit_to_gateway(self, payment_request: PaymentRequest,
+                                gateway: "PaymentGatewayClient") -> dict:
+        payload = payment_request.request_payload
+        if isinstance(payload, str):
+            data_in = ContributionRequest.parse_raw(payload)
+        else:
+            data_in = ContributionRequest.parse_obj(payload)
+        try:
+            result = await gateway.make_payment(request_id=payment_request.request_id, req=data_in)
+        except Exception as exc:
+            self._logger.error("Payment request %s failed: %s" % (payment_request.request_id, exc))
+            return {"request_status": PaymentRequestStatuses.FAILED.value,
+                    "payment_request_result": {"error": str(exc)}}
+        return {"request_status": result.status.value,
+                "payment_request_result": result.json(),
+                "provider_reference": result.provider_reference}
+
+    def record_submission(self, db: Session, payment_request: PaymentRequest, values: dict) -> PaymentStatus:
+        """
+        Stores the gateway result unless a callback already settled the request
+        """
+        table = PaymentRequest.__table__
+        values = dict(values, last_edited_date_utc=datetime.utcnow(), last_edited_by="SYSTEM")
+        if values["request_status"] == PaymentRequestStatuses.PENDING.value:
+            values.pop("request_status")
+        db.execute(
+            update(table).where(
+                table.c.id == payment_request.id,
+                table.c.request_status == PaymentRequestStatuses.PENDING.value
+            ).values(**values)
+        )
+        db.commit()
+        db.refresh(payment_request)
+        return self.status_of(payment_request)
+
+    # endregion
+
+    # region reconciliation
+    def open_backlog_stats(self, db: Session, now: datetime) -> Dict[str, dict]:
+        """
+        Number of open requests and the age in seconds of the oldest one, per status
+        """
+        rows = db.execute(
+            select(PaymentRequest.request_status, func.count(), func.min(PaymentRequest.created_date_utc))
+            .where(PaymentRequest.request_status.in_(OPEN_PAYMENT_STATUSES))
+            .group_by(PaymentRequest.request_status)
+        ).all()
+        stats = {status: {"count": 0, "oldest_age_seconds": 0} for status in OPEN_PAYMENT_STATUSES}
+        for status, count, oldest in rows:
+            stats[status] = {"count": count, "oldest_age_seconds": int((now - oldest).total_seconds())}
+        return stats
+
+    def record_backlog_stats(self, redis: Redis, stats: Dict[str, dict], now: datetime):
+        mapping = {"checked_at": now.isoformat()}
+        for status, values in stats.items():
+            for name, value in values.items():
+                mapping["%s_%s" % (status.lower(), name)] = value
+        redis.hset(RECONCILE_STATS_KEY, mapping=mapping)
+
+    def scan_open_requests(self, db: Session, status: str, created_before: datetime,
+                           after: Optional[Tuple[datetime, str]], limit: int) -> List[PaymentRequest]:
+        """
+        Keyset page of requests in status created before created_before, oldest first.
+        Served by the (request_status, created_date_utc) index
+        """
+        query = select(PaymentRequest).where(
+            PaymentRequest.request_status == status,
+            PaymentRequest.created_date_utc < created_before
+        )
+        if after is not None:
+            query = query.where(tuple_(PaymentRequest.created_date_utc, PaymentRequest.id) > tuple_(*after))
+        query = query.order_by(PaymentRequest.created_date_utc, PaymentRequest.id).limit(limit)
+        return list(db.execute(query).scalars())
+
+    async def query_gateway_statuses(self, payment_requests: List[PaymentRequest], gateway: "PaymentGatewayClient",
+                                     concurrency: int) -> Dict[str, Optional[dict]]:
+        """
+        Queries the provider for each request with at most concurrency calls in flight.
+        Maps request ids to the values to store, None when the outcome is still unknown
+        """
+        # only the reconcile task queries gateways, payment_lib is kept out of the API import
+        from app.providers.payment_lib import MakePaymentStatus
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def query(payment_request: PaymentRequest) -> Optional[dict]:
+            async with semaphore:
+                try:
+                    result = await gateway.query_payment_status(payment_request.payment_method,
+                                                                payment_request.provider_reference)
+                except Exception as exc:
+                    self._logger.warning("Could not query payment request %s: %s" % (payment_request.request_id, exc))
+                    return None
+            if result.status == MakePaymentStatus.PENDING:
+                return None
+            return {"request_status": result.status.value, "payment_callback_result": result.provider_data}
+
+        results = await asyncio.gather(*[query(p) for p in payment_requests])
+        return {p.id: r for p, r in zip(payment_requests, results)}
+
+    def plan_reconciliation(self, payment_requests: List[PaymentRequest], queried: Dict[str, Optional[dict]],
+                            expire_before: datetime) -> Dict[str, dict]:
+        """
+        Values to apply per request id: the provider outcome when known, otherwise requests older than
+        expire_before are failed
+        """
+        updates = {}
+        for p in payment_requests:
+            values = queried.get(p.id)
+            if values is None and p.created_date_utc < expire_before:
+                values = {"request_status": PaymentRequestStatuses.FAILED.value,
+                          "payment_callback_result": {"error": "Expired without a provider outcome"}}
+            if values is not None:
+                updates[p.id] = values
+        return updates
+
+    def apply_reconciliation(self, db: Session, updates: Dict[str, dict]) -> List[PaymentStatus]:
+        """
+        Applies reconciled outcomes with one executemany update, requests settled meanwhile are left alone
+        """
+        if not updates:
+            return []
+        table = PaymentRequest.__table__
+        now = datetime.utcnow()
+        stmt = update(table).where(
+            table.c.id == bindparam("b_id"),
+            table.c.request_status.in_(OPEN_PAYMENT_STATUSES)
+        ).values(
+            request_status=bindparam("b_status"),
+            payment_callback_result=bindparam("b_result"),
+            last_edited_date_utc=bindparam("b_edited"),
+            last_edited_by="SYSTEM"
+        )
+        db.execute(stmt, [{"b_id": row_id, "b_status": values["request_status"],
+                           "b_result": values["payment_callback_result"], "b_edited": now}
+                          for row_id, values in updates.items()])
+        db.commit()
+        updated = db.execute(select(PaymentRequest).where(PaymentRequest.id.in_(list(updates.keys())))).scalars()
+        return [self.status_of(p) for p in updated]
+
+    # endregion
+
+    async def enqueue_callback(self, redis: aioredis.Redis, callback: PaymentCallback):
+        """
+        Deduplicates a provider callback by transaction id and queues it for the batch consumer.
+        Only redis is touched so the provider gets an answer in a few milliseconds whatever the DB load
+        """
+        dedup_key = CALLBACK_DEDUP_KEY % callback.transaction_id
+        is_new = await redis.set(dedup_key, 1, nx=True, ex=CALLBACK_DEDUP_TTL_SECONDS)
+        if not is_new:
+            raise DuplicateCallbackError(callback.transaction_id)
+        try:
+            await redis.rpush(CALLBACK_QUEUE_KEY, callback.json())
+        except Exception:
+            # let the provider retry the callback
+            await redis.delete(dedup_key)
+            raise
+        if await redis.set(CALLBACK_DRAIN_SCHEDULED_KEY, 1, nx=True, ex=5):
+            # publishing to the broker is blocking, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(providers.get("celery").send_task, "app.tasks.payments.drain_payment_callbacks",
+                                  countdown=0.5)
+            )
+
+    def claim_callbacks(self, redis: Redis, batch_size: int) -> Tuple[str, List[PaymentCallback]]:
+        """
+        Moves a batch of queued callbacks to a processing list, they stay there until the batch is
+        acknowledged with ack_callbacks or put back with requeue_callbacks. Returns the batch id and the batch
+        """
+        batch_id = uuid.uuid4().hex
+        items = redis.eval(_CLAIM_CALLBACKS_SCRIPT, 3, CALLBACK_QUEUE_KEY, CALLBACK_PROCESSING_KEY % batch_id,
+                           CALLBACK_PROCESSING_INDEX_KEY, batch_size, time.time(), batch_id)
+        return batch_id, [PaymentCallback.parse_raw(item) for item in items]
+
+    def ack_callbacks(self, redis: Redis, batch_id: str):
+        with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(CALLBACK_PROCESSING_KEY % batch_id)
+            pipe.zrem(CALLBACK_PROCESSING_INDEX_KEY, batch_id)
+            pipe.execute()
+
+    def requeue_callbacks(self, redis: Redis, batch_id: str) -> int:
+        return redis.eval(_REQUEUE_CALLBACKS_SCRIPT, 3, CALLBACK_QUEUE_KEY, CALLBACK_PROCESSING_KEY % batch_id,
+                          CALLBACK_PROCESSING_INDEX_KEY, batch_id)
+
+    def requeue_stale_callbacks(self, redis: Redis) -> int:
+        """
+        Puts back the batches of workers that died before acknowledging them, returns the number of callbacks
+        """
+        stale = redis.zrangebyscore(CALLBACK_PROCESSING_INDEX_KEY, "-inf",
+                                    time.time() - CALLBACK_PROCESSING_TIMEOUT_SECONDS)
+        return sum(self.requeue_callbacks(redis, batch_id) for batch_id in stale)
+
+    def apply_callbacks(self, db: Session, callbacks: List[PaymentCallback]) -> List[PaymentStatus]:
+        """
+        Applies a batch of callbacks with one lookup and one executemany update.
+        Only requests that are still open are updated so replays never regress a final status.
+        Returns the resulting statuses of the matched requests
+        """
+        if not callbacks:
+            return []
+        references = [c.transaction_id for c in callbacks]
+        request_ids = [c.request_id for c in callbacks if c.request_id]
+        rows = db.execute(
+            select(PaymentRequest.id, PaymentRequest.provider_reference, PaymentRequest.request_id).where(
+                or_(PaymentRequest.provider_reference.in_(references), PaymentRequest.request_id.in_(request_ids))
+            )
+        ).all()
+        by_reference = {row.provider_reference: row.id for row in rows if row.provider_reference}
+        by_request_id = {row.request_id: row.id for row in rows}
+        now = datetime.utcnow()
+        params = {}
+        for c in callbacks:
+            row_id = by_reference.get(c.transaction_id) or by_request_id.get(c.request_id)
+            if row_id is None:
+                self._logger.warning("No payment request found for callback %s" % c.transaction_id)
+                continue
+            params[row_id] = {
+                "b_id": row_id,
+                "b_status": c.status,
+                "b_result": c.payload,
+                "b_reference": c.transaction_id,
+                "b_edited": now,
+            }
+        if not params:
+            return []
+        table = PaymentRequest.__table__
+        stmt = update(table).where(
+            table.c.id == bindparam("b_id"),
+            table.c.request_status.in_(OPEN_PAYMENT_STATUSES)
+        ).values(
+            request_status=bindparam("b_status"),
+            payment_callback_result=bindparam("b_result"),
+            provider_reference=bindparam("b_reference"),
+            last_edited_date_utc=bindparam("b_edited"),
+            last_edited_by="SYSTEM"
+        )
+        db.execute(stmt, list(params.values()))
+        db.commit()
+        updated = db.execute(select(PaymentRequest).where(PaymentRequest.id.in_(list(params.keys())))).scalars()
+        return [self.status_of(p) for p in updated]
+
+
+payment = PaymentService(PaymentRequest)
@@ -1,28 +1,40 @@
+import asyncio
 import datetime
+import functools
 import uuid
-from typing import Any, Dict, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import String, any_, bindparam, func, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import joinedload, selectinload
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import schemas
+from app.core.config import settings
 from app.core.security import get_password_hash_async, verify_password, create_random_code, get_password_hash
 from app.models import User, UserActivationStatus, AccountKycVerificationStatus, ServiceAccount, UserLoginInfo, \
-    AccountKycProfile, Address
-from app.providers.kyc_providers import KycProviderBase
-from app.providers.messaging_provider import SmsProvider
+    AccountKycProfile, Address, UserAccountMembership
+from app.models.accounts import phone_hash_expression
+from app.providers.registry import providers
 from app.schemas import ActivationStatuses
 from app.schemas.user import UserCreate, UserUpdate, UserAccountCreate
 from app.services.base import BaseService
 
+if TYPE_CHECKING:
+    from app.providers.kyc_providers import KycProviderBase
+
 
 class InvalidOtpError(Exception): pass
 
 
+def _edited(model):
+    # last_edited_date_utc is only set on update
+    return func.coalesce(model.last_edited_date_utc, model.created_date_utc)
+
+
 class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
     def get_by_phonenumber(self, db: Session, *, phone_number: str) -> Optional[User]:
         user = db.query(User).filter_by(username=phone_number).first()
@@ -109,7 +121,7 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
         return res.scalar()
 
     async def verify_user_kyc(self, db: AsyncSession, user: User, obj_in: UserAccountCreate,
-                              kyc_app: KycProviderBase) -> AccountKycVerificationStatus:
+                              kyc_app: "KycProviderBase") -> AccountKycVerificationStatus:
         service_account: ServiceAccount = await self.get_service_account_by_account_no(
             db=db,
             user=user
@@ -185,7 +197,7 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
         else:
             update_data = obj_in.dict(exclude_unset=True)
         if update_data["password"]:
-            hashed_password = get_password_hash_async(update_data["password"])
+            hashed_password = await get_password_hash_async(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
         return await super().update(session, db_obj=db_obj, obj_in=update_data)
@@ -207,14 +219,83 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
         service_account = account_query.scalars().first()
         return service_account
 
+    async def get_profile_version(self, db: AsyncSession, user_id: str) -> Optional[tuple]:
+        """
+        Cheap version of the /users/me payload: the user row and the accounts, kyc profiles and addresses
+        it renders, aggregated in one query. None when the user does not exist
+        """
+        stmt = select(
+            User.user_account_status,
+            _edited(User),
+            func.count(ServiceAccount.account_id),
+            func.max(_edited(ServiceAccount)),
+            func.max(_edited(AccountKycProfile)),
+            func.max(_edited(Address)),
+        ).select_from(User).outerjoin(
+            UserAccountMembership, UserAccountMembership.user_id == User.user_id
+        ).outerjoin(
+            ServiceAccount, ServiceAccount.account_id == UserAccountMembership.account_id
+        ).outerjoin(
+            AccountKycProfile, AccountKycProfile.account_id == ServiceAccount.account_id
+        ).outerjoin(
+            Address, Address.account_id == ServiceAccount.account_id
+        ).where(User.user_id == user_id).group_by(User.user_id)
+        row = (await db.execute(stmt)).first()
+        return tuple(row) if row is not None else None
+
+    async def get_kyc_version(self, db: AsyncSession, user_id: str) -> Optional[tuple]:
+        stmt = select(
+            User.user_account_status, AccountKycProfile.id, _edited(AccountKycProfile)
+        ).select_from(User).outerjoin(
+            # same as the User.account_no hybrid, which has no SQL expression
+            ServiceAccount, ServiceAccount.account_no == func.concat("IND", User.user_no)
+        ).outerjoin(
+            AccountKycProfile, AccountKycProfile.account_id == ServiceAccount.account_id
+        ).where(User.user_id == user_id).limit(1)
+        row = (await db.execute(stmt)).first()
+        return tuple(row) if row is not None else None
+
+    async def find_by_phone_numbers(self, db: AsyncSession, *, usernames: List[str], phone_hashes: List[str],
+                                    limit: int) -> list:
+        """
+        Resolves usernames and phone number hashes in one query, returns at most limit
+        (user_id, user_no, username, phone_hash) rows. Lists are bound as arrays so the statement stays
+        within the bind parameter limit
+        """
+        phone_hash = phone_hash_expression(User.username)
+        stmt = select(User.user_id, User.user_no, User.username, phone_hash.label("phone_hash")).where(
+            User.user_account_status > 1,
+            or_(
+                User.username == any_(bindparam("usernames", usernames, type_=ARRAY(String))),
+                phone_hash == any_(bindparam("phone_hashes", phone_hashes, type_=ARRAY(String)))
+            )
+        ).order_by(User.user_no).limit(limit)
+        return (await db.execute(stmt)).all()
+
     async def is_active(self, user: User) -> bool:
         return user.user_account_status > 1
 
     async def is_superuser(self, user: User) -> bool:
         return user.user_role == 10
 
-    async def send_activation_code(self, db: AsyncSession, user: User, sms_app: SmsProvider,
-                                   expiry_in_seconds: int = 10):
+    async def queue_transactional_sms(self, message: str, phone_number: str):
+        """
+        Sends through the critical celery queue, the request does not wait on the SMS provider.
+        Raises a 503 when the broker cannot be reached so the client retries instead of waiting for a code
+        """
+        from kombu.exceptions import KombuError
+        try:
+            # publishing to the broker is blocking, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(providers.get("celery").send_task, "app.tasks.messaging.send_sms",
+                                  args=[message, phone_number], expires=settings.TRANSACTIONAL_SMS_EXPIRE_SECONDS)
+            )
+        except KombuError as exc:
+            self._logger.error("Could not queue SMS to %s: %s" % (phone_number, exc))
+            raise HTTPException(status_code=503, detail="Could not send the verification code, try again later")
+
+    async def send_activation_code(self, db: AsyncSession, user: User, expiry_in_seconds: int = 10):
         activation_status = UserActivationStatus(
             user_id=user.user_id,
             expiry_time=datetime.datetime.utcnow() + datetime.timedelta(seconds=expiry_in_seconds),
@@ -224,9 +305,8 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
         db.add(activation_status)
         await db.commit()
         await db.refresh(activation_status)
-        await sms_app.send_sms_async(
-            "%s is your verification code for Changachanga" % activation_status.activation_code,
-            phone_number=user.username)
+        await self.queue_transactional_sms(
+            "%s is your verification code for Changachanga" % activation_status.activation_code, user.username)
         return user
 
     async def activate_user(self, db: AsyncSession, activation_code: int, user: User) -> Optional[UserActivationStatus]:
@@ -273,7 +353,7 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
         await db.refresh(activation_status)
         return activation_status
 
-    async def send_otp(self, db: AsyncSession, user: User, sms_app: SmsProvider):
+    async def send_otp(self, db: AsyncSession, user: User):
         otp = await create_random_code(6)
         login_info = user.login_info
         hashed_phone_verification = await get_password_hash_async(otp)
@@ -286,8 +366,8 @@ class UserManagementService(BaseService[User, UserCreate, UserUpdate]):
             raise exc
         finally:
             await db.flush()
-        await sms_app.send_sms_async("%s is your verification code for Changachanga" % otp,
-                                     phone_number=login_info.phone_number)
+        await self.queue_transactional_sms("%s is your verification code for Changachanga" % otp,
+                                           login_info.phone_number)
         return user
 
     async def verify_otp(self, db: AsyncSession, user: User, otp: str):
@@ -1,3 +1,7 @@
 from app.core.celery_app import celery_app # noqa
 
-from .worker import * # noqa
\ No newline at end of file
+from .worker import * # noqa
+from .media import * # noqa
+from .payments import * # noqa
+from .channels import * # noqa
+from .messaging import * # noqa
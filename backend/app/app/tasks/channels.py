@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, update
+
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models import Channel, ChannelInvite
+from app.providers.messaging_provider import get_sms_provider
+from app.schemas.channel import InviteStatus
+from app.services.channel_management import channel as channel_service
+
+__all__ = ['send_pending_channel_invites']
+
+logger = logging.getLogger(__name__)
+
+INVITE_BATCH_SIZE = 500
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def send_pending_channel_invites(channel_id: str) -> int:
+    """
+    Sends the SMS of every pending invite of a channel in batches and marks the delivered ones as sent.
+    Invites that fail stay pending and are picked up by the next run
+    """
+    sms_app = get_sms_provider()
+    sent = 0
+    last_id = ""
+    with SessionLocal() as db:
+        channel = db.get(Channel, channel_id)
+        if channel is None:
+            logger.warning("Channel %s not found, skipping invite delivery" % channel_id)
+            return 0
+        while True:
+            batch = db.execute(
+                select(ChannelInvite.id, ChannelInvite.phone_number, ChannelInvite.invite_code).where(
+                    ChannelInvite.channel_id == channel_id,
+                    ChannelInvite.invite_status == InviteStatus.PENDING.value,
+                    ChannelInvite.id > last_id
+                ).order_by(ChannelInvite.id).limit(INVITE_BATCH_SIZE)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            delivered = asyncio.run(channel_service.deliver_invites(
+                sms_app, channel, [tuple(row) for row in batch], settings.CHANNEL_INVITE_SMS_CONCURRENCY))
+            if delivered:
+                db.execute(
+                    update(ChannelInvite).where(ChannelInvite.id.in_(delivered))
+                    .values(invite_status=InviteStatus.SENT.value)
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+            sent += len(delivered)
+            if len(batch) < INVITE_BATCH_SIZE:
+                break
+    return sent
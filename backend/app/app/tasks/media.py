@@ -0,0 +1,102 @@
+import hashlib
+import io
+import logging
+
+from PIL import Image, ImageOps
+from sqlalchemy import select
+
+from app.core.cache import get_sync_redis
+from app.core.celery_app import celery_app
+from app.db.session import SessionLocal
+from app.models import Channel
+from app.providers.file_uploders import get_configured_uploader
+from app.services.channel_management import channel as channel_service
+
+__all__ = ['process_channel_image', 'IMAGE_VARIANTS']
+
+logger = logging.getLogger(__name__)
+
+# variant name -> (max width, max height, webp quality)
+IMAGE_VARIANTS = {
+    "thumbnail": (320, 320, 70),
+    "web": (1280, 1280, 80),
+}
+
+
+def render_variant(image: Image.Image, max_width: int, max_height: int, quality: int) -> io.BytesIO:
+    variant = image.copy()
+    variant.thumbnail((max_width, max_height), Image.LANCZOS)
+    out = io.BytesIO()
+    variant.save(out, format="WEBP", quality=quality, method=4)
+    out.seek(0)
+    return out
+
+
+def build_image_variants(uploader, content: bytes, content_hash: str) -> dict:
+    """
+    Renders every IMAGE_VARIANTS entry under a content addressed key so identical uploads share storage.
+    Variants that already exist are not rendered again
+    """
+    variants = {}
+    image = None
+    try:
+        for name, (max_width, max_height, quality) in IMAGE_VARIANTS.items():
+            key = "assets/images/variants/%s/%s.webp" % (content_hash, name)
+            if uploader.stored_file_size(key) is None:
+                if image is None:
+                    image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+                    if image.mode not in ("RGB", "RGBA"):
+                        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+                uploader.save_file(render_variant(image, max_width, max_height, quality), key,
+                                   content_type="image/webp")
+            variants[name] = uploader.get_file_url(key)
+    finally:
+        if image is not None:
+            image.close()
+    return variants
+
+
+def _is_current_image(uploader, channel: Channel, image_key: str) -> bool:
+    return channel.image_url == uploader.get_file_url(image_key)
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def process_channel_image(channel_id: str, image_key: str) -> None:
+    """
+    Renders the variants of image_key and stores them on the channel. A task queued for an image that has since
+    been replaced is a no-op, the task of the newer image writes its variants
+    """
+    uploader = get_configured_uploader()
+    if uploader is None:
+        logger.error("No file uploader configured, skipping image processing for channel %s" % channel_id)
+        return
+    with SessionLocal() as db:
+        channel = db.get(Channel, channel_id)
+        if channel is None:
+            logger.warning("Channel %s not found, skipping image processing" % channel_id)
+            return
+        if not _is_current_image(uploader, channel, image_key):
+            logger.info("Image %s of channel %s was replaced, skipping image processing" % (image_key, channel_id))
+            return
+        content = uploader.read_file(image_key)
+        content_hash = hashlib.sha256(content).hexdigest()
+        # reuse variants already rendered for an identical upload
+        existing = db.execute(
+            select(Channel.image_variants).where(
+                Channel.image_hash == content_hash,
+                Channel.image_variants.is_not(None)
+            ).limit(1)
+        ).scalar()
+        variants = existing or build_image_variants(uploader, content, content_hash)
+        # the image may have been replaced while rendering, check again under a row lock before writing
+        channel = db.get(Channel, channel_id, with_for_update=True, populate_existing=True)
+        if channel is None or not _is_current_image(uploader, channel, image_key):
+            logger.info("Image %s of channel %s was replaced, discarding its variants" % (image_key, channel_id))
+            db.rollback()
+            return
+        channel.image_hash = content_hash
+        channel.image_variants = variants
+        channel.last_edited_by = "SYSTEM"
+        db.add(channel)
+        db.commit()
+    channel_service.invalidate_channel_summary_sync(get_sync_redis(), channel_id)
@@ -0,0 +1,14 @@
+import asyncio
+
+from app.core.celery_app import celery_app
+from app.providers.messaging_provider import get_sms_provider
+
+__all__ = ['send_sms']
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def send_sms(message: str, phone_number: str) -> None:
+    """
+    Transactional SMS such as OTPs and activation codes, routed to the critical queue
+    """
+    asyncio.run(get_sms_provider().send_sms_async(message, phone_number=phone_number))
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta
+
+from app.core.cache import get_sync_redis
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.providers.payment_lib import PaymentGatewayClient, get_payment_gateway_client
+from app.schemas.payments import PaymentRequestStatuses
+from app.services.payment_management import payment, CALLBACK_DRAIN_SCHEDULED_KEY, OPEN_PAYMENT_STATUSES
+
+__all__ = ['drain_payment_callbacks', 'submit_payment_request', 'reconcile_payment_requests']
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_BATCH_SIZE = 200
+MAX_BATCHES_PER_RUN = 50
+RECONCILE_LOCK_KEY = "payments:reconcile:running"
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _run_with_gateway(gateway: PaymentGatewayClient, coro):
+    """
+    asyncio.run for gateway calls. Every run has its own event loop, the gateway's connections of that loop
+    are closed before it ends
+    """
+    async def run():
+        try:
+            return await coro
+        finally:
+            await gateway.aclose()
+
+    return asyncio.run(run())
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def submit_payment_request(payment_request_id: str) -> None:
+    """
+    Submits a persisted PaymentRequest to the payment gateway and records the outcome
+    """
+    with SessionLocal() as db:
+        payment_request = payment.claim_for_submission(db, payment_request_id)
+        if payment_request is None:
+            logger.info("Payment request %s already submitted, skipping" % payment_request_id)
+            return
+        pending = [payment.status_of(payment_request)]
+        payment.cache_status_sync(get_sync_redis(), pending)
+        payment.publish_statuses_sync(get_sync_redis(), pending)
+        gateway = get_payment_gateway_client()
+        values = _run_with_gateway(gateway, payment.submit_to_gateway(payment_request, gateway))
+        status = payment.record_submission(db, payment_request, values)
+    payment.cache_status_sync(get_sync_redis(), [status])
+    payment.publish_statuses_sync(get_sync_redis(), [status])
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def drain_payment_callbacks() -> int:
+    """
+    Applies queued payment callbacks in batches until the queue is empty
+    """
+    redis = get_sync_redis()
+    # callbacks arriving from now on schedule a new run
+    redis.delete(CALLBACK_DRAIN_SCHEDULED_KEY)
+    requeued = payment.requeue_stale_callbacks(redis)
+    if requeued:
+        logger.warning("Requeued %s payment callbacks left unacknowledged by a previous run" % requeued)
+    applied = 0
+    for _ in range(MAX_BATCHES_PER_RUN):
+        batch_id, callbacks = payment.claim_callbacks(redis, CALLBACK_BATCH_SIZE)
+        if not callbacks:
+            break
+        try:
+            with SessionLocal() as db:
+                statuses = payment.apply_callbacks(db, callbacks)
+        except Exception as exc:
+            logger.error("Failed to apply %s payment callbacks, requeueing: %s" % (len(callbacks), exc))
+            payment.requeue_callbacks(redis, batch_id)
+            raise
+        # the batch is committed, it is only dropped from redis now
+        payment.ack_callbacks(redis, batch_id)
+        payment.cache_status_sync(redis, statuses)
+        payment.publish_statuses_sync(redis, statuses)
+        applied += len(statuses)
+    return applied
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def reconcile_payment_requests() -> int:
+    """
+    Settles requests left INITIATED or PENDING, e.g. when a callback was lost.
+    Requests never handed to the gateway are queued for submission again, the others are queried at the
+    provider and failed once they are older than PAYMENT_EXPIRE_AFTER_SECONDS
+    """
+    redis = get_sync_redis()
+    # runs can outlast the beat interval, never let two overlap
+    token = secrets.token_hex(16)
+    if not redis.set(RECONCILE_LOCK_KEY, token, nx=True, ex=settings.PAYMENT_RECONCILE_LOCK_SECONDS):
+        logger.info("Payment reconciliation already running, skipping")
+        return 0
+    now = datetime.utcnow()
+    created_before = now - timedelta(seconds=settings.PAYMENT_RECONCILE_AFTER_SECONDS)
+    expire_before = now - timedelta(seconds=settings.PAYMENT_EXPIRE_AFTER_SECONDS)
+    gateway = get_payment_gateway_client()
+    reconciled = 0
+    try:
+        with SessionLocal() as db:
+            stats = payment.open_backlog_stats(db, now)
+            payment.record_backlog_stats(redis, stats, now)
+            logger.info("Open payment requests backlog %s" % stats)
+            for status in OPEN_PAYMENT_STATUSES:
+                after = None
+                while True:
+                    batch = payment.scan_open_requests(db, status, created_before, after,
+                                                       settings.PAYMENT_RECONCILE_BATCH_SIZE)
+                    if not batch:
+                        break
+                    after = (batch[-1].created_date_utc, batch[-1].id)
+                    if status == PaymentRequestStatuses.INITIATED.value:
+                        # the submission task was lost before it ran, resubmit unless the request is stale
+                        for p in batch:
+                            if p.created_date_utc >= expire_before:
+                                celery_app.send_task("app.tasks.payments.submit_payment_request", args=[p.id])
+                        queried = {}
+                    else:
+                        to_query = [p for p in batch if p.provider_reference]
+                        queried = _run_with_gateway(gateway, payment.query_gateway_statuses(
+                            to_query, gateway, settings.PAYMENT_RECONCILE_CONCURRENCY)) if to_query else {}
+                    updates = payment.plan_reconciliation(batch, queried, expire_before)
+                    statuses = payment.apply_reconciliation(db, updates)
+                    payment.cache_status_sync(redis, statuses)
+                    payment.publish_statuses_sync(redis, statuses)
+                    reconciled += len(updates)
+                    db.expunge_all()
+                    if len(batch) < settings.PAYMENT_RECONCILE_BATCH_SIZE:
+                        break
+    finally:
+        # only our own lock, after it expired another run may hold it
+        redis.eval(_RELEASE_LOCK_SCRIPT, 1, RECONCILE_LOCK_KEY, token)
+    logger.info("Reconciled %s payment requests" % reconciled)
+    return reconciled
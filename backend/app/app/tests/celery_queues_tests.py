@@ -0,0 +1,91 @@
+import io
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from kombu.exceptions import OperationalError
+
+from app.celery_worker_args import LEGACY_QUEUE, main, worker_args
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.services.user_management import user as user_service
+
+
+class TaskRoutingTests(unittest.TestCase):
+    def _queue(self, task: str) -> str:
+        route = celery_app.amqp.router.route({}, task)
+        return route["queue"].name
+
+    def test_tasks_are_routed_by_latency_class(self):
+        self.assertEqual(self._queue("app.tasks.messaging.send_sms"), "critical")
+        self.assertEqual(self._queue("app.tasks.payments.submit_payment_request"), "payments")
+        self.assertEqual(self._queue("app.tasks.channels.send_pending_channel_invites"), "bulk")
+        self.assertEqual(self._queue("app.tasks.payments.reconcile_payment_requests"), "maintenance")
+
+    def test_every_route_has_workers(self):
+        self.assertTrue(set(settings.celery.task_routes.values()) <= set(settings.CELERY_QUEUES))
+        self.assertIn(settings.celery.task_default_queue, settings.CELERY_QUEUES)
+
+
+class WorkerArgsTests(unittest.TestCase):
+    def test_worker_args_follow_the_queue_config(self):
+        args = worker_args("bulk")
+        config = settings.CELERY_QUEUES["bulk"]
+        self.assertEqual(args[:4], ["-Q", "bulk", "-n", "bulk@%h"])
+        self.assertIn(str(config.concurrency), args)
+        self.assertEqual(args[-2:], ["--max-tasks-per-child", str(config.max_tasks_per_child)])
+
+    def test_default_queue_drains_the_legacy_queue(self):
+        args = worker_args(settings.celery.task_default_queue)
+        self.assertEqual(args[1], "%s,%s" % (settings.celery.task_default_queue, LEGACY_QUEUE))
+
+    def _main(self, queues: str) -> list:
+        with patch.dict(os.environ, {"CELERY_WORKER_QUEUES": queues}), \
+                patch("sys.stdout", new_callable=io.StringIO) as out:
+            main()
+        return out.getvalue().splitlines()
+
+    def test_one_worker_per_configured_queue(self):
+        self.assertEqual(len(self._main("")), len(settings.CELERY_QUEUES))
+
+    def test_selected_queues_only(self):
+        lines = self._main("bulk, critical")
+        self.assertEqual([line.split()[1] for line in lines], ["bulk", "critical"])
+
+    def test_unknown_queue_exits(self):
+        with self.assertRaises(SystemExit):
+            self._main("bulk,nope")
+
+
+class QueueTransactionalSmsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_sms_is_published_with_an_expiry(self):
+        celery = MagicMock()
+        with patch("app.services.user_management.providers.get", return_value=celery):
+            await user_service.queue_transactional_sms("1234 is your code", "254712345678")
+        celery.send_task.assert_called_once_with("app.tasks.messaging.send_sms", args=["1234 is your code",
+                                                                                     "254712345678"],
+                                                 expires=settings.TRANSACTIONAL_SMS_EXPIRE_SECONDS)
+
+    async def test_broker_outage_is_a_503(self):
+        celery = MagicMock()
+        celery.send_task.side_effect = OperationalError("connection refused")
+        with patch("app.services.user_management.providers.get", return_value=celery):
+            with self.assertRaises(HTTPException) as ctx:
+                await user_service.queue_transactional_sms("1234 is your code", "254712345678")
+        self.assertEqual(ctx.exception.status_code, 503)
+
+    async def test_otp_is_queued_after_it_is_stored(self):
+        db = AsyncMock(add=MagicMock())
+        login_info = SimpleNamespace(phone_number="254712345678", otp_hash=None)
+        with patch.object(user_service, "queue_transactional_sms", new=AsyncMock()) as queue, \
+                patch("app.services.user_management.get_password_hash_async", new=AsyncMock(return_value="h")):
+            await user_service.send_otp(db, SimpleNamespace(login_info=login_info))
+        db.commit.assert_awaited_once()
+        self.assertEqual(login_info.otp_hash, "h")
+        self.assertEqual(queue.await_args.args[1], "254712345678")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+from collections import namedtuple
+from types import SimpleNamespace
+from typing import List
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import orjson
+from fastapi import Response
+from pydantic import parse_obj_as
+
+from app import schemas
+from app.api.api_v1.endpoints.channels import list_channels
+from app.services.channel_management import CHANNEL_FEED_KEY, CHANNEL_SUMMARY_KEY, FEED_BUILT_MARKER, \
+    decode_cursor, encode_cursor, channel as channel_service
+
+BalanceRow = namedtuple("BalanceRow", ["id", "running_balance"])
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.zsets = {}
+
+    async def exists(self, key):
+        return key in self.zsets
+
+    async def mget(self, keys):
+        return [self.values.get(k) for k in keys]
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def zrevrangebyscore(self, key, max, min, start=None, num=None, withscores=False):
+        def matches(score, bound, upper):
+            bound = str(bound)
+            if bound == "+inf":
+                return True
+            if bound.startswith("("):
+                return score < float(bound[1:]) if upper else score > float(bound[1:])
+            return score <= float(bound) if upper else score >= float(bound)
+
+        entries = sorted(((m, s) for m, s in self.zsets.get(key, {}).items()
+                          if matches(s, max, True) and matches(s, min, False)), key=lambda e: (e[1], e[0]),
+                         reverse=True)
+        if start is not None:
+            entries = entries[start:start + num]
+        return entries
+
+    def pipeline(self, transaction=True):
+        redis = self
+
+        class Pipeline:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            def set(self, key, value, ex=None):
+                redis.values[key] = value
+
+            async def execute(self):
+                pass
+
+        return Pipeline()
+
+
+def _summary(channel_id):
+    return {"channel_no": channel_id, "link": None, "code": channel_id, "video_url": None, "image_url": None,
+            "image_variants": None, "description": "", "title": channel_id, "account_no": "A1"}
+
+
+class ChannelFeedTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        # c, d and e were joined at the same time
+        scores = {"a": 50.0, "b": 40.0, "c": 30.0, "d": 30.0, "e": 30.0, "f": 20.0, FEED_BUILT_MARKER: -1}
+        self.redis.zsets[CHANNEL_FEED_KEY % "u1"] = scores
+        for channel_id in scores:
+            self.redis.values[CHANNEL_SUMMARY_KEY % channel_id] = orjson.dumps(_summary(channel_id))
+        self.db = AsyncMock()
+        self.db.execute.side_effect = lambda stmt: [BalanceRow(c, 10.0) for c in "abcdef"]
+
+    async def test_pages_do_not_skip_channels_joined_at_the_same_time(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = await channel_service.get_channel_feed(self.db, self.redis, "u1", cursor=cursor, limit=2)
+            seen += [s["channel_no"] for s in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, ["a", "b", "e", "d", "c", "f"])
+
+    async def test_balance_is_read_from_the_database(self):
+        self.db.execute.side_effect = lambda stmt: [BalanceRow("a", 99.5)]
+        page, _ = await channel_service.get_channel_feed(self.db, self.redis, "u1", limit=1)
+        self.assertEqual(page[0]["running_balance"], 99.5)
+
+    async def test_deleted_channels_are_left_out(self):
+        self.db.execute.side_effect = lambda stmt: [BalanceRow("b", 0.0)]
+        page, _ = await channel_service.get_channel_feed(self.db, self.redis, "u1", limit=2)
+        self.assertEqual([s["channel_no"] for s in page], ["b"])
+
+    async def test_cached_summary_has_no_balance(self):
+        channel = SimpleNamespace(id="a", channel_no="a", running_balance=5.0, link=None, code="a", video_url=None,
+                                  image_url=None, image_variants=None, description="", title="a", account_no="A1")
+        await channel_service.cache_channel_summary(self.redis, channel)
+        self.assertNotIn("running_balance", orjson.loads(self.redis.values[CHANNEL_SUMMARY_KEY % "a"]))
+
+    async def test_missing_summaries_are_loaded_and_cached(self):
+        del self.redis.values[CHANNEL_SUMMARY_KEY % "a"]
+        channel = SimpleNamespace(id="a", channel_no="a", running_balance=5.0, link=None, code="a", video_url=None,
+                                  image_url=None, image_variants=None, description="", title="a", account_no="A1")
+        result = MagicMock()
+        result.scalars.return_value.unique.return_value = [channel]
+        self.db.execute.side_effect = [result]
+        summaries = await channel_service.get_channel_summaries(self.db, self.redis, ["a"])
+        self.assertEqual(summaries["a"]["running_balance"], 5.0)
+        self.assertIn(CHANNEL_SUMMARY_KEY % "a", self.redis.values)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(30.0, "d")), (30.0, "d"))
+
+
+class ListChannelsTests(unittest.IsolatedAsyncioTestCase):
+    async def _list(self, fast: bool):
+        summary = {"id": "a", "channel_no": "a", "code": "a", "title": "a", "description": "", "account_no": "A1",
+                   "running_balance": 5.0}
+        response = Response()
+        endpoint = "app.api.api_v1.endpoints.channels"
+        with patch(endpoint + ".services.user.is_superuser", new=AsyncMock(return_value=False)), \
+                patch(endpoint + ".services.channel.get_channel_feed",
+                      new=AsyncMock(return_value=([summary], "next"))), \
+                patch(endpoint + ".settings.FAST_SERIALIZATION", fast):
+            result = await list_channels(response=response, db=AsyncMock(), redis=AsyncMock(), skip=0, limit=10,
+                                         cursor=None, current_user=SimpleNamespace(user_id="u1"))
+        return result, response
+
+    async def test_fast_serialization_returns_json_with_the_cursor(self):
+        result, _ = await self._list(fast=True)
+        self.assertEqual(result.headers["X-Next-Cursor"], "next")
+        self.assertEqual(orjson.loads(result.body)[0]["id"], "a")
+
+    async def test_summaries_go_through_the_response_model_otherwise(self):
+        result, response = await self._list(fast=False)
+        # a plain list is validated against response_model by FastAPI
+        self.assertEqual(parse_obj_as(List[schemas.Channel], result)[0].channel_no, "a")
+        self.assertEqual(response.headers["X-Next-Cursor"], "next")
+
+
+if __name__ == '__main__':
+    unittest.main()
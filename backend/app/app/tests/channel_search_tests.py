@@ -0,0 +1,70 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app.services.channel_management import decode_cursor, encode_cursor, _escape_like, channel as channel_service
+
+
+def _sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect()))
+
+
+class SearchChannelsTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.user = SimpleNamespace(user_id="u1")
+        self.db = AsyncMock()
+
+    def _rows(self, *rows):
+        result = MagicMock()
+        result.unique.return_value.all.return_value = [(SimpleNamespace(id=channel_id), score)
+                                                       for channel_id, score in rows]
+        self.db.execute.return_value = result
+
+    async def _search(self, query, **kwargs):
+        channels, next_cursor = await channel_service.search_channels(self.db, self.user, query, **kwargs)
+        return channels, next_cursor, _sql(self.db.execute.await_args.args[0])
+
+    async def test_full_page_returns_a_cursor_at_the_last_row(self):
+        self._rows(("a", 0.9), ("b", 0.5))
+        channels, next_cursor, _ = await self._search("harambee", limit=2)
+        self.assertEqual([c.id for c in channels], ["a", "b"])
+        self.assertEqual(decode_cursor(next_cursor), (0.5, "b"))
+
+    async def test_last_page_has_no_cursor(self):
+        self._rows(("a", 0.9))
+        _, next_cursor, _ = await self._search("harambee", limit=2)
+        self.assertIsNone(next_cursor)
+
+    async def test_cursor_continues_after_the_last_score_and_id(self):
+        self._rows()
+        _, _, sql = await self._search("harambee", limit=2, cursor=encode_cursor(0.5, "b"))
+        self.assertIn("ORDER BY score DESC, channels.id", sql)
+        self.assertRegex(sql, r"< %\(param_\d+\)s OR .* = %\(param_\d+\)s AND channels.id > %\(id_\d+\)s")
+
+    async def test_short_queries_match_prefixes_only(self):
+        self._rows()
+        _, _, sql = await self._search("ha", limit=2)
+        self.assertNotIn("similarity", sql)
+        self.assertIn("ILIKE", sql)
+
+    async def test_non_superusers_only_see_their_channels(self):
+        self._rows()
+        _, _, sql = await self._search("harambee", limit=2)
+        self.assertIn("channel_participants", sql)
+        _, _, sql = await self._search("harambee", limit=2, is_superuser=True)
+        self.assertNotIn("channel_participants", sql)
+
+    def test_like_wildcards_are_escaped(self):
+        self.assertEqual(_escape_like("50%_off\\"), "50\\%\\_off\\\\")
+
+    def test_invalid_cursor_is_a_400(self):
+        with self.assertRaises(HTTPException) as ctx:
+            decode_cursor("not-a-cursor")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
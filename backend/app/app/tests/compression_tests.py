@@ -0,0 +1,116 @@
+import gzip
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+
+from app.core import compression
+from app.core.compression import CompressionMiddleware, _accepted_encodings
+
+BODY = b'{"items": "%s"}' % (b"x" * 4096)
+
+
+def _build_app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/large")
+    async def large():
+        return Response(BODY, media_type="application/json")
+
+    @app.get("/small")
+    async def small():
+        return Response(b'{"ok": true}', media_type="application/json")
+
+    @app.get("/text")
+    async def text():
+        return PlainTextResponse("x" * 4096)
+
+    @app.get("/encoded")
+    async def encoded():
+        return Response(BODY, media_type="application/json", headers={"Content-Encoding": "identity"})
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(4):
+                yield BODY
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    return app
+
+
+class AcceptedEncodingsTests(unittest.TestCase):
+    def test_parses_quality_values(self):
+        self.assertEqual(_accepted_encodings("gzip;q=0.5, br, identity;q=0"),
+                         {"gzip": 0.5, "br": 1.0, "identity": 0.0})
+
+    def test_invalid_quality_is_refused(self):
+        self.assertEqual(_accepted_encodings("gzip;q=abc"), {"gzip": 0.0})
+
+
+class CompressionMiddlewareTests(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(_build_app())
+
+    def _get(self, path, accept_encoding):
+        # httpx decodes gzip itself, the raw body is read from the stream for the assertions
+        with self.client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+            return response, b"".join(response.iter_raw())
+
+    def test_gzip_when_accepted(self):
+        response, raw = self._get("/large", "gzip")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        self.assertEqual(int(response.headers["content-length"]), len(raw))
+        self.assertEqual(gzip.decompress(raw), BODY)
+
+    def test_identity_when_nothing_accepted(self):
+        response, raw = self._get("/large", "identity")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(raw, BODY)
+
+    def test_gzip_refused_with_zero_quality(self):
+        response, raw = self._get("/large", "gzip;q=0")
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_small_responses_are_not_compressed(self):
+        response, raw = self._get("/small", "gzip")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(raw, b'{"ok": true}')
+
+    def test_other_content_types_are_not_compressed(self):
+        response, raw = self._get("/text", "gzip")
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_encoded_responses_are_left_alone(self):
+        response, raw = self._get("/encoded", "gzip")
+        self.assertEqual(response.headers["content-encoding"], "identity")
+        self.assertEqual(raw, BODY)
+
+    def test_streamed_responses_are_compressed_without_length(self):
+        response, raw = self._get("/stream", "gzip")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(gzip.decompress(raw), BODY * 4)
+
+    def test_brotli_falls_back_to_gzip_when_unavailable(self):
+        original = compression.brotli
+        compression.brotli = None
+        try:
+            response, raw = self._get("/large", "br, gzip")
+        finally:
+            compression.brotli = original
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+
+    @unittest.skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli_preferred_when_available(self):
+        response, raw = self._get("/large", "gzip, br")
+        self.assertEqual(response.headers["content-encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(raw), BODY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+from app.api.api_v1.endpoints.channels import read_channel
+from app.api.api_v1.endpoints.users import read_user
+from app.api.conditional import is_not_modified, make_etag, not_modified_response
+
+CHANNEL_VERSION = ("channel-id", "2023-06-01 10:00:00", 3, None, None, True, 1, 2)
+
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+class ConditionalTests(unittest.TestCase):
+    def test_etag_depends_on_every_part(self):
+        self.assertEqual(make_etag("channel", 1, "a"), make_etag("channel", 1, "a"))
+        self.assertNotEqual(make_etag("channel", 1, "a"), make_etag("channel", 1, "b"))
+        self.assertTrue(make_etag("channel", 1).startswith('W/"'))
+
+    def test_weak_comparison(self):
+        etag = make_etag("user", 1)
+        self.assertTrue(is_not_modified(_request(etag), etag))
+        self.assertTrue(is_not_modified(_request(etag[2:]), etag))
+        self.assertTrue(is_not_modified(_request('W/"other", %s' % etag), etag))
+        self.assertTrue(is_not_modified(_request("*"), etag))
+        self.assertFalse(is_not_modified(_request('W/"other"'), etag))
+        self.assertFalse(is_not_modified(_request(), etag))
+
+    def test_not_modified_response_keeps_validators(self):
+        response = not_modified_response('W/"a"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], 'W/"a"')
+        self.assertEqual(response.headers["vary"], "Authorization")
+
+
+@patch("app.api.api_v1.endpoints.channels.deps.decode_access_token", new=MagicMock(return_value=MagicMock(sub="u1")))
+class ReadChannelTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unchanged_channel_is_answered_with_304(self):
+        etag = make_etag("channel", *CHANNEL_VERSION)
+        with patch("app.services.channel.get_channel_version", new=AsyncMock(return_value=CHANNEL_VERSION)), \
+                patch("app.api.api_v1.endpoints.channels.deps.get_current_user", new=AsyncMock()) as get_user:
+            response = await read_channel(channel_no="C1", request=_request(etag), response=Response(),
+                                          db=AsyncMock(), token="t")
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+        get_user.assert_not_awaited()
+
+    async def test_viewer_without_access_gets_no_304(self):
+        version = CHANNEL_VERSION[:-3] + (False, 1, 2)
+        etag = make_etag("channel", *version)
+        with patch("app.services.channel.get_channel_version", new=AsyncMock(return_value=version)), \
+                patch("app.api.api_v1.endpoints.channels.deps.get_current_user",
+                      new=AsyncMock(side_effect=HTTPException(status_code=403))):
+            with self.assertRaises(HTTPException) as ctx:
+                await read_channel(channel_no="C1", request=_request(etag), response=Response(), db=AsyncMock(),
+                                   token="t")
+        self.assertEqual(ctx.exception.status_code, 403)
+
+    async def test_missing_channel_is_404(self):
+        with patch("app.services.channel.get_channel_version", new=AsyncMock(return_value=None)):
+            with self.assertRaises(HTTPException) as ctx:
+                await read_channel(channel_no="C1", request=_request(), response=Response(), db=AsyncMock(),
+                                   token="t")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+@patch("app.api.api_v1.endpoints.users.deps.decode_access_token", new=MagicMock(return_value=MagicMock(sub="u1")))
+class ReadUserTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unchanged_profile_is_answered_with_304(self):
+        version = (2, "2023-06-01 10:00:00")
+        etag = make_etag("user", "u1", *version)
+        with patch("app.services.user.get_profile_version", new=AsyncMock(return_value=version)):
+            response = await read_user(request=_request(etag), response=Response(), db=AsyncMock(), token="t")
+        self.assertEqual(response.status_code, 304)
+
+    async def test_inactive_user_is_never_answered_with_304(self):
+        version = (1, "2023-06-01 10:00:00")
+        etag = make_etag("user", "u1", *version)
+        with patch("app.services.user.get_profile_version", new=AsyncMock(return_value=version)), \
+                patch("app.api.api_v1.endpoints.users.deps.get_current_user",
+                      new=AsyncMock(side_effect=HTTPException(status_code=400))):
+            with self.assertRaises(HTTPException):
+                await read_user(request=_request(etag), response=Response(), db=AsyncMock(), token="t")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import hashlib
+import unittest
+from collections import namedtuple
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.dialects import postgresql
+
+from app.api.api_v1.endpoints.channels import discover_channel_contacts
+from app.api.rate_limit import RateLimiter
+from app.core.contacts import hash_phone_number
+from app.models.accounts import User, phone_hash_expression
+from app.schemas.channel import ContactDiscoveryRequest
+
+UserRow = namedtuple("UserRow", ["user_id", "user_no", "username", "phone_hash"])
+
+
+class RateLimiterTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.limiter = RateLimiter("test", limit=2, window_seconds=60)
+        self.user = SimpleNamespace(user_id="u1")
+
+    async def test_requests_within_the_limit_pass(self):
+        redis = AsyncMock()
+        redis.eval.return_value = [2, 30]
+        await self.limiter(redis=redis, current_user=self.user)
+        self.assertEqual(redis.eval.await_args.args[2:], ("ratelimit:test:u1", 60))
+
+    async def test_requests_over_the_limit_are_rejected(self):
+        redis = AsyncMock()
+        redis.eval.return_value = [3, 30]
+        with self.assertRaises(HTTPException) as ctx:
+            await self.limiter(redis=redis, current_user=self.user)
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertEqual(ctx.exception.headers["Retry-After"], "30")
+
+    async def test_requests_pass_when_redis_is_down(self):
+        redis = AsyncMock()
+        redis.eval.side_effect = RedisConnectionError()
+        await self.limiter(redis=redis, current_user=self.user)
+
+
+class PhoneHashTests(unittest.TestCase):
+    def test_sql_expression_matches_the_index(self):
+        sql = str(phone_hash_expression(User.username).compile(dialect=postgresql.dialect()))
+        self.assertEqual(sql, "encode(sha256(CAST('+' || users.username AS BYTEA)), 'hex')")
+
+    def test_python_hash_is_sha256_of_the_e164_number(self):
+        self.assertEqual(hash_phone_number("+254712345678"), hashlib.sha256(b"+254712345678").hexdigest())
+
+    def test_request_hashes_are_lowercased(self):
+        digest = hash_phone_number("+254712345678")
+        self.assertEqual(ContactDiscoveryRequest(phone_hashes=[" %s " % digest.upper()]).phone_hashes, [digest])
+
+
+@patch("app.api.api_v1.endpoints.channels.settings.CONTACT_DISCOVERY_MAX_MATCHES", new=2)
+class DiscoverChannelContactsTests(unittest.IsolatedAsyncioTestCase):
+    async def _discover(self, data, rows, participants=(), invites=None):
+        channel = SimpleNamespace(id="ch-1")
+        with patch("app.services.user.find_by_phone_numbers", new=AsyncMock(return_value=rows)) as find, \
+                patch("app.services.channel.get_contact_states",
+                      new=AsyncMock(return_value=(set(participants), invites or {}))):
+            result = await discover_channel_contacts(data, db=AsyncMock(), current_user=SimpleNamespace(),
+                                                     channel=channel, _rate_limit=None)
+        return result, find
+
+    async def test_matches_echo_the_contact_as_sent(self):
+        digest = hash_phone_number("+254722000000")
+        data = ContactDiscoveryRequest(phone_numbers=["0712 345 678", "not a number"], phone_hashes=[digest])
+        rows = [UserRow("u1", "1", "254712345678", hash_phone_number("+254712345678")),
+                UserRow("u2", "2", "254722000000", digest)]
+        result, find = await self._discover(data, rows, participants={"u1"}, invites={"+254722000000": "sent"})
+        self.assertEqual(find.await_args.kwargs["usernames"], ["254712345678"])
+        self.assertEqual([(m.contact, m.is_participant, m.invite_status) for m in result.matches],
+                         [("0712 345 678", True, None), (digest, False, "sent")])
+        self.assertFalse(result.truncated)
+
+    async def test_matches_are_capped(self):
+        data = ContactDiscoveryRequest(phone_numbers=["0712345678", "0722000000", "0733000000"])
+        rows = [UserRow("u%s" % i, str(i), "2547%s" % i, "") for i in range(3)]
+        result, find = await self._discover(data, rows)
+        self.assertEqual(find.await_args.kwargs["limit"], 3)
+        self.assertEqual(len(result.matches), 2)
+        self.assertTrue(result.truncated)
+
+    async def test_nothing_valid_skips_the_lookup(self):
+        data = ContactDiscoveryRequest(phone_numbers=["12"], phone_hashes=["not-a-hash"])
+        result, find = await self._discover(data, [])
+        find.assert_not_awaited()
+        self.assertEqual(result.matches, [])
+
+    async def test_too_many_contacts_are_rejected(self):
+        data = ContactDiscoveryRequest(phone_numbers=["0712345678"] * 3)
+        with patch("app.api.api_v1.endpoints.channels.settings.CONTACT_DISCOVERY_MAX_CONTACTS", new=2):
+            with self.assertRaises(HTTPException) as ctx:
+                await self._discover(data, [])
+        self.assertEqual(ctx.exception.status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
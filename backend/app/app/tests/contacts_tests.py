@@ -0,0 +1,117 @@
+import io
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from app.core.contacts import hash_phone_number, is_phone_hash, is_vcard, iter_contact_numbers, \
+    normalize_phone_number
+from app.schemas.channel import ChannelInviteCreate
+from app.services.channel_management import INVITE_CODE_ATTEMPTS, channel as channel_service
+
+
+class NormalizePhoneNumberTests(unittest.TestCase):
+    def test_national_formats(self):
+        for raw in ("0712345678", "712345678", "254712345678", "+254712345678", "00254712345678",
+                    "+254 0712 345 678", "(0712) 345-678", "0712345678 ext. 12"):
+            self.assertEqual(normalize_phone_number(raw), "+254712345678", raw)
+
+    def test_other_countries(self):
+        self.assertEqual(normalize_phone_number("0772123456", "UG"), "+256772123456")
+        self.assertEqual(normalize_phone_number("+256772123456"), "+256772123456")
+        # countries without a rule are length checked only
+        self.assertEqual(normalize_phone_number("+14155550123"), "+14155550123")
+
+    def test_invalid_numbers(self):
+        for raw in ("", "abc", "0612345678", "+2547123", "12", None):
+            self.assertIsNone(normalize_phone_number(raw), raw)
+
+    def test_phone_hash(self):
+        digest = hash_phone_number("+254712345678")
+        self.assertTrue(is_phone_hash(digest))
+        self.assertFalse(is_phone_hash("+254712345678"))
+
+
+class ContactFileTests(unittest.TestCase):
+    def test_csv_with_header_reads_phone_columns(self):
+        data = "name,mobile,notes\nJane,0712345678,call 0700000000\n,,\nJohn,+254 722 000 000,\n"
+        rows = list(iter_contact_numbers(io.BytesIO(data.encode())))
+        self.assertEqual(rows, [(2, "0712345678"), (4, "+254 722 000 000")])
+
+    def test_csv_without_header(self):
+        data = "Jane,0712345678\n0722000000\n"
+        self.assertEqual(list(iter_contact_numbers(io.BytesIO(data.encode()))),
+                         [(1, "0712345678"), (2, "0722000000")])
+
+    def test_csv_with_byte_order_mark(self):
+        data = "\ufeffphone\n0712345678\n"
+        self.assertEqual(list(iter_contact_numbers(io.BytesIO(data.encode()))), [(2, "0712345678")])
+
+    def test_vcard(self):
+        data = ("BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Jane\r\nTEL;TYPE=CELL:+254712345678\r\n"
+                "item1.TEL:0722000000\r\nTEL;VALUE=uri:tel:+256772123456\r\nEND:VCARD\r\n")
+        self.assertEqual([number for _, number in iter_contact_numbers(io.BytesIO(data.encode()), vcard=True)],
+                         ["+254712345678", "0722000000", "+256772123456"])
+
+    def test_upload_file_is_left_open(self):
+        file = io.BytesIO(b"0712345678\n")
+        list(iter_contact_numbers(file))
+        self.assertFalse(file.closed)
+
+    def test_is_vcard(self):
+        self.assertTrue(is_vcard("contacts.VCF", None))
+        self.assertTrue(is_vcard("contacts", "text/x-vcard"))
+        self.assertFalse(is_vcard("contacts.csv", "text/csv"))
+
+
+class ChannelInviteCreateTests(unittest.TestCase):
+    def test_numbers_are_normalized_and_deduplicated(self):
+        data = ChannelInviteCreate(phone_numbers=["0712345678", "+254 712 345 678", "0722000000"])
+        self.assertEqual(data.phone_numbers, ["+254712345678", "+254722000000"])
+
+    def test_invalid_number_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            ChannelInviteCreate(phone_numbers=["0712345678", "12"])
+
+
+class InsertInvitesTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.channel = SimpleNamespace(id="ch-1", channel_no="CH1")
+        self.user = SimpleNamespace(user_id="u1")
+        self.db = AsyncMock()
+        self.db.begin_nested = MagicMock(return_value=AsyncMock())
+
+    async def test_invite_code_collision_is_retried(self):
+        self.db.execute.side_effect = [IntegrityError("insert", {}, Exception("invite_code")),
+                                       [("i1", "+254712345678")]]
+        created = await channel_service._insert_invites(self.db, self.channel, self.user, ["+254712345678"])
+        self.assertEqual(created, [("i1", "+254712345678")])
+        self.assertEqual(self.db.execute.await_count, 2)
+
+    async def test_gives_up_after_the_attempts(self):
+        self.db.execute.side_effect = IntegrityError("insert", {}, Exception("invite_code"))
+        created = await channel_service._insert_invites(self.db, self.channel, self.user, ["+254712345678"])
+        self.assertIsNone(created)
+        self.assertEqual(self.db.execute.await_count, INVITE_CODE_ATTEMPTS)
+
+    async def test_statement_skips_numbers_already_invited(self):
+        self.db.execute.return_value = []
+        await channel_service._insert_invites(self.db, self.channel, self.user, ["+254712345678"])
+        stmt = self.db.execute.await_args.args[0]
+        self.assertIn("ON CONFLICT (channel_id, phone_number) DO NOTHING",
+                      str(stmt.compile(dialect=postgresql.dialect())))
+
+
+class ScheduleInviteDeliveryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_delivery_is_published(self):
+        celery = MagicMock()
+        with patch("app.services.channel_management.providers.get", return_value=celery):
+            await channel_service.schedule_invite_delivery(SimpleNamespace(id="ch-1", channel_no="CH1"))
+        celery.send_task.assert_called_once_with("app.tasks.channels.send_pending_channel_invites", args=["ch-1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
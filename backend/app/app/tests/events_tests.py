@@ -0,0 +1,92 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.api import sse
+from app.api.sse import _event_stream, event_stream_response
+from app.core.events import EVENT_CHANNEL_PREFIX, EventHub, Subscription, compare_event_ids
+
+
+def _event(event_id, data="{}"):
+    return {"id": event_id, "event": "payment_status", "data": data}
+
+
+class FakeHub:
+    def __init__(self, events):
+        self.subscription = Subscription("payment:r1", maxsize=10)
+        for event in events:
+            self.subscription.put(event)
+        self.unsubscribed = False
+
+    def subscribe(self, topic):
+        return self.subscription
+
+    def unsubscribe(self, subscription):
+        self.unsubscribed = True
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+class CompareEventIdsTests(unittest.TestCase):
+    def test_compares_numerically(self):
+        self.assertEqual(compare_event_ids("10-0", "9-5"), 1)
+        self.assertEqual(compare_event_ids("9-5", "9-10"), -1)
+        self.assertEqual(compare_event_ids("9-5", "9-5"), 0)
+
+
+class SubscriptionTests(unittest.TestCase):
+    def test_full_queue_drops_the_oldest_event(self):
+        subscription = Subscription("payment:r1", maxsize=2)
+        for i in range(3):
+            subscription.put(_event("1-%s" % i))
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.queue.get_nowait()["id"], "1-1")
+
+
+class EventHubTests(unittest.IsolatedAsyncioTestCase):
+    async def test_dispatch_reaches_only_the_topic_listeners(self):
+        hub = EventHub(queue_size=5)
+        hub._task = MagicMock(done=MagicMock(return_value=False))
+        listener, other = hub.subscribe("payment:r1"), hub.subscribe("payment:r2")
+        hub._dispatch({"channel": EVENT_CHANNEL_PREFIX + "payment:r1", "data": json.dumps(_event("1-0"))})
+        self.assertEqual(listener.queue.qsize(), 1)
+        self.assertEqual(other.queue.qsize(), 0)
+        hub.unsubscribe(listener)
+        self.assertNotIn("payment:r1", hub._subscribers)
+
+
+class EventStreamTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.request = MagicMock()
+        # one live event is read, then the client goes away
+        self.request.is_disconnected = AsyncMock(side_effect=[False, False, True])
+        self.redis = AsyncMock()
+
+    async def test_resume_replays_the_backlog_and_skips_live_duplicates(self):
+        self.redis.xrange.return_value = [("5-0", {"event": "payment_status", "data": "{}"})]
+        hub = FakeHub([_event("5-0"), _event("6-0")])
+        chunks = await _collect(_event_stream(self.request, hub, self.redis, "payment:r1", "4-0"))
+        self.assertEqual(self.redis.xrange.await_args.kwargs["min"], "(4-0")
+        ids = [line[4:] for chunk in chunks for line in chunk.splitlines() if line.startswith("id: ")]
+        self.assertEqual(ids, ["5-0", "6-0"])
+        self.assertTrue(hub.unsubscribed)
+
+    async def test_heartbeat_while_idle(self):
+        self.request.is_disconnected = AsyncMock(side_effect=[False, True])
+        with patch.object(sse.settings, "SSE_HEARTBEAT_SECONDS", 0.01):
+            chunks = await _collect(_event_stream(self.request, FakeHub([]), self.redis, "payment:r1", None))
+        self.assertEqual(chunks[-1], ": keep-alive\n\n")
+        self.redis.xrange.assert_not_awaited()
+
+    def test_invalid_last_event_id_is_ignored(self):
+        request = MagicMock(headers={"last-event-id": "not-an-id"})
+        with patch.object(sse, "_event_stream") as stream:
+            response = event_stream_response(request, FakeHub([]), self.redis, "payment:r1")
+        self.assertIsNone(stream.call_args.args[4])
+        self.assertEqual(response.media_type, "text/event-stream")
+
+
+if __name__ == '__main__':
+    unittest.main()
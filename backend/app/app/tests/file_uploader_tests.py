@@ -0,0 +1,120 @@
+import asyncio
+import io
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app import schemas
+from app.api.api_v1.endpoints.channels import complete_media_upload
+from app.core.config import AppSettings, FileUploaders, settings
+from app.providers.file_uploders import FileTooLargeError, FileUploader, LocalFileUploader, S3FileUploader, \
+    build_object_key
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class LocalFileUploaderTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.uploader = LocalFileUploader(self.tmp.name, "http://files", "http://api/uploads", secret_key="secret")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_stream_over_limit_is_removed(self):
+        with self.assertRaises(FileTooLargeError):
+            await self.uploader.save_stream_async(_chunks(b"a" * 6, b"b" * 6), "assets/images/1/a.png", max_size=10)
+        self.assertIsNone(self.uploader.stored_file_size("assets/images/1/a.png"))
+
+    async def test_delete_file(self):
+        await self.uploader.save_stream_async(_chunks(b"abc"), "assets/images/1/a.png")
+        self.assertEqual(self.uploader.stored_file_size("assets/images/1/a.png"), 3)
+        await self.uploader.delete_file_async("assets/images/1/a.png")
+        self.assertIsNone(self.uploader.stored_file_size("assets/images/1/a.png"))
+        # deleting a missing file is not an error
+        await self.uploader.delete_file_async("assets/images/1/a.png")
+
+    def test_signature_covers_max_size(self):
+        signature = self.uploader.sign("key", 2 ** 40, 10)
+        self.assertTrue(self.uploader.verify_signature("key", 2 ** 40, 10, signature))
+        self.assertFalse(self.uploader.verify_signature("key", 2 ** 40, 11, signature))
+
+    def test_path_traversal_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.uploader.get_file_path("../outside")
+
+
+class StreamingUploadTests(unittest.IsolatedAsyncioTestCase):
+    def test_check_size_rewinds_the_file(self):
+        file = io.BytesIO(b"a" * 10)
+        file.seek(4)
+        FileUploader.check_size(file, 10)
+        self.assertEqual(file.tell(), 0)
+        with self.assertRaises(FileTooLargeError):
+            FileUploader.check_size(file, 9)
+
+    def test_object_keys_are_unique_and_keep_the_extension(self):
+        first, second = build_object_key("assets/images", "cat.PNG"), build_object_key("assets/images", "cat.PNG")
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith("assets/images/") and first.endswith(".PNG"))
+
+    async def test_oversized_file_is_not_sent(self):
+        uploader = S3FileUploader("bucket", "id", "secret", "eu-west-1")
+        uploader._client = MagicMock()
+        with self.assertRaises(FileTooLargeError):
+            await uploader.save_file_async(io.BytesIO(b"a" * 11), "assets/images/a.png", max_size=10)
+        uploader._client.upload_fileobj.assert_not_called()
+
+    async def test_uploads_run_concurrently(self):
+        # each upload waits for the other, they only finish when both run at the same time
+        barrier = threading.Barrier(2, timeout=2)
+        uploader = S3FileUploader("bucket", "id", "secret", "eu-west-1")
+        uploader._client = MagicMock()
+        uploader._client.upload_fileobj.side_effect = lambda *args, **kwargs: barrier.wait()
+        urls = await asyncio.gather(uploader.save_file_async(io.BytesIO(b"image"), "assets/images/a.png"),
+                                    uploader.save_file_async(io.BytesIO(b"video"), "assets/videos/a.mp4"))
+        self.assertEqual(urls[1], "https://bucket.s3.eu-west-1.amazonaws.com/assets/videos/a.mp4")
+
+    def test_s3_streams_the_file_object_with_the_transfer_config(self):
+        uploader = S3FileUploader("bucket", "id", "secret", "eu-west-1")
+        uploader._client = MagicMock()
+        file = io.BytesIO(b"image")
+        uploader.save_file(file, "assets/images/a.png", content_type="image/png")
+        uploader._client.upload_fileobj.assert_called_once_with(file, "bucket", "assets/images/a.png",
+                                                                ExtraArgs={"ContentType": "image/png"},
+                                                                Config=uploader.transfer_config)
+
+
+class LocalUploaderSettingsTests(unittest.TestCase):
+    def test_local_uploads_need_a_shared_secret_key(self):
+        with self.assertRaises(ValidationError):
+            AppSettings(FILE_UPLOADER=FileUploaders.LOCAL)
+
+    def test_local_uploads_with_secret_key(self):
+        app_settings = AppSettings(FILE_UPLOADER=FileUploaders.LOCAL, SECRET_KEY="shared")
+        self.assertEqual(app_settings.FILE_UPLOADER, FileUploaders.LOCAL)
+
+
+class CompleteMediaUploadTests(unittest.IsolatedAsyncioTestCase):
+    async def test_oversized_upload_is_deleted(self):
+        uploader = MagicMock()
+        uploader.get_stored_file_size = AsyncMock(return_value=settings.MAX_IMAGE_UPLOAD_BYTES + 1)
+        uploader.delete_file_async = AsyncMock()
+        user = MagicMock(user_id=1)
+        data_in = schemas.MediaUploadComplete(media_type=schemas.MediaType.IMAGE, key="assets/images/1/a.png")
+        with self.assertRaises(HTTPException) as ctx:
+            await complete_media_upload(data_in, db=AsyncMock(), channel=MagicMock(), current_user=user,
+                                        file_uploader=uploader, redis=AsyncMock())
+        self.assertEqual(ctx.exception.status_code, 413)
+        uploader.delete_file_async.assert_awaited_once_with("assets/images/1/a.png")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import gc
+import os
+import runpy
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.core.uvicorn_worker import PerformanceUvicornWorker
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn_conf.py")
+
+
+class GunicornConfTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # a preloading profile disables gc until when_ready, never leave it off for the other tests
+        self.addCleanup(gc.enable)
+
+    def _load(self, **env) -> dict:
+        env = dict(env, PROMETHEUS_MULTIPROC_DIR=self.tmp.name)
+        with patch.dict(os.environ, env), patch("builtins.print"):
+            return runpy.run_path(CONF_PATH)
+
+    def test_default_profile(self):
+        conf = self._load(GUNICORN_PROFILE="default")
+        self.assertEqual((conf["keepalive"], conf["max_requests"], conf["preload_app"]), (5, 0, False))
+        self.assertTrue(gc.isenabled())
+
+    def test_performance_profile(self):
+        conf = self._load(GUNICORN_PROFILE="performance")
+        self.assertEqual((conf["keepalive"], conf["max_requests"], conf["max_requests_jitter"]), (75, 10000, 1000))
+        self.assertTrue(conf["preload_app"])
+        self.assertFalse(gc.isenabled())
+        with patch.object(gc, "freeze") as freeze:
+            conf["when_ready"](MagicMock())
+        freeze.assert_called_once()
+        self.assertTrue(gc.isenabled())
+
+    def test_settings_override_the_profile(self):
+        conf = self._load(GUNICORN_PROFILE="performance", KEEP_ALIVE="30", MAX_REQUESTS="0", PRELOAD_APP="false")
+        self.assertEqual((conf["keepalive"], conf["max_requests"], conf["preload_app"]), (30, 0, False))
+
+    def test_stale_metric_files_are_removed_on_start(self):
+        conf = self._load()
+        stale = os.path.join(self.tmp.name, "counter_1.db")
+        open(stale, "w").close()
+        conf["on_starting"](MagicMock())
+        self.assertFalse(os.path.exists(stale))
+
+
+class PerformanceUvicornWorkerTests(unittest.TestCase):
+    def test_pins_uvloop_and_httptools(self):
+        self.assertEqual(PerformanceUvicornWorker.CONFIG_KWARGS["loop"], "uvloop")
+        self.assertEqual(PerformanceUvicornWorker.CONFIG_KWARGS["http"], "httptools")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core import health
+from app.core.health import HealthChecker, check_migrations, wait_until_ready
+
+
+def _engine_with_revisions(revisions):
+    result = MagicMock()
+    result.scalars.return_value = revisions
+    connection = AsyncMock()
+    connection.execute.return_value = result
+    context = AsyncMock()
+    context.__aenter__.return_value = connection
+    engine = MagicMock()
+    engine.connect.return_value = context
+    return engine
+
+
+class HealthCheckerTests(unittest.IsolatedAsyncioTestCase):
+    def test_unknown_checks_are_refused(self):
+        with self.assertRaises(ValueError):
+            HealthChecker(["postgres", "nope"], cache_seconds=1, timeout=1)
+
+    async def test_results_are_cached(self):
+        check = AsyncMock(return_value=None)
+        with patch.dict(health.CHECKS, {"postgres": check}):
+            checker = HealthChecker(["postgres"], cache_seconds=60, timeout=1)
+            first = await checker.run(None)
+            second = await checker.run(None)
+        self.assertTrue(first["postgres"].ok)
+        self.assertIs(first, second)
+        check.assert_awaited_once()
+
+    async def test_expired_results_are_checked_again(self):
+        check = AsyncMock(return_value=None)
+        with patch.dict(health.CHECKS, {"postgres": check}):
+            checker = HealthChecker(["postgres"], cache_seconds=0, timeout=1)
+            await checker.run(None)
+            await checker.run(None)
+        self.assertEqual(check.await_count, 2)
+
+    async def test_concurrent_callers_share_one_run(self):
+        calls = []
+
+        async def check(engine):
+            calls.append(engine)
+            await asyncio.sleep(0.01)
+
+        with patch.dict(health.CHECKS, {"redis": check}):
+            checker = HealthChecker(["redis"], cache_seconds=60, timeout=1)
+            results = await asyncio.gather(*(checker.run(None) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result["redis"].ok for result in results))
+
+    async def test_failures_and_timeouts_are_reported(self):
+        async def slow(engine):
+            await asyncio.sleep(1)
+
+        failing = AsyncMock(side_effect=ConnectionError("refused"))
+        with patch.dict(health.CHECKS, {"postgres": failing, "redis": slow}):
+            checker = HealthChecker(["postgres", "redis"], cache_seconds=0, timeout=0.01)
+            results = await checker.run(None)
+        self.assertFalse(results["postgres"].ok)
+        self.assertEqual(results["postgres"]["error"], "refused")
+        self.assertFalse(results["redis"].ok)
+        self.assertIn("timed out", results["redis"]["error"])
+
+    async def test_cancelled_caller_does_not_cancel_shared_run(self):
+        done = []
+
+        async def check(engine):
+            await asyncio.sleep(0.02)
+            done.append(True)
+
+        with patch.dict(health.CHECKS, {"broker": check}):
+            checker = HealthChecker(["broker"], cache_seconds=60, timeout=1)
+            first = asyncio.ensure_future(checker.run(None))
+            await asyncio.sleep(0)
+            first.cancel()
+            results = await checker.run(None)
+        self.assertEqual(done, [True])
+        self.assertTrue(results["broker"].ok)
+
+
+class MigrationCheckTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        revisions = patch.object(health, "_migration_revisions",
+                                 return_value=(frozenset({"b"}), frozenset({"a", "b"})))
+        revisions.start()
+        self.addCleanup(revisions.stop)
+
+    async def test_passes_at_head(self):
+        self.assertIsNone(await check_migrations(_engine_with_revisions(["b"])))
+
+    async def test_fails_behind_head(self):
+        with self.assertRaises(RuntimeError):
+            await check_migrations(_engine_with_revisions(["a"]))
+
+    async def test_fails_without_revision(self):
+        with self.assertRaisesRegex(RuntimeError, "no revision"):
+            await check_migrations(_engine_with_revisions([]))
+
+    async def test_unknown_revision_is_accepted(self):
+        detail = await check_migrations(_engine_with_revisions(["c"]))
+        self.assertEqual(detail, "database ahead at c")
+
+
+class WaitUntilReadyTests(unittest.IsolatedAsyncioTestCase):
+    async def test_polls_until_checks_pass(self):
+        check = AsyncMock(side_effect=[ConnectionError("down"), None])
+        with patch.dict(health.CHECKS, {"postgres": check}):
+            self.assertTrue(await wait_until_ready(None, ["postgres"], timeout=1, interval=0.01))
+        self.assertEqual(check.await_count, 2)
+
+    async def test_gives_up_after_timeout(self):
+        check = AsyncMock(side_effect=ConnectionError("down"))
+        with patch.dict(health.CHECKS, {"postgres": check}):
+            self.assertFalse(await wait_until_ready(None, ["postgres"], timeout=0.03, interval=0.01))
+
+
+if __name__ == "__main__":
+    unittest.main()
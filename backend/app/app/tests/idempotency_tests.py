@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi import APIRouter, FastAPI, File, Form, UploadFile
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+
+from app.api.idempotency import IDEMPOTENCY_HEADER, IdempotentAPIRoute, idempotent
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+
+
+def _build_app():
+    calls = []
+    router = APIRouter(route_class=IdempotentAPIRoute)
+
+    @router.post("/items")
+    @idempotent
+    async def create_item(item: dict):
+        calls.append(item)
+        return {"call": len(calls)}
+
+    @router.post("/uploads")
+    @idempotent
+    async def upload(name: str = Form(...), file: UploadFile = File(...)):
+        calls.append((name, await file.read()))
+        return {"call": len(calls)}
+
+    @router.post("/failing")
+    @idempotent
+    async def failing():
+        calls.append(None)
+        return JSONResponse({"detail": "down"}, status_code=503)
+
+    app = FastAPI()
+    app.include_router(router)
+    return app, calls
+
+
+class IdempotentAPIRouteTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("app.api.idempotency.get_redis", return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app, self.calls = _build_app()
+        self.client = TestClient(app)
+
+    def test_retry_is_replayed(self):
+        headers = {IDEMPOTENCY_HEADER: "k1"}
+        first = self.client.post("/items", json={"a": 1}, headers=headers)
+        second = self.client.post("/items", json={"a": 1}, headers=headers)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.headers.get("Idempotent-Replayed"), "true")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        self.client.post("/items", json={"a": 1}, headers={IDEMPOTENCY_HEADER: "k1"})
+        response = self.client.post("/items", json={"a": 2}, headers={IDEMPOTENCY_HEADER: "k1"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_keys_are_scoped_to_the_caller(self):
+        self.client.post("/items", json={"a": 1}, headers={IDEMPOTENCY_HEADER: "k1", "Authorization": "Bearer a"})
+        self.client.post("/items", json={"a": 1}, headers={IDEMPOTENCY_HEADER: "k1", "Authorization": "Bearer b"})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_without_key_every_request_runs(self):
+        self.client.post("/items", json={"a": 1})
+        self.client.post("/items", json={"a": 1})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_server_errors_are_not_stored(self):
+        self.client.post("/failing", headers={IDEMPOTENCY_HEADER: "k1"})
+        self.client.post("/failing", headers={IDEMPOTENCY_HEADER: "k1"})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_multipart_retry_is_replayed(self):
+        headers = {IDEMPOTENCY_HEADER: "k1"}
+        self.client.post("/uploads", data={"name": "a"}, files={"file": ("a.png", b"one", "image/png")},
+                         headers=headers)
+        response = self.client.post("/uploads", data={"name": "a"},
+                                    files={"file": ("a.png", b"one", "image/png")}, headers=headers)
+        self.assertEqual(response.headers.get("Idempotent-Replayed"), "true")
+        self.assertEqual(self.calls, [("a", b"one")])
+
+    def test_multipart_with_other_file_content_is_rejected(self):
+        headers = {IDEMPOTENCY_HEADER: "k1"}
+        self.client.post("/uploads", data={"name": "a"}, files={"file": ("a.png", b"one", "image/png")},
+                         headers=headers)
+        # same length, different content
+        response = self.client.post("/uploads", data={"name": "a"},
+                                    files={"file": ("a.png", b"two", "image/png")}, headers=headers)
+        self.assertEqual(response.status_code, 422)
+
+    def test_multipart_with_other_field_value_is_rejected(self):
+        headers = {IDEMPOTENCY_HEADER: "k1"}
+        self.client.post("/uploads", data={"name": "a"}, files={"file": ("a.png", b"one", "image/png")},
+                         headers=headers)
+        response = self.client.post("/uploads", data={"name": "b"},
+                                    files={"file": ("a.png", b"one", "image/png")}, headers=headers)
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from app.providers.payment_lib import KcbPaymentGatewayClient
+from app.providers.registry import ProviderRegistry
+from app.tasks.payments import _run_with_gateway
+
+
+def _client() -> KcbPaymentGatewayClient:
+    return KcbPaymentGatewayClient(client_id="id", client_secret="secret", server_host="http://localhost")
+
+
+class KcbClientConnectionTests(unittest.TestCase):
+    def test_client_is_reused_within_a_loop_and_closed_with_it(self):
+        kcb = _client()
+
+        async def run():
+            first = kcb._http_client()
+            self.assertIs(kcb._http_client(), first)
+            await kcb.aclose()
+            return first
+
+        first = asyncio.run(run())
+        self.assertTrue(first.is_closed)
+        self.assertEqual(len(kcb._clients), 0)
+
+    def test_every_loop_gets_its_own_client(self):
+        kcb = _client()
+
+        async def run():
+            try:
+                return kcb._http_client()
+            finally:
+                await kcb.aclose()
+
+        self.assertIsNot(asyncio.run(run()), asyncio.run(run()))
+
+    def test_worker_runs_close_the_gateway(self):
+        gateway = MagicMock(aclose=AsyncMock())
+        self.assertEqual(_run_with_gateway(gateway, asyncio.sleep(0, result="done")), "done")
+        gateway.aclose.assert_awaited_once()
+
+    def test_worker_runs_close_the_gateway_on_errors(self):
+        gateway = MagicMock(aclose=AsyncMock())
+
+        async def fail():
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            _run_with_gateway(gateway, fail())
+        gateway.aclose.assert_awaited_once()
+
+
+class KcbClientTokenTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.kcb = _client()
+
+    async def asyncTearDown(self):
+        await self.kcb.aclose()
+
+    async def test_token_is_cached_until_it_expires(self):
+        with patch.object(self.kcb, "_request_access_token", new=AsyncMock(return_value=("t1", 3600))) as request, \
+                patch("app.providers.payment_lib.time.monotonic", return_value=0.0):
+            self.assertEqual(await self.kcb.generate_access_token(), "t1")
+            self.assertEqual(await self.kcb.generate_access_token(), "t1")
+        self.assertEqual(request.await_count, 1)
+        with patch.object(self.kcb, "_request_access_token", new=AsyncMock(return_value=("t2", 3600))), \
+                patch("app.providers.payment_lib.time.monotonic", return_value=3600.0):
+            self.assertEqual(await self.kcb.generate_access_token(), "t2")
+
+    async def test_unauthorized_response_drops_the_token(self):
+        self.kcb._access_token = "revoked"
+        self.kcb._token_expires_at = float("inf")
+        client = MagicMock(post=AsyncMock(return_value=httpx.Response(401)))
+        with patch.object(self.kcb, "_http_client", return_value=client), \
+                patch("app.providers.retry_policy.asyncio.sleep", new=AsyncMock()), \
+                patch.object(self.kcb, "_request_access_token", new=AsyncMock(return_value=("fresh", 3600))):
+            with self.assertRaises(Exception):
+                await self.kcb.stk_push_query("ws_CO_1")
+        self.assertEqual(client.post.await_args.kwargs["headers"]["Authorization"], "Bearer fresh")
+
+
+class ProviderRegistryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_aclose_closes_created_providers(self):
+        registry = ProviderRegistry()
+        closable = MagicMock(aclose=AsyncMock(side_effect=RuntimeError()))
+        registry._instances = {"a": closable, "b": object()}
+        await registry.aclose()
+        closable.aclose.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
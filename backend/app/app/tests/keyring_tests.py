@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import jwt
+
+from app.core.config import SigningKeyConfig
+from app.core.keyring import ALGORITHM, DEFAULT_KID, ApiKeySet, Keyring, hash_api_key
+
+NOW = datetime.now(timezone.utc)
+
+
+def _secret(name: str) -> str:
+    # HS256 keys shorter than 32 bytes are flagged by PyJWT
+    return name.ljust(32, "-")
+
+
+def _payload() -> dict:
+    return {"sub": "254712345678", "exp": NOW + timedelta(minutes=5)}
+
+
+class KeyringTests(unittest.TestCase):
+    def test_tokens_carry_the_kid_of_the_newest_active_key(self):
+        keyring = Keyring({"2023-01": SigningKeyConfig(secret=_secret("old")),
+                           "2023-06": SigningKeyConfig(secret=_secret("new"), activate_at=NOW - timedelta(days=1))})
+        token = keyring.encode(_payload())
+        self.assertEqual(jwt.get_unverified_header(token)["kid"], "2023-06")
+        self.assertEqual(keyring.decode(token)["sub"], "254712345678")
+
+    def test_key_is_not_used_before_it_activates(self):
+        keyring = Keyring({"current": SigningKeyConfig(secret=_secret("current")),
+                           "next": SigningKeyConfig(secret=_secret("next"), activate_at=NOW + timedelta(days=1))})
+        self.assertEqual(keyring.active_kid(), "current")
+        # nodes that already switched are accepted
+        early = jwt.encode(_payload(), _secret("next"), algorithm=ALGORITHM, headers={"kid": "next"})
+        self.assertEqual(keyring.decode(early)["sub"], "254712345678")
+
+    def test_tokens_of_a_retired_key_are_rejected(self):
+        old = Keyring({"old": SigningKeyConfig(secret=_secret("old"))}).encode(_payload())
+        keyring = Keyring({"old": SigningKeyConfig(secret=_secret("old"), retire_at=NOW - timedelta(seconds=1)),
+                           "new": SigningKeyConfig(secret=_secret("new"))})
+        self.assertEqual(keyring.active_kid(), "new")
+        with self.assertRaises(jwt.InvalidTokenError):
+            keyring.decode(old)
+
+    def test_tokens_without_kid_verify_against_the_default_key(self):
+        keyring = Keyring({DEFAULT_KID: SigningKeyConfig(secret=_secret("legacy")), "new": SigningKeyConfig(secret=_secret("new"))})
+        legacy = jwt.encode(_payload(), _secret("legacy"), algorithm=ALGORITHM)
+        self.assertEqual(keyring.decode(legacy)["sub"], "254712345678")
+
+    def test_unknown_kid_and_forged_tokens_are_rejected(self):
+        keyring = Keyring({"a": SigningKeyConfig(secret=_secret("a"))})
+        with self.assertRaises(jwt.InvalidTokenError):
+            keyring.decode(jwt.encode(_payload(), _secret("a"), algorithm=ALGORITHM, headers={"kid": "b"}))
+        with self.assertRaises(jwt.InvalidSignatureError):
+            keyring.decode(jwt.encode(_payload(), _secret("forged"), algorithm=ALGORITHM, headers={"kid": "a"}))
+
+    def test_expired_tokens_are_rejected(self):
+        keyring = Keyring({"a": SigningKeyConfig(secret=_secret("a"))})
+        token = keyring.encode({"sub": "x", "exp": NOW - timedelta(seconds=1)})
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            keyring.decode(token)
+
+    def test_needs_an_active_key(self):
+        with self.assertRaises(ValueError):
+            Keyring({})
+        keyring = Keyring({"a": SigningKeyConfig(secret=_secret("a"), retire_at=NOW - timedelta(seconds=1))})
+        with self.assertRaises(RuntimeError):
+            keyring.encode(_payload())
+
+    def test_naive_datetimes_are_utc(self):
+        keyring = Keyring({"a": SigningKeyConfig(secret=_secret("a")),
+                           "b": SigningKeyConfig(secret=_secret("b"), activate_at=datetime.utcnow() - timedelta(minutes=1))})
+        self.assertEqual(keyring.active_kid(), "b")
+
+
+class ApiKeySetTests(unittest.TestCase):
+    def test_plain_and_hashed_keys_are_accepted(self):
+        keys = ApiKeySet.from_settings(SimpleNamespace(API_KEY="plain-1, plain-2",
+                                                       API_KEY_HASHES=[hash_api_key("hashed").upper()]))
+        for key in ("plain-1", "plain-2", "hashed"):
+            self.assertTrue(keys.validate(key), key)
+        self.assertFalse(keys.validate("other"))
+        self.assertFalse(keys.validate(""))
+        self.assertFalse(keys.validate(None))
+
+    def test_only_digests_are_kept(self):
+        keys = ApiKeySet.from_settings(SimpleNamespace(API_KEY="plain-1", API_KEY_HASHES=[]))
+        self.assertNotIn("plain-1", keys._digests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import logging
+import queue
+import sys
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import logs
+from app.core.logs import REQUEST_ID_HEADER, JsonFormatter, RequestIdMiddleware, SamplingFilter, request_id_var
+
+
+def _record(name="app.test", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord(name, level, __file__, 10, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class JsonFormatterTests(unittest.TestCase):
+    def test_fields_and_extras(self):
+        entry = json.loads(JsonFormatter().format(_record(request_id="r1", service="api", channel_no="C1")))
+        self.assertEqual(entry["message"], "hello world")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["request_id"], "r1")
+        self.assertEqual(entry["service"], "api")
+        self.assertEqual(entry["channel_no"], "C1")
+
+    def test_exceptions_are_included(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = _record(level=logging.ERROR)
+            record.exc_info = sys.exc_info()
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertIn("ValueError: boom", entry["exc_info"])
+
+
+class SamplingFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.filter = SamplingFilter({"sqlalchemy": 0.0, "sqlalchemy.pool": 1.0})
+
+    def test_sampled_logger_and_children(self):
+        self.assertFalse(self.filter.filter(_record("sqlalchemy")))
+        self.assertFalse(self.filter.filter(_record("sqlalchemy.engine")))
+        self.assertTrue(self.filter.filter(_record("sqlalchemyx")))
+
+    def test_child_rate_overrides_parent(self):
+        self.assertTrue(self.filter.filter(_record("sqlalchemy.pool.impl")))
+
+    def test_warnings_always_pass(self):
+        self.assertTrue(self.filter.filter(_record("sqlalchemy.engine", level=logging.WARNING)))
+
+    def test_partial_rate(self):
+        with patch("app.core.logs.random.random", side_effect=[0.1, 0.9]):
+            sampler = SamplingFilter({"noisy": 0.5})
+            self.assertEqual([sampler.filter(_record("noisy")) for _ in range(2)], [True, False])
+
+
+class QueueHandlerTests(unittest.TestCase):
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = logs._NonBlockingQueueHandler(queue.Queue(1))
+        handler.handle(_record())
+        handler.handle(_record())
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "hello world")
+
+
+class RequestIdMiddlewareTests(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(RequestIdMiddleware)
+
+        @app.get("/id")
+        async def current_id():
+            return {"request_id": request_id_var.get()}
+
+        self.client = TestClient(app)
+
+    def test_incoming_id_is_bound_and_echoed(self):
+        response = self.client.get("/id", headers={REQUEST_ID_HEADER: "abc"})
+        self.assertEqual(response.json()["request_id"], "abc")
+        self.assertEqual(response.headers[REQUEST_ID_HEADER], "abc")
+
+    def test_new_id_when_none_is_sent(self):
+        response = self.client.get("/id")
+        self.assertEqual(len(response.headers[REQUEST_ID_HEADER]), 32)
+        self.assertEqual(response.json()["request_id"], response.headers[REQUEST_ID_HEADER])
+        self.assertIsNone(request_id_var.get())
+
+    def test_long_ids_are_truncated(self):
+        response = self.client.get("/id", headers={REQUEST_ID_HEADER: "x" * 500})
+        self.assertEqual(len(response.headers[REQUEST_ID_HEADER]), 128)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+from app.services.channel_management import channel as channel_service
+from app.tasks import media
+from app.tasks.media import IMAGE_VARIANTS, build_image_variants, process_channel_image
+
+
+def _png(size=(640, 480)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, (200, 10, 10)).save(out, format="PNG")
+    return out.getvalue()
+
+
+class FakeUploader:
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+
+    def get_file_url(self, key):
+        return "https://files/%s" % key
+
+    def read_file(self, key):
+        return self.files[key]
+
+    def stored_file_size(self, key):
+        return len(self.files[key]) if key in self.files else None
+
+    def save_file(self, file, key, content_type=None):
+        self.files[key] = file.read()
+
+
+class BuildImageVariantsTests(unittest.TestCase):
+    def test_renders_every_variant_as_webp(self):
+        uploader = FakeUploader()
+        variants = build_image_variants(uploader, _png(), "abc")
+        self.assertEqual(set(variants), set(IMAGE_VARIANTS))
+        thumbnail = Image.open(io.BytesIO(uploader.files["assets/images/variants/abc/thumbnail.webp"]))
+        self.assertEqual(thumbnail.format, "WEBP")
+        self.assertLessEqual(max(thumbnail.size), IMAGE_VARIANTS["thumbnail"][0])
+
+    def test_existing_variants_are_not_rendered_again(self):
+        uploader = FakeUploader({"assets/images/variants/abc/%s.webp" % name: b"stored" for name in IMAGE_VARIANTS})
+        with patch.object(media, "render_variant") as render:
+            variants = build_image_variants(uploader, b"not an image", "abc")
+        render.assert_not_called()
+        self.assertEqual(variants["web"], "https://files/assets/images/variants/abc/web.webp")
+
+
+class ProcessChannelImageTests(unittest.TestCase):
+    def setUp(self):
+        self.uploader = FakeUploader({"uploads/new.png": _png()})
+        self.channel = MagicMock(image_url=self.uploader.get_file_url("uploads/new.png"))
+        self.db = MagicMock()
+        self.db.get.return_value = self.channel
+        self.db.execute.return_value.scalar.return_value = None
+        session = MagicMock()
+        session.return_value.__enter__.return_value = self.db
+        for target, value in (("get_configured_uploader", MagicMock(return_value=self.uploader)),
+                              ("SessionLocal", session),
+                              ("get_sync_redis", MagicMock()),
+                              ("channel_service", MagicMock())):
+            patcher = patch.object(media, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_writes_variants_of_the_current_image(self):
+        process_channel_image("channel-1", "uploads/new.png")
+        self.assertEqual(set(self.channel.image_variants), set(IMAGE_VARIANTS))
+        self.db.commit.assert_called_once()
+        media.channel_service.invalidate_channel_summary_sync.assert_called_once()
+
+    def test_reuses_variants_of_an_identical_upload(self):
+        self.db.execute.return_value.scalar.return_value = {"web": "shared"}
+        with patch.object(media, "build_image_variants") as build:
+            process_channel_image("channel-1", "uploads/new.png")
+        build.assert_not_called()
+        self.assertEqual(self.channel.image_variants, {"web": "shared"})
+
+    def test_stale_task_is_a_no_op(self):
+        self.uploader.files["uploads/old.png"] = _png()
+        with patch.object(media, "build_image_variants") as build:
+            process_channel_image("channel-1", "uploads/old.png")
+        build.assert_not_called()
+        self.db.commit.assert_not_called()
+        media.channel_service.invalidate_channel_summary_sync.assert_not_called()
+
+    def test_image_replaced_while_rendering_is_discarded(self):
+        replaced = MagicMock(image_url="https://files/uploads/newer.png")
+        self.db.get.side_effect = [self.channel, replaced]
+        process_channel_image("channel-1", "uploads/new.png")
+        self.db.commit.assert_not_called()
+        self.assertEqual(self.db.get.call_args.kwargs["with_for_update"], True)
+        media.channel_service.invalidate_channel_summary_sync.assert_not_called()
+
+
+class ScheduleImageProcessingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_task_is_published(self):
+        celery = MagicMock()
+        with patch("app.services.channel_management.providers.get", return_value=celery):
+            await channel_service.schedule_image_processing(SimpleNamespace(id="channel-1", channel_no="C1"),
+                                                            "uploads/new.png")
+        celery.send_task.assert_called_once_with("app.tasks.media.process_channel_image",
+                                                 args=["channel-1", "uploads/new.png"])
+
+    async def test_broker_outage_is_logged(self):
+        celery = MagicMock()
+        celery.send_task.side_effect = ConnectionError("refused")
+        with patch("app.services.channel_management.providers.get", return_value=celery):
+            with self.assertLogs(channel_service._logger, "ERROR"):
+                await channel_service.schedule_image_processing(SimpleNamespace(id="channel-1", channel_no="C1"),
+                                                                "uploads/new.png")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from app.providers.messaging_provider import AfrikasTalkingSms, BongaSmsProvider, SendSmsException, \
+    WhatsAppProvider
+
+
+def _client(post):
+    client = MagicMock()
+    client.__aenter__ = AsyncMock(return_value=MagicMock(post=post))
+    client.__aexit__ = AsyncMock(return_value=False)
+    return client
+
+
+class BongaSmsProviderTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.provider = BongaSmsProvider(client_id="id", api_key="key", secret="secret", service_id="service")
+
+    async def test_provider_error_is_not_retried(self):
+        post = AsyncMock(return_value=httpx.Response(500, text="error"))
+        with patch("app.providers.messaging_provider.httpx.AsyncClient", return_value=_client(post)):
+            with self.assertRaises(SendSmsException):
+                await self.provider.send_sms_async("1234", "254700000000")
+        self.assertEqual(post.await_count, 1)
+
+    async def test_redirect_is_a_failure(self):
+        post = AsyncMock(return_value=httpx.Response(302, text="?"))
+        with patch("app.providers.messaging_provider.httpx.AsyncClient", return_value=_client(post)):
+            with self.assertRaises(SendSmsException):
+                await self.provider.send_sms_async("1234", "254700000000")
+
+    async def test_connect_error_is_retried(self):
+        post = AsyncMock(side_effect=[httpx.ConnectError("refused"), httpx.Response(200, text="ok")])
+        with patch("app.providers.messaging_provider.httpx.AsyncClient", return_value=_client(post)), \
+                patch("app.providers.retry_policy.asyncio.sleep", new=AsyncMock()):
+            await self.provider.send_sms_async("1234", "254700000000")
+        self.assertEqual(post.await_count, 2)
+
+
+class SuccessStatusTests(unittest.IsolatedAsyncioTestCase):
+    """
+    Every provider treats 2xx as sent and anything else as a failure
+    """
+
+    def setUp(self):
+        self.providers = [
+            AfrikasTalkingSms(api_key="key", shortcode="code", username="user"),
+            WhatsAppProvider(product_id="product", phone_id="phone", token="token"),
+            BongaSmsProvider(client_id="id", api_key="key", secret="secret", service_id="service"),
+        ]
+
+    async def _send(self, provider, response):
+        post = AsyncMock(return_value=response)
+        with patch("app.providers.messaging_provider.httpx.AsyncClient", return_value=_client(post)):
+            await provider.send_sms_async("1234", "254700000000")
+
+    async def test_2xx_is_sent(self):
+        body = {"SMSMessageData": {"Message": "Sent to 1/1", "Recipients": [
+            {"statusCode": 101, "number": "+254700000000", "status": "Success", "cost": "KES 0.8",
+             "messageId": "m1"}]}}
+        for provider in self.providers:
+            for status in (200, 201, 299):
+                with self.subTest(provider=type(provider).__name__, status=status):
+                    await self._send(provider, httpx.Response(status, json=body))
+
+    async def test_other_statuses_fail(self):
+        for provider in self.providers:
+            for status in (302, 400, 500):
+                with self.subTest(provider=type(provider).__name__, status=status):
+                    with self.assertRaises(SendSmsException):
+                        await self._send(provider, httpx.Response(status, text="error"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.keyring import ApiKeySet, hash_api_key
+from app.main import app
+
+
+@unittest.skipUnless(settings.METRICS_ENABLED, "metrics are disabled")
+class MetricsEndpointTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("app.api.deps.api_keys", ApiKeySet([hash_api_key("scraper-key")]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+
+    def test_requires_the_api_key(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", headers={settings.API_KEY_NAME: "wrong"}).status_code, 403)
+
+    def test_served_with_the_api_key(self):
+        response = self.client.get("/metrics", headers={settings.API_KEY_NAME: "scraper-key"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("http_request_duration_seconds", response.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
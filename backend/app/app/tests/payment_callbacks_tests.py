@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.providers.payment_lib import parse_stk_push_callback
+from app.schemas.payments import PaymentCallback, PaymentRequestStatuses
+from app.services.payment_management import (
+    CALLBACK_PROCESSING_INDEX_KEY, CALLBACK_PROCESSING_KEY, CALLBACK_QUEUE_KEY, DuplicateCallbackError, payment
+)
+from app.tasks.payments import drain_payment_callbacks
+
+
+def _stk_callback(result_code=0):
+    return {"Body": {"stkCallback": {
+        "CheckoutRequestID": "ws_CO_1",
+        "ResultCode": result_code,
+        "CallbackMetadata": {"Item": [{"Name": "MpesaReceiptNumber", "Value": "QK123"},
+                                      {"Name": "AccountReference", "Value": "req-1"}]}
+    }}}
+
+
+def _callback(transaction_id="ws_CO_1"):
+    return PaymentCallback(transaction_id=transaction_id, request_id="req-1",
+                           status=PaymentRequestStatuses.SUCCESS, payload={})
+
+
+class ParseStkPushCallbackTests(unittest.TestCase):
+    def test_success(self):
+        callback = parse_stk_push_callback(_stk_callback())
+        self.assertEqual(callback.transaction_id, "ws_CO_1")
+        self.assertEqual(callback.request_id, "req-1")
+        self.assertEqual(callback.receipt_number, "QK123")
+        self.assertEqual(callback.status, PaymentRequestStatuses.SUCCESS.value)
+
+    def test_failure(self):
+        self.assertEqual(parse_stk_push_callback(_stk_callback(1032)).status, PaymentRequestStatuses.FAILED.value)
+
+    def test_rejects_other_payloads(self):
+        with self.assertRaises(ValueError):
+            parse_stk_push_callback({"Body": {}})
+
+
+class EnqueueCallbackTests(unittest.IsolatedAsyncioTestCase):
+    async def test_duplicate_is_rejected(self):
+        redis = AsyncMock()
+        redis.set.return_value = None
+        with self.assertRaises(DuplicateCallbackError):
+            await payment.enqueue_callback(redis, _callback())
+        redis.rpush.assert_not_awaited()
+
+    async def test_failed_push_releases_dedup_key(self):
+        redis = AsyncMock()
+        redis.set.return_value = True
+        redis.rpush.side_effect = ConnectionError()
+        with self.assertRaises(ConnectionError):
+            await payment.enqueue_callback(redis, _callback())
+        redis.delete.assert_awaited_once_with("payments:callbacks:seen:ws_CO_1")
+
+
+class ClaimCallbacksTests(unittest.TestCase):
+    def test_batch_is_moved_to_a_processing_list(self):
+        redis = MagicMock()
+        redis.eval.return_value = [_callback().json()]
+        batch_id, callbacks = payment.claim_callbacks(redis, 10)
+        self.assertEqual([c.transaction_id for c in callbacks], ["ws_CO_1"])
+        keys = redis.eval.call_args.args[2:5]
+        self.assertEqual(keys, (CALLBACK_QUEUE_KEY, CALLBACK_PROCESSING_KEY % batch_id,
+                                CALLBACK_PROCESSING_INDEX_KEY))
+
+    def test_stale_batches_are_requeued(self):
+        redis = MagicMock()
+        redis.zrangebyscore.return_value = ["a", "b"]
+        redis.eval.side_effect = [2, 3]
+        self.assertEqual(payment.requeue_stale_callbacks(redis), 5)
+        self.assertEqual([c.args[-1] for c in redis.eval.call_args_list], ["a", "b"])
+
+
+@patch("app.tasks.payments.SessionLocal", new=MagicMock())
+@patch("app.tasks.payments.get_sync_redis", new=MagicMock())
+class DrainPaymentCallbacksTests(unittest.TestCase):
+    def test_batch_is_acknowledged_after_it_is_applied(self):
+        with patch.object(payment, "requeue_stale_callbacks", return_value=0), \
+                patch.object(payment, "claim_callbacks", side_effect=[("b1", [_callback()]), ("b2", [])]), \
+                patch.object(payment, "apply_callbacks", return_value=[]) as apply, \
+                patch.object(payment, "ack_callbacks") as ack, \
+                patch.object(payment, "requeue_callbacks") as requeue:
+            drain_payment_callbacks()
+        apply.assert_called_once()
+        self.assertEqual(ack.call_args.args[1], "b1")
+        requeue.assert_not_called()
+
+    def test_batch_is_requeued_when_applying_fails(self):
+        with patch.object(payment, "requeue_stale_callbacks", return_value=0), \
+                patch.object(payment, "claim_callbacks", return_value=("b1", [_callback()])), \
+                patch.object(payment, "apply_callbacks", side_effect=RuntimeError("db down")), \
+                patch.object(payment, "ack_callbacks") as ack, \
+                patch.object(payment, "requeue_callbacks") as requeue:
+            with self.assertRaises(RuntimeError):
+                drain_payment_callbacks()
+        ack.assert_not_called()
+        self.assertEqual(requeue.call_args.args[1], "b1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.providers.payment_lib import CardPaymentResponse, MakePaymentStatus, PaymentGatewayClient
+from app.schemas.payments import PaymentMethods, PaymentRequestStatuses
+from app.services.payment_management import payment
+from app.tasks.payments import submit_payment_request
+
+CARD_REQUEST = {"amount": 100, "currency": "KES", "payment_method": "CARD",
+                "card_details": {"card_number": "4111111111111111", "card_exp_month": "12",
+                                 "card_exp_year": "2030", "card_cvv": "123"}}
+MPESA_REQUEST = {"amount": 100, "currency": "KES", "payment_method": "MPESA",
+                 "mpesa_details": {"account_number": "254700000000"}}
+
+
+def _gateway():
+    gateway = PaymentGatewayClient.__new__(PaymentGatewayClient)
+    gateway._kcb_client = AsyncMock()
+    gateway._kcb_client.stk_push_request.return_value = {"response": {"CheckoutRequestID": "ws_CO_1"}}
+    gateway._cybersource_client = AsyncMock()
+    gateway._cybersource_client.process_card_payment.return_value = CardPaymentResponse(
+        transaction_id="cs-1", status="AUTHORIZED")
+    return gateway
+
+
+@patch("app.tasks.payments.SessionLocal", new=MagicMock())
+@patch("app.tasks.payments.get_sync_redis", new=MagicMock())
+class SubmitPaymentRequestTests(unittest.TestCase):
+    def _submit(self, request_payload: dict, gateway: PaymentGatewayClient) -> dict:
+        payment_request = MagicMock(id="p-1", request_id="req-1", request_payload=json.dumps(request_payload))
+        with patch.object(payment, "claim_for_submission", return_value=payment_request), \
+                patch.object(payment, "status_of"), \
+                patch.object(payment, "cache_status_sync"), \
+                patch.object(payment, "publish_statuses_sync"), \
+                patch.object(payment, "record_submission") as record_submission, \
+                patch("app.tasks.payments.get_payment_gateway_client", return_value=gateway):
+            submit_payment_request("p-1")
+        return record_submission.call_args.args[2]
+
+    def test_card_payment_is_recorded(self):
+        gateway = _gateway()
+        values = self._submit(CARD_REQUEST, gateway)
+        gateway._cybersource_client.process_card_payment.assert_awaited_once()
+        self.assertEqual(values["request_status"], MakePaymentStatus.SUCCESS.value)
+        self.assertEqual(values["provider_reference"], "cs-1")
+
+    def test_mpesa_payment_waits_for_the_callback(self):
+        gateway = _gateway()
+        values = self._submit(MPESA_REQUEST, gateway)
+        self.assertEqual(gateway._kcb_client.stk_push_request.await_args.args[0].invoiceNumber, "req-1")
+        self.assertEqual(values["request_status"], MakePaymentStatus.PENDING.value)
+        self.assertEqual(values["provider_reference"], "ws_CO_1")
+
+    def test_gateway_error_fails_the_request(self):
+        gateway = _gateway()
+        gateway._kcb_client.stk_push_request.side_effect = RuntimeError("gateway down")
+        values = self._submit(MPESA_REQUEST, gateway)
+        self.assertEqual(values["request_status"], PaymentRequestStatuses.FAILED.value)
+
+
+class QueryPaymentStatusTests(unittest.IsolatedAsyncioTestCase):
+    async def test_stored_method_string_is_accepted(self):
+        gateway = _gateway()
+        gateway._kcb_client.stk_push_query.return_value = {"response": {"ResultCode": "0"}}
+        result = await gateway.query_payment_status("MPESA", "ws_CO_1")
+        self.assertEqual(result.status, MakePaymentStatus.SUCCESS)
+
+    async def test_enum_is_accepted(self):
+        gateway = _gateway()
+        gateway._cybersource_client.get_transaction_status.return_value = {"status": "pending"}
+        result = await gateway.query_payment_status(PaymentMethods.CARD, "cs-1")
+        self.assertEqual(result.status, MakePaymentStatus.PENDING)
+
+
+if __name__ == '__main__':
+    unittest.main()
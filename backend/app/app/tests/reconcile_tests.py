@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.config import settings
+from app.schemas.payments import PaymentRequestStatuses
+from app.services.payment_management import payment
+from app.tasks import payments as payment_tasks
+from app.tasks.payments import RECONCILE_LOCK_KEY, reconcile_payment_requests
+
+
+def _request(request_id, age_seconds, reference="ref"):
+    return SimpleNamespace(id=request_id, request_id=request_id, provider_reference=reference,
+                           created_date_utc=datetime.utcnow() - timedelta(seconds=age_seconds))
+
+
+class PlanReconciliationTests(unittest.TestCase):
+    def test_known_outcomes_are_applied(self):
+        outcome = {"request_status": PaymentRequestStatuses.SUCCESS.value, "payment_callback_result": {}}
+        updates = payment.plan_reconciliation([_request("p1", 600)], {"p1": outcome},
+                                              datetime.utcnow() - timedelta(days=1))
+        self.assertEqual(updates, {"p1": outcome})
+
+    def test_unknown_outcomes_fail_only_once_expired(self):
+        requests = [_request("fresh", 600), _request("stale", 60 * 60 * 48)]
+        updates = payment.plan_reconciliation(requests, {}, datetime.utcnow() - timedelta(days=1))
+        self.assertEqual(list(updates), ["stale"])
+        self.assertEqual(updates["stale"]["request_status"], PaymentRequestStatuses.FAILED.value)
+
+
+class ReconcilePaymentRequestsTests(unittest.TestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.redis.set.return_value = True
+        self.db = MagicMock()
+        session = MagicMock()
+        session.return_value.__enter__.return_value = self.db
+        self.celery = MagicMock()
+        self.addCleanup(patch.stopall)
+        for target, value in (("get_sync_redis", MagicMock(return_value=self.redis)),
+                              ("SessionLocal", session),
+                              ("get_payment_gateway_client", MagicMock(return_value=AsyncMock())),
+                              ("celery_app", self.celery)):
+            patch.object(payment_tasks, target, value).start()
+        for name in ("open_backlog_stats", "record_backlog_stats", "cache_status_sync", "publish_statuses_sync"):
+            patch.object(payment, name).start()
+        self.apply = patch.object(payment, "apply_reconciliation", return_value=[]).start()
+
+    def _scan(self, pages):
+        def scan(db, status, created_before, after, limit):
+            return pages[status].pop(0) if pages.get(status) else []
+        return patch.object(payment, "scan_open_requests", side_effect=scan)
+
+    def test_skips_while_another_run_holds_the_lock(self):
+        self.redis.set.return_value = None
+        with self._scan({}) as scan:
+            self.assertEqual(reconcile_payment_requests(), 0)
+        scan.assert_not_called()
+        self.redis.eval.assert_not_called()
+
+    def test_lock_outlives_the_staleness_threshold_and_is_released_by_token(self):
+        with self._scan({}):
+            reconcile_payment_requests()
+        args, kwargs = self.redis.set.call_args
+        self.assertEqual(kwargs["ex"], settings.PAYMENT_RECONCILE_LOCK_SECONDS)
+        token = args[1]
+        self.assertEqual(self.redis.eval.call_args.args[2:], (RECONCILE_LOCK_KEY, token))
+        self.redis.delete.assert_not_called()
+
+    def test_lock_is_released_when_the_run_fails(self):
+        with patch.object(payment, "scan_open_requests", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                reconcile_payment_requests()
+        self.redis.eval.assert_called_once()
+
+    def test_initiated_requests_are_resubmitted_unless_expired(self):
+        fresh = _request("fresh", 600, reference=None)
+        stale = _request("stale", 60 * 60 * 48, reference=None)
+        with self._scan({PaymentRequestStatuses.INITIATED.value: [[stale, fresh]]}):
+            reconcile_payment_requests()
+        self.celery.send_task.assert_called_once_with("app.tasks.payments.submit_payment_request", args=["fresh"])
+        self.assertEqual(list(self.apply.call_args.args[1]), ["stale"])
+
+    def test_pending_requests_are_queried_page_by_page(self):
+        pending = PaymentRequestStatuses.PENDING.value
+        first = [_request("p%s" % i, 600) for i in range(settings.PAYMENT_RECONCILE_BATCH_SIZE)]
+        second = [_request("last", 600)]
+        outcome = {"request_status": PaymentRequestStatuses.SUCCESS.value, "payment_callback_result": {}}
+        with self._scan({pending: [first, second]}) as scan, \
+                patch.object(payment, "query_gateway_statuses", new=AsyncMock(return_value={"last": outcome})):
+            self.assertEqual(reconcile_payment_requests(), 1)
+        pending_calls = [c for c in scan.call_args_list if c.args[1] == pending]
+        self.assertEqual(len(pending_calls), 2)
+        self.assertEqual(pending_calls[1].args[3], (first[-1].created_date_utc, first[-1].id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.providers.registry import ProviderRegistry
+
+created = []
+
+
+def make_provider():
+    created.append(object())
+    return created[-1]
+
+
+class ProviderRegistryTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        created.clear()
+        self.registry = ProviderRegistry()
+        self.registry.register("test", "%s:make_provider" % __name__)
+
+    def test_provider_is_created_once(self):
+        self.assertEqual(self.registry.loaded, [])
+        first = self.registry.get("test")
+        self.assertIs(self.registry.get("test"), first)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(self.registry.loaded, ["test"])
+
+    def test_concurrent_first_use_creates_one_provider(self):
+        threads = [threading.Thread(target=self.registry.get, args=("test",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+
+    def test_reset_builds_the_provider_again(self):
+        first = self.registry.get("test")
+        self.registry.reset("test")
+        self.assertIsNot(self.registry.get("test"), first)
+        self.registry.reset()
+        self.assertEqual(self.registry.loaded, [])
+
+    def test_register_replaces_a_created_provider(self):
+        first = self.registry.get("test")
+        self.registry.register("test", "%s:make_provider" % __name__)
+        self.assertIsNot(self.registry.get("test"), first)
+
+    def test_unknown_and_invalid_providers(self):
+        with self.assertRaises(LookupError):
+            self.registry.get("missing")
+        with self.assertRaises(ValueError):
+            self.registry.register("bad", "app.providers.registry.providers")
+
+    async def test_aclose_closes_providers_that_support_it(self):
+        closable = MagicMock(aclose=AsyncMock(side_effect=RuntimeError("already closed")))
+        self.registry._instances.update(closable=closable, plain=object())
+        await self.registry.aclose()
+        closable.aclose.assert_awaited_once()
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_api_boots_without_provider_modules(self):
+        code = "import sys, app.main; print([m for m in ('boto3', 'celery', 'africastalking', 'PIL') " \
+               "if m in sys.modules])"
+        app_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        out = subprocess.run([sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip().splitlines()[-1], "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
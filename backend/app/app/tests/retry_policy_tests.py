@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.providers.retry_policy import RetryPolicy, RetryBudget, DeadlineExceeded, deadline_scope
+
+
+class ProviderError(Exception): pass
+
+
+class RetryPolicyTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(name="test-provider", max_attempts=3, base_delay=0.01, max_delay=0.02,
+                                  retry_on=(ProviderError,), budget=RetryBudget(ratio=0.5, min_retries=10))
+
+    async def test_retries_until_success(self):
+        fn = AsyncMock(side_effect=[ProviderError(), ProviderError(), "ok"])
+        with patch("app.providers.retry_policy.asyncio.sleep", new=AsyncMock()) as sleep:
+            result = await self.policy.call(fn)
+        self.assertEqual(result, "ok")
+        self.assertEqual(fn.await_count, 3)
+        self.assertEqual(sleep.await_count, 2)
+        self.assertEqual(self.policy.metrics.snapshot()["retries"], 2)
+
+    async def test_does_not_retry_unlisted_errors(self):
+        fn = AsyncMock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            await self.policy.call(fn)
+        self.assertEqual(fn.await_count, 1)
+
+    async def test_budget_exhaustion_fails_fast(self):
+        policy = RetryPolicy(name="test-budget", max_attempts=5, base_delay=0.01, retry_on=(ProviderError,),
+                             budget=RetryBudget(ratio=0.0, min_retries=1))
+        fn = AsyncMock(side_effect=ProviderError())
+        with patch("app.providers.retry_policy.asyncio.sleep", new=AsyncMock()):
+            with self.assertRaises(ProviderError):
+                await policy.call(fn)
+        self.assertEqual(fn.await_count, 2)
+        self.assertEqual(policy.metrics.snapshot()["budget_exhausted"], 1)
+
+    async def test_expired_deadline_skips_call(self):
+        fn = AsyncMock(return_value="ok")
+        with deadline_scope(-1):
+            with self.assertRaises(DeadlineExceeded):
+                await self.policy.call(fn)
+        fn.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import List, Optional
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, validator
+
+from app import schemas
+from app.api.serialization import compile_serializer, fast_response
+from app.schemas import channel_users
+from app.schemas.user import UserIdentityDocuments
+
+
+def _user(n: int):
+    return SimpleNamespace(user_no=str(n), username="25470000000%s" % n, user_account_status=2, user_id="u%s" % n,
+                           date_joined_utc=datetime(2023, 6, 1, 10, n), password_hash="secret")
+
+
+def _channel(participants):
+    return SimpleNamespace(channel_no="C1", running_balance=150.5, link=None, code="ABC", video_url=None,
+                           image_url="https://files/a.png", image_variants={"thumb": "https://files/a-thumb.png"},
+                           description="Harambee", title="Fundraiser", account_no="A1", participants=participants)
+
+
+def _account(kyc_profile=None):
+    address = SimpleNamespace(country="KE", account_id="acc-1", is_deleted=False, address_line="Moi Avenue",
+                              city=None)
+    return SimpleNamespace(account_name="Jane", account_type="PERSONAL", account_id="acc-1", account_no="A1",
+                           verification_status=1, verification_status_id=None, address=address,
+                           kyc_profile=kyc_profile)
+
+
+class Row(BaseModel):
+    day: date
+    tags: List[str]
+    note: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class Validated(BaseModel):
+    name: str
+
+    class Config:
+        orm_mode = True
+
+    @validator("name")
+    def upper(cls, v):
+        return v.upper()
+
+
+class CompiledSerializerTests(unittest.TestCase):
+    def assertParity(self, schema, obj, serializer=None):
+        serializer = serializer or compile_serializer(schema)
+        expected = schema.from_orm(obj).dict(by_alias=True)
+        actual = serializer(obj)
+        self.assertEqual(actual, expected)
+        # the rendered json is what clients see
+        self.assertEqual(ORJSONResponse(actual).body, ORJSONResponse(expected).body)
+
+    def test_channel(self):
+        self.assertParity(schemas.Channel, _channel([]))
+
+    def test_channel_with_nested_participants(self):
+        participants = [SimpleNamespace(user=_user(1), is_admin=True), SimpleNamespace(user=_user(2), is_admin=False)]
+        self.assertParity(channel_users.ChannelData, _channel(participants))
+
+    def test_unknown_attributes_are_not_rendered(self):
+        self.assertNotIn("password_hash", compile_serializer(schemas.User)(_user(1)))
+
+    def test_user_account_with_nested_validated_model(self):
+        kyc = SimpleNamespace(full_name="Jane Doe", id_date_of_issue=None, id_number="12345678",
+                              id_document_type=UserIdentityDocuments.NATIONAL_ID,
+                              date_of_birth=date(1990, 1, 1), nationality="KE", gender=None)
+        user = _user(1)
+        user.accounts = [_account(kyc), None]
+        serializer = compile_serializer(schemas.UserAccount, bypass_validators=(schemas.UserAccount,))
+        self.assertParity(schemas.UserAccount, user, serializer)
+        # KycProfile declares a validator, it still masks the id number
+        self.assertEqual(serializer(user)["accounts"][0]["kyc_profile"]["id_number"], "1234XXXX")
+
+    def test_datetime_rendered_as_date_is_truncated(self):
+        self.assertParity(Row, SimpleNamespace(day=datetime(2023, 6, 1, 10, 30), tags=["a"], note=None))
+
+    def test_schema_with_validators_falls_back_to_from_orm(self):
+        self.assertEqual(compile_serializer(Validated)(SimpleNamespace(name="jane")), {"name": "JANE"})
+
+    def test_serializers_are_cached_per_schema(self):
+        self.assertIs(compile_serializer(schemas.Channel), compile_serializer(schemas.Channel))
+
+    def test_fast_response_keeps_endpoint_headers(self):
+        endpoint_response = ORJSONResponse(None)
+        endpoint_response.headers["ETag"] = 'W/"a"'
+        response = fast_response({"a": 1}, endpoint_response)
+        self.assertEqual(response.headers["etag"], 'W/"a"')
+        self.assertEqual(response.body, b'{"a":1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
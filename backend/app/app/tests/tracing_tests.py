@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch
+
+from pydantic import ValidationError
+
+from app.core.tracing import TraceSampler, _TokenBucket
+from app.schemas.tracing import TraceSamplingOverrides
+
+
+def _http(method: str, path: str) -> dict:
+    return {"asgi_scope": {"type": "http", "method": method, "path": path}}
+
+
+def _event(name: str, duration: float, status: str = "ok", method: str = "GET") -> dict:
+    return {"transaction": name, "start_timestamp": 100.0, "timestamp": 100.0 + duration,
+            "contexts": {"trace": {"status": status}}, "request": {"method": method}}
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_rate_below_one_still_traces(self):
+        with patch("app.core.tracing.time.monotonic", return_value=0.0):
+            bucket = _TokenBucket(0.5)
+            self.assertTrue(bucket.take())
+            self.assertFalse(bucket.take())
+        with patch("app.core.tracing.time.monotonic", return_value=2.0):
+            self.assertTrue(bucket.take())
+
+    def test_burst_is_capped_at_the_rate(self):
+        with patch("app.core.tracing.time.monotonic", return_value=0.0):
+            bucket = _TokenBucket(3)
+        with patch("app.core.tracing.time.monotonic", return_value=60.0):
+            self.assertEqual(sum(bucket.take() for _ in range(10)), 3)
+
+    def test_zero_rate_never_traces(self):
+        bucket = _TokenBucket(0)
+        self.assertFalse(bucket.take())
+
+
+class TraceSamplerTests(unittest.TestCase):
+    def setUp(self):
+        self.sampler = TraceSampler(default_rate=0.1, rules={"/api/v1/payments": 1.0, "/health": 0.0},
+                                    candidate_rate=0.5, slow_transaction_seconds=2.0, max_traces_per_second=100,
+                                    refresh_seconds=0)
+
+    def test_rules_match_by_longest_prefix(self):
+        self.assertEqual(self.sampler.rate_for("POST /api/v1/payments/callback"), 1.0)
+        self.assertEqual(self.sampler.rate_for("GET /health"), 0.0)
+        self.assertEqual(self.sampler.rate_for("GET /api/v1/channels"), 0.1)
+
+    def test_parent_decision_is_followed(self):
+        self.assertEqual(self.sampler({"parent_sampled": True, **_http("GET", "/health")}), 1.0)
+
+    def test_disabled_route_is_never_traced(self):
+        with patch("app.core.tracing.random.random", return_value=0.0):
+            self.assertEqual(self.sampler(_http("GET", "/health")), 0.0)
+
+    def test_candidates_are_traced_within_the_budget(self):
+        with patch("app.core.tracing.random.random", return_value=0.4):
+            self.assertEqual(self.sampler(_http("GET", "/api/v1/channels")), 1.0)
+        with patch("app.core.tracing.random.random", return_value=0.6):
+            self.assertEqual(self.sampler(_http("GET", "/api/v1/channels")), 0.0)
+
+    def test_slow_and_failed_transactions_are_kept(self):
+        with patch("app.core.tracing.random.random", return_value=0.99):
+            self.assertIsNotNone(self.sampler.before_send_transaction(_event("/api/v1/channels", 3.0), {}))
+            self.assertIsNotNone(self.sampler.before_send_transaction(
+                _event("/api/v1/channels", 0.1, status="internal_error"), {}))
+            self.assertIsNone(self.sampler.before_send_transaction(_event("/api/v1/channels", 0.1), {}))
+
+    def test_fast_transactions_are_thinned_to_the_rule_rate(self):
+        # traced at the candidate rate 0.5, kept with probability 0.1 / 0.5
+        with patch("app.core.tracing.random.random", return_value=0.19):
+            self.assertIsNotNone(self.sampler.before_send_transaction(_event("/api/v1/channels", 0.1), {}))
+        with patch("app.core.tracing.random.random", return_value=0.21):
+            self.assertIsNone(self.sampler.before_send_transaction(_event("/api/v1/channels", 0.1), {}))
+
+    def test_overrides_merge_rules_and_reset(self):
+        self.sampler.apply_overrides({"default_rate": 0.5, "rules": {"/health": 0.2}, "max_traces_per_second": 0.2})
+        self.assertEqual(self.sampler.rate_for("GET /health"), 0.2)
+        self.assertEqual(self.sampler.rate_for("POST /api/v1/payments"), 1.0)
+        self.assertEqual(self.sampler.config["max_traces_per_second"], 0.2)
+        self.sampler.apply_overrides(None)
+        self.assertEqual(self.sampler.config["default_rate"], 0.1)
+        self.assertEqual(self.sampler.config["max_traces_per_second"], 100)
+
+
+class TraceSamplingOverridesTests(unittest.TestCase):
+    def test_invalid_values_are_rejected(self):
+        for values in ({"default_rate": 1.5}, {"rules": {"/health": -0.1}}, {"max_traces_per_second": -1},
+                       {"max_traces_per_second": float("inf")}, {"slow_transaction_seconds": 0}):
+            with self.assertRaises(ValidationError, msg=values):
+                TraceSamplingOverrides(**values)
+
+    def test_fractional_trace_rate_is_accepted(self):
+        self.assertEqual(TraceSamplingOverrides(max_traces_per_second=0.1).max_traces_per_second, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core import warmup as warmup_module
+from app.core.warmup import Warmup
+
+
+class WarmupTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.addCleanup(patch.stopall)
+        patch.object(warmup_module, "get_redis", return_value=self.redis).start()
+        patch.object(warmup_module, "_open_connections", new=AsyncMock()).start()
+        patch.object(warmup_module, "_migration_revisions").start()
+        self.providers = patch.object(warmup_module, "providers").start()
+
+    async def _run(self, provider_names=(), timeout=1.0):
+        warmup = Warmup()
+        warmup.start(MagicMock(), 2, list(provider_names), timeout)
+        await asyncio.wait_for(warmup.done.wait(), 2)
+        return warmup
+
+    async def test_primes_scripts_and_migration_revisions(self):
+        warmup = await self._run()
+        self.assertTrue(warmup.ready)
+        self.assertEqual(warmup.errors, {})
+        self.assertEqual(self.redis.script_load.await_count, 3)
+        warmup_module._migration_revisions.assert_called_once()
+        self.assertEqual(set(warmup.steps), {"mappers", "database", "redis", "redis_scripts", "migrations"})
+
+    async def test_provider_warm_up_is_awaited(self):
+        provider = MagicMock(warm_up=AsyncMock())
+        self.providers.get.return_value = provider
+        warmup = await self._run(["payment_gateway"])
+        provider.warm_up.assert_awaited_once()
+        self.assertIn("provider:payment_gateway", warmup.steps)
+
+    async def test_failed_step_does_not_hold_readiness_back(self):
+        self.redis.script_load.side_effect = ConnectionError("refused")
+        warmup = await self._run()
+        self.assertTrue(warmup.ready)
+        self.assertIn("redis_scripts", warmup.errors)
+
+    async def test_timeout_marks_warm_up_done(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        self.redis.ping.side_effect = hang
+        warmup = await self._run(timeout=0.01)
+        self.assertTrue(warmup.ready)
+        self.assertIn("timeout", warmup.errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,13 @@
+import asyncio
 import random
 import re
-import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 import jwt
 
 from app.core.config import settings
+from app.core.keyring import keyring
 
 
 def snake2camel(snake: str, start_lower: bool = False) -> str:
@@ -33,6 +34,9 @@ def camel2snake(camel: str) -> str:
 
 
 async def retry_with_backoff(fn, retries=5, backoff_in_seconds=1):
+    """
+    Ad-hoc retry helper. Provider calls should use app.providers.retry_policy.RetryPolicy instead
+    """
     x = 0
     while True:
         try:
@@ -42,7 +46,7 @@ async def retry_with_backoff(fn, retries=5, backoff_in_seconds=1):
                 raise
             sleep = (backoff_in_seconds * 2 ** x +
                      random.uniform(0, 1))
-            time.sleep(sleep)
+            await asyncio.sleep(sleep)
             x += 1
 
 
@@ -51,15 +55,13 @@ def generate_password_reset_token(phone_number: str) -> str:
     now = datetime.utcnow()
     expires = now + delta
     exp = expires.timestamp()
-    encoded_jwt = jwt.encode(
-        {"exp": exp, "nbf": now, "sub": phone_number}, settings.SECRET_KEY, algorithm="HS256",
-    )
+    encoded_jwt = keyring.encode({"exp": exp, "nbf": now, "sub": phone_number})
     return encoded_jwt
 
 
 def verify_password_reset_token(token: str) -> Optional[str]:
     try:
-        decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        return decoded_token["phone_number"]
-    except jwt.JWTError:
+        decoded_token = keyring.decode(token)
+        return decoded_token["sub"]
+    except jwt.InvalidTokenError:
         return None
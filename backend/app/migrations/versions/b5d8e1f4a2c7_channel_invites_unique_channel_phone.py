@@ -0,0 +1,41 @@
+"""channel invites unique channel phone
+
+Revision ID: b5d8e1f4a2c7
+Revises: 7e2c5a9f3d14
+Create Date: 2026-10-19 18:12:45.602318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b5d8e1f4a2c7'
+down_revision = '7e2c5a9f3d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # keep one invite per channel and number, preferring accepted invites and then the oldest
+    op.execute("""
+        DELETE FROM channel_invites
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY channel_id, phone_number
+                    ORDER BY invite_status = 'accepted' DESC, created_date_utc, id
+                ) AS position
+                FROM channel_invites
+            ) ranked
+            WHERE position > 1
+        )
+    """)
+    # the unique constraint's index serves the (channel_id, phone_number) lookups
+    op.drop_index('ix_channel_invites_channel_phone', table_name='channel_invites')
+    op.create_unique_constraint('uq_channel_invites_channel_phone', 'channel_invites', ['channel_id', 'phone_number'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_channel_invites_channel_phone', 'channel_invites', type_='unique')
+    op.create_index('ix_channel_invites_channel_phone', 'channel_invites', ['channel_id', 'phone_number'],
+                    unique=False)
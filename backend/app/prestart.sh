@@ -2,11 +2,9 @@
 
 echo "Running inside /app/prestart.sh, you could add migrations to this file, e.g.:"
 
-# Let the DB start
+# Wait until the DB and redis accept connections, exits non zero after PRESTART_TIMEOUT_SECONDS
 python /app/app/backend_pre_start.py
 
-# Let the DB start
-sleep 10;
 # Run migrations
 alembic upgrade head
 # seed db
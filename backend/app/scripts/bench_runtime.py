@@ -0,0 +1,151 @@
+"""
+Compares the gunicorn profiles of app/gunicorn_conf.py: starts gunicorn with each profile, drives /health over
+keep-alive connections for a fixed time and reports throughput, latency percentiles and the memory the
+workers do not share with the master.
+
+Run from backend/app with the settings exported: PYTHONPATH=. python scripts/bench_runtime.py [--record NAME]
+The load generator shares the machine with the server, compare runs made on the same host only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HOST = "127.0.0.1"
+PORT = 8123
+PATH = "/health"
+WORKERS = 2
+CONNECTIONS = 50
+WARMUP_SECONDS = 3
+DURATION_SECONDS = 15
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_runtime_results.json")
+
+PROFILES = {
+    "default": {"GUNICORN_PROFILE": "default", "WORKER_CLASS": "uvicorn.workers.UvicornWorker"},
+    "performance": {"GUNICORN_PROFILE": "performance",
+                    "WORKER_CLASS": "app.core.uvicorn_worker.PerformanceUvicornWorker"},
+}
+
+REQUEST = ("GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n" % (PATH, HOST)).encode()
+
+
+def start_server(profile: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), WEB_CONCURRENCY=str(WORKERS), BIND="%s:%s" % (HOST, PORT),
+               ACCESS_LOG="", LOG_LEVEL="warning", SQLALCHEMY_ECHO="false", **PROFILES[profile])
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-k", env["WORKER_CLASS"], "-c",
+                               "app/gunicorn_conf.py", "app.main:app"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen("http://%s:%s%s" % (HOST, PORT, PATH), timeout=1).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("gunicorn did not start with profile %s" % profile)
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=30)
+
+
+def private_memory_kb(master_pid: int) -> int:
+    """
+    Private (unshared) memory of the workers, what preloading with gc.freeze is meant to reduce
+    """
+    out = subprocess.run(["pgrep", "-P", str(master_pid)], capture_output=True, text=True)
+    total = 0
+    for pid in out.stdout.split():
+        with open("/proc/%s/smaps_rollup" % pid) as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1])
+    return total
+
+
+async def _connection(stop_at: float, latencies: list, reconnects: list):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            writer.write(REQUEST)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # a recycled worker closes its connections, clients reconnect the same way
+            writer.close()
+            reconnects.append(time.perf_counter())
+            reader, writer = await asyncio.open_connection(HOST, PORT)
+            continue
+        latencies.append(time.perf_counter() - started)
+    writer.close()
+
+
+async def _load(seconds: float) -> tuple:
+    latencies, reconnects = [], []
+    stop_at = time.monotonic() + seconds
+    await asyncio.gather(*(_connection(stop_at, latencies, reconnects) for _ in range(CONNECTIONS)))
+    return latencies, reconnects
+
+
+def run_profile(profile: str) -> dict:
+    server = start_server(profile)
+    try:
+        asyncio.run(_load(WARMUP_SECONDS))
+        latencies, reconnects = asyncio.run(_load(DURATION_SECONDS))
+        memory = private_memory_kb(server.pid)
+    finally:
+        stop_server(server)
+    latencies.sort()
+    return {
+        "requests_per_second": round(len(latencies) / DURATION_SECONDS, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "worker_private_mb": round(memory / 1024, 1),
+        "reconnects": len(reconnects),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="store this run under NAME in %s" % os.path.basename(RESULTS_FILE))
+    args = parser.parse_args()
+
+    result = {
+        "workers": WORKERS,
+        "connections": CONNECTIONS,
+        "cpus": os.cpu_count(),
+        "python": "%s.%s" % sys.version_info[:2],
+        "date": time.strftime("%Y-%m-%d"),
+    }
+    for profile in PROFILES:
+        result[profile] = run_profile(profile)
+        print("%-12s %8.1f req/s  p50 %6.2f ms  p99 %6.2f ms  worker private memory %6.1f MB  reconnects %d" % (
+            profile, result[profile]["requests_per_second"], result[profile]["p50_ms"], result[profile]["p99_ms"],
+            result[profile]["worker_private_mb"], result[profile]["reconnects"]))
+
+    if args.record:
+        results = {}
+        if os.path.exists(RESULTS_FILE):
+            with open(RESULTS_FILE) as f:
+                results = json.load(f)
+        results[args.record] = result
+        with open(RESULTS_FILE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
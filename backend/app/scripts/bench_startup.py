@@ -0,0 +1,105 @@
+"""
+Measures API cold start: the time to import app.main and the time from interpreter start to the first
+response of /health, each in a fresh interpreter, and lists the packages that take longest to import.
+
+Run from backend/app: PYTHONPATH=. python scripts/bench_startup.py [--record NAME]
+--record stores the run in scripts/bench_startup_results.json so later runs can be compared against it.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 7
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_startup_results.json")
+
+CHILD = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+
+async def first_request():
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "path": "/health", "raw_path": b"/health",
+             "root_path": "", "scheme": "http", "query_string": b"", "headers": [], "client": ("127.0.0.1", 1),
+             "server": ("127.0.0.1", 80)}
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app.main.app(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(first_request())
+t2 = time.perf_counter()
+assert status == 200, status
+print(json.dumps({"import": t1 - t0, "first_request": t2 - t0, "modules": len(__import__("sys").modules)}))
+"""
+
+
+def run_child() -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True,
+                         env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_packages(limit: int = 10) -> list:
+    """
+    Import self time summed per top level package
+    """
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True,
+                         text=True, check=True, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    totals = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_time) / 1e6
+    return sorted(((seconds, package) for package, seconds in totals.items()), reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="store this run under NAME in %s" % os.path.basename(RESULTS_FILE))
+    args = parser.parse_args()
+
+    # the first run warms the bytecode cache
+    run_child()
+    runs = [run_child() for _ in range(RUNS)]
+    result = {
+        "import_ms": round(statistics.median(r["import"] for r in runs) * 1000, 1),
+        "first_request_ms": round(statistics.median(r["first_request"] for r in runs) * 1000, 1),
+        "modules": runs[0]["modules"],
+        "python": "%s.%s" % sys.version_info[:2],
+        "date": time.strftime("%Y-%m-%d"),
+    }
+    print("import app.main  %8.1f ms" % result["import_ms"])
+    print("first request    %8.1f ms" % result["first_request_ms"])
+    print("modules loaded   %8d" % result["modules"])
+    for seconds, name in slowest_packages():
+        print("  %8.1f ms  %s" % (seconds * 1000, name))
+
+    if args.record:
+        results = {}
+        if os.path.exists(RESULTS_FILE):
+            with open(RESULTS_FILE) as f:
+                results = json.load(f)
+        results[args.record] = result
+        with open(RESULTS_FILE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Generates keys for the settings of app/core/keyring.py.
+
+  python scripts/keys.py signing-key [--kid KID] [--activate-in-hours 24]
+      prints a SIGNING_KEYS entry to add on every node, activation is delayed so all nodes can verify
+      tokens of the new key before any node signs with it
+  python scripts/keys.py api-key
+      prints a new API key for the client and the digest to add to API_KEY_HASHES
+"""
+import argparse
+import json
+import secrets
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, ".")
+
+from app.core.keyring import hash_api_key  # noqa: E402
+
+
+def signing_key(args):
+    now = datetime.now(timezone.utc)
+    kid = args.kid or now.strftime("%Y%m%d%H%M")
+    activate_at = now + timedelta(hours=args.activate_in_hours)
+    print(json.dumps({kid: {"secret": secrets.token_urlsafe(48), "activate_at": activate_at.isoformat()}},
+                     indent=2))
+    print("Set retire_at on the previous key to at least %s plus the longest token lifetime" %
+          activate_at.isoformat(), file=sys.stderr)
+
+
+def api_key(_args):
+    key = secrets.token_urlsafe(32)
+    print("api key (give to the client, not stored):  %s" % key)
+    print("API_KEY_HASHES entry:                      %s" % hash_api_key(key))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    signing = commands.add_parser("signing-key")
+    signing.add_argument("--kid")
+    signing.add_argument("--activate-in-hours", type=float, default=24)
+    signing.set_defaults(run=signing_key)
+    commands.add_parser("api-key").set_defaults(run=api_key)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
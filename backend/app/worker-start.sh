@@ -1,6 +1,26 @@
 #! /usr/bin/env bash
 set -e
 
-python /app/app/celeryworker_pre_start.py
+# the worker's pool processes write their prometheus samples here, stale files from a previous run are dropped
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc_worker}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
-celery -A app.tasks worker -l info -Q main-queue -c 1
\ No newline at end of file
+python /app/app/celery_worker_prestart.py
+
+# one worker per queue with the queue's concurrency and prefetch, CELERY_WORKER_QUEUES=critical,payments
+# limits this container to those queues. The container stops when any worker stops
+WORKER_ARGS=$(python /app/app/celery_worker_args.py)
+if [ "$(echo "$WORKER_ARGS" | wc -l)" -eq 1 ]; then
+    eval "exec celery -A app.tasks worker -l info $WORKER_ARGS"
+fi
+
+pids=()
+while read -r args; do
+    eval "celery -A app.tasks worker -l info $args &"
+    pids+=($!)
+done <<< "$WORKER_ARGS"
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+wait -n "${pids[@]}" || status=$?
+kill -TERM "${pids[@]}" 2>/dev/null || true
+wait
+exit ${status:-0}